@@ -0,0 +1,48 @@
+import numpy as np
+
+nutrients = ["protein", "calories", "fat", "sugar", "carbs"]
+
+
+def nutrient_pivots(df, nutrient, index='Time_Category', columns='Diet_Type'):
+    # Mean, standard deviation and sample size per (time category, diet type)
+    pivot = df.pivot_table(index=index, columns=columns, values=nutrient, aggfunc='mean', observed=True)
+    std_dev = df.pivot_table(index=index, columns=columns, values=nutrient, aggfunc='std', observed=True)
+    count = df.pivot_table(index=index, columns=columns, values=nutrient, aggfunc='count', observed=True)
+    return pivot, std_dev, count
+
+
+def nutrient_correlations(df):
+    return df[nutrients].corr()
+
+
+def category_counts(df, column='Category'):
+    return df[column].value_counts()
+
+
+def _grid(frame):
+    values = frame.to_numpy(dtype=np.float64)
+    return [[None if v != v else float(v) for v in row] for row in values]
+
+
+# Payloads take a query backend (query_backends.py) rather than a frame
+
+def pivot_payload(query, nutrient):
+    pivot, std_dev, count = query.pivot(nutrient)
+    return {
+        'nutrient': nutrient,
+        'index': [str(v) for v in pivot.index],
+        'columns': [str(v) for v in pivot.columns],
+        'mean': _grid(pivot),
+        'std': _grid(std_dev.reindex_like(pivot)),
+        'count': _grid(count.reindex_like(pivot)),
+    }
+
+
+def correlation_payload(query):
+    corr = query.correlations(nutrients)
+    return {'nutrients': list(corr.columns), 'matrix': _grid(corr)}
+
+
+def category_payload(query):
+    counts = query.category_counts()
+    return {'total': int(counts.sum()), 'counts': {str(k): int(v) for k, v in counts.items()}}
@@ -0,0 +1,96 @@
+"""Read-only JSON API over the aggregates the dashboard shows.
+
+Bodies are serialized once per dataset version and cached on the dataset.
+Every response carries a strong ETag derived from the dataset fingerprint,
+so clients polling with ``If-None-Match`` get a 304 without any work.
+"""
+import hashlib
+import json
+
+from flask import Blueprint, Response, abort, request
+
+from aggregates import category_payload, correlation_payload, nutrients, pivot_payload
+from exports import FILTER_COLUMNS, iter_csv, iter_parquet
+
+API_VERSION = 1
+
+
+def data_etag(dataset, path):
+    return hashlib.sha256(f"{API_VERSION}|{dataset.fingerprint}|{path}".encode()).hexdigest()[:32]
+
+
+def create_api(datasets):
+    api = Blueprint('api', __name__, url_prefix='/api')
+
+    def dataset_or_404(name):
+        if name not in datasets.paths:
+            abort(404)
+        return datasets.get(name)
+
+    def json_response(dataset, compute):
+        etag = data_etag(dataset, request.path)
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            path = request.path
+            body = dataset.cached(('api', path), lambda: dataset.shared(
+                f"api:{path}", lambda: json.dumps(compute(dataset.query), separators=(',', ':'))))
+            response = Response(body, mimetype='application/json')
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    @api.route('/datasets')
+    def list_datasets():
+        return {'datasets': datasets.names(), 'loaded': datasets.loaded()}
+
+    @api.route('/<name>/pivots/<nutrient>')
+    def pivots(name, nutrient):
+        if nutrient not in nutrients:
+            abort(404)
+        return json_response(dataset_or_404(name), lambda query: pivot_payload(query, nutrient))
+
+    @api.route('/<name>/correlations')
+    def correlations(name):
+        return json_response(dataset_or_404(name), correlation_payload)
+
+    @api.route('/<name>/categories')
+    def categories(name):
+        return json_response(dataset_or_404(name), category_payload)
+
+    def float_arg(key):
+        value = request.args.get(key)
+        if value in (None, ''):
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            abort(400, f"{key} must be a number")
+
+    @api.route('/<name>/export.<fmt>')
+    def export(name, fmt):
+        # e.g. /api/default/export.csv?category=Healthy&diet=Vegan&calories_max=400
+        if fmt not in ('csv', 'parquet'):
+            abort(404)
+        dataset = dataset_or_404(name)
+        rows = dataset.query.filter_rows(
+            {column: request.args.getlist(param) for param, column in FILTER_COLUMNS.items()},
+            float_arg('calories_min'),
+            float_arg('calories_max')
+        )
+
+        if fmt == 'csv':
+            chunks, mimetype = iter_csv(dataset.query, rows), 'text/csv'
+        else:
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                abort(501, "Parquet export needs pyarrow installed")
+            chunks, mimetype = iter_parquet(dataset.query, rows), 'application/vnd.apache.parquet'
+
+        response = Response(chunks, mimetype=mimetype)
+        response.headers['Content-Disposition'] = f'attachment; filename="{name}-recipes.{fmt}"'
+        response.headers['X-Row-Count'] = str(len(rows))
+        return response
+
+    return api
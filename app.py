@@ -1,43 +1,171 @@
-import pandas as pd
+import time
+IMPORT_STARTED = time.perf_counter()
+
 import dash
-from dash import dcc, html, Input, Output, ALL, ctx, dash_table
-import plotly.express as px
-import numpy as np
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
+from dash import dcc, html, Input, Output, State, ALL, ctx, dash_table, Patch
+from functools import wraps
+from urllib.parse import parse_qs, urlencode
 import os
+import zlib
 
-# Load and clean data
-df = pd.read_csv("Dv_Final.csv")
-df.columns = df.columns.str.strip()
-
-# Compute health score
-df['Health_Score'] = (
-    (df['protein'] / df['calories']) * 100 -
-    (df['sugar'] / df['calories']) * 50 -
-    (df['fat'] / df['calories']) * 30
+from api import create_api
+from binning import BIN_SCHEMES
+from datasets import DatasetRegistry
+from figure_encoding import encode_trace
+from layout_cache import LayoutCache
+from recipe_data import CATEGORY_THRESHOLDS, DEFAULT_DATASET, HEALTH_WEIGHTS, settings_key
+from recipe_visualizations import (
+    COMPARISON_COLUMNS, STATIC_FIGURES, comparison_rows, recipe_annotation, recipe_details, selection_overlay
 )
+from session_store import new_session_key
+from snapshots import heatmap_name, render_snapshot
+from startup import Warmup, create_health
+
+# Datasets load on first use; the default one is warmed in the background
+datasets = DatasetRegistry()
+
+# Most recipes highlighted and compared at once
+MAX_COMPARE = 5000
+# Rows per page of a heat map cell's recipe list
+DRILLDOWN_PAGE_SIZE = 20
+
+# Layout figures that only change with the dataset
+DATASET_FIGURES = [name for name in STATIC_FIGURES
+                   if name not in ('scatter-plot', 'health-rating-bar', 'health-rating-scatter')]
+
+
+def warm_figures():
+    # The figures the first page load asks for
+    dataset = datasets.get(DEFAULT_DATASET)
+    for name in DATASET_FIGURES + ['scatter-plot', 'health-rating-bar', 'health-rating-scatter',
+                                   heatmap_name('protein')]:
+        dataset.snapshots.get(name)
+
+
+warmup = Warmup([('load_s', lambda: datasets.get(DEFAULT_DATASET)), ('figures_s', warm_figures),
+                 ('cube_s', lambda: datasets.get(DEFAULT_DATASET).snapshots.cube),
+                 ('layout_s', lambda: layout_cache.payload())],
+                IMPORT_STARTED)
+
+weight_labels = {'protein': "Protein weight", 'sugar': "Sugar weight", 'fat': "Fat weight"}
+threshold_labels = {
+    'calories': "Calorie threshold",
+    'healthy': "Healthy score (min)",
+    'unhealthy': "Unhealthy score (max)"
+}
+
+
+def health_settings_key(settings):
+    settings = settings or {}
+    return settings_key(settings.get('weights'), settings.get('thresholds'))
+
+
+def number_control(kind, name, label, value):
+    return html.Div([
+        html.Label(label, style={'display': 'block', 'fontSize': '13px'}),
+        dcc.Input(
+            id={'type': kind, 'index': name},
+            type='number',
+            value=value,
+            debounce=True,
+            style={'width': '110px'}
+        )
+    ])
+
+
+def axis_range(relayout, axis):
+    # Zoomed range of one axis from relayoutData, or None for the full extent
+    if f'{axis}.range[0]' in relayout:
+        return [relayout[f'{axis}.range[0]'], relayout[f'{axis}.range[1]']]
+    return relayout.get(f'{axis}.range')
+
+
+def selection_token(dataset, session, selected):
+    # Keep the selection server-side; the browser gets a token that changes with it
+    if not session:
+        return None
+    dataset.save_rows(session, 'selection', selected)
+    return f"{dataset.name}:{len(selected)}:{zlib.crc32(selected.index.to_numpy().tobytes()):08x}"
+
 
-df = df[(df['calories'] < 2000) & (df['Health_Score'] > -100) & (df['Health_Score'] < 100)]
+def hovered_recipe(dataset, key, data):
+    # The recipe under a hoverData/clickData point: by its point id, or by
+    # name on the selection overlay, which carries names instead
+    if not data or not data.get('points'):
+        return None
+    point = data['points'][0]
+    ids = point.get('customdata')
+    if ids is not None:
+        return dataset.record(key, int(ids[0] if isinstance(ids, list) else ids))
+    if point.get('text'):
+        selected = dataset.lookup(key, [point['text']])
+        return selected.iloc[0] if len(selected) else None
+    return None
 
-# Limit to first 10,000 unique names for sidebar list
-MAX_RECIPES = 10000
-sidebar_names = df['name'].drop_duplicates().head(MAX_RECIPES)
 
-def classify(row):
-    if row['calories'] <= 200 and row['Health_Score'] >= 7:
-        return 'Healthy'
-    elif row['calories'] > 200 and row['Health_Score'] <= 4:
-        return 'Unhealthy'
-    else:
-        return 'Moderate'
+def recipe_detail_panel(dataset, key, hover, click):
+    # The latest click wins over hovering; a new dataset starts empty
+    if ctx.triggered_id == 'dataset-dropdown':
+        return DETAIL_PLACEHOLDER
+    clicked = any(prop.endswith('.clickData') for prop in ctx.triggered_prop_ids)
+    recipe = hovered_recipe(dataset, key, click if clicked or not hover else hover)
+    if recipe is None:
+        return DETAIL_PLACEHOLDER
+    return recipe_details(recipe, dataset.recipe_ranks(key, recipe))
 
-df['Category'] = df.apply(classify, axis=1)
+
+def reset_viewport_patch(fig):
+    # Zoomed back out: the sampled points return, any overlay trace stays
+    patch = Patch()
+    for i, trace in enumerate(fig['data']):
+        for prop in ('x', 'y', 'customdata'):
+            patch['data'][i][prop] = trace.get(prop)
+    patch['layout']['xaxis']['autorange'] = True
+    patch['layout']['yaxis']['autorange'] = True
+    return patch
+
+
+def viewport_patch(dataset, fig, key, relayout):
+    x_range, y_range = axis_range(relayout, 'xaxis'), axis_range(relayout, 'yaxis')
+    window = dataset.explorer_window(key, x_range, y_range)
+    patch = Patch()
+    empty = {'x': [], 'y': [], 'customdata': []}
+    for i, trace in enumerate(fig['data']):
+        # One marker trace per health category, keyed by its legend group
+        points = window.get(trace.get('legendgroup'), empty)
+        for prop in ('x', 'y', 'customdata'):
+            patch['data'][i][prop] = points[prop]
+    # Pin the zoomed ranges so the new data does not autorange the view
+    for axis, window_range in (('xaxis', x_range), ('yaxis', y_range)):
+        if window_range is not None:
+            patch['layout'][axis]['range'] = window_range
+            patch['layout'][axis]['autorange'] = False
+    return patch
 
 # Dash app initialization
 app = dash.Dash(__name__)
 server = app.server  # Add this line for deployment
 app.title = "Recipe Health Dashboard"
+server.register_blueprint(create_api(datasets))
+server.register_blueprint(create_health(warmup))
+# /_dash-layout is serialized and compressed once, not per page load
+layout_cache = LayoutCache(app)
+layout_cache.install()
+
+
+def dataset_callback(outputs, inputs, **kwargs):
+    # Every dataset-dependent callback also listens to the dataset selector
+    # and receives the resolved RecipeDataset in place of its name
+    def decorator(func):
+        @wraps(func)
+        def callback(dataset, *args):
+            return func(datasets.get(dataset), *args)
+        return app.callback(outputs, [Input('dataset-dropdown', 'value')] + list(inputs), **kwargs)(callback)
+    return decorator
+
+DETAIL_PLACEHOLDER = "Hover over or click a point to see the recipe"
+DETAIL_STYLE = {'padding': '10px 15px', 'marginTop': '10px', 'backgroundColor': '#f8f9fa',
+                'borderRadius': '5px', 'minHeight': '60px'}
 
 nutrient_options = [
     {"label": "All", "value": "all"},
@@ -47,6 +175,22 @@ nutrient_options = [
     {"label": "Sugar", "value": "sugar"},
     {"label": "Carbs", "value": "carbs"}
 ]
+statistic_options = [
+    {"label": "Mean", "value": "mean"},
+    {"label": "Median", "value": "median"},
+    {"label": "10th Percentile", "value": "p10"},
+    {"label": "90th Percentile", "value": "p90"},
+    {"label": "Interquartile Range", "value": "iqr"}
+]
+def bin_scheme_options(names):
+    return [{"label": "From dataset" if name == 'dataset' else name.replace('_', ' ').title(), "value": name}
+            for name in names]
+row_options = [
+    {"label": "Preparation Time", "value": "Time_Category"},
+    {"label": "Rating Category", "value": "Rating_Category"},
+    {"label": "Diet Type", "value": "Diet_Type"},
+    {"label": "Health Category", "value": "Category"}
+]
 group_options = [
     {"label": "Diet Type", "value": "Diet_Type"},
     {"label": "Health Category", "value": "Category"},
@@ -56,6 +200,31 @@ group_options = [
 # Layout
 app.layout = html.Div([
     html.H1("Nutrition (N2)"),
+    dcc.Location(id='url', refresh=False),
+    html.Div([
+        html.Label("Dataset:"),
+        dcc.Dropdown(
+            id='dataset-dropdown',
+            options=[{"label": name, "value": name} for name in datasets.names()],
+            value=DEFAULT_DATASET,
+            clearable=False,
+            style={'width': '300px'}
+        ),
+        html.Label("Category bins:"),
+        dcc.Dropdown(
+            id='bin-scheme-dropdown',
+            # Computed schemes until the dataset's own list arrives; None is
+            # the scheme the dataset was loaded with
+            options=bin_scheme_options([name for name in BIN_SCHEMES if name != 'dataset']),
+            value=None,
+            clearable=False,
+            style={'width': '200px'}
+        )
+    ], style={'display': 'flex', 'alignItems': 'center', 'gap': '10px', 'marginBottom': '10px'}),
+    dcc.Store(id='health-settings', data={'weights': HEALTH_WEIGHTS, 'thresholds': CATEGORY_THRESHOLDS}),
+    # Only keys travel to the browser; the row sets stay in the session store
+    dcc.Store(id='session-key', storage_type='session'),
+    dcc.Store(id='selection-token'),
     dcc.Tabs([
         dcc.Tab(label="Introduction", children=[
             html.Div([
@@ -172,6 +341,22 @@ app.layout = html.Div([
                     style={'textAlign': 'center', 'marginBottom': '30px', 'color': '#2c3e50'}
                 ),
                 
+                # Health score weights and category thresholds
+                html.Div([
+                    number_control('health-weight', nut, label, HEALTH_WEIGHTS[nut])
+                    for nut, label in weight_labels.items()
+                ] + [
+                    number_control('health-threshold', name, label, CATEGORY_THRESHOLDS[name])
+                    for name, label in threshold_labels.items()
+                ], style={
+                    'display': 'flex',
+                    'flexWrap': 'wrap',
+                    'gap': '20px',
+                    'backgroundColor': '#f8f9fa',
+                    'padding': '15px',
+                    'borderRadius': '10px'
+                }),
+
                 # Container for graph and recipe list side by side
                 html.Div(style={
                     'display': 'flex',
@@ -188,7 +373,32 @@ app.layout = html.Div([
                             id="scatter-plot",
                             style={'height': '70vh'},
                             config={'displayModeBar': True}
-                        )
+                        ),
+                        html.Div(DETAIL_PLACEHOLDER, id='explorer-detail', style=DETAIL_STYLE),
+
+                        # Compare: sidebar clicks toggle recipes, pasted names add more
+                        html.Div([
+                            html.H4("Compare Recipes"),
+                            html.P("Click recipes in the list to add or remove them, or paste names below (one per line).",
+                                   style={'color': '#7f8c8d'}),
+                            dcc.Textarea(
+                                id='compare-names',
+                                placeholder="One recipe name per line",
+                                style={'width': '100%', 'height': '80px'}
+                            ),
+                            html.Button("Highlight", id='compare-button', n_clicks=0,
+                                        style={'marginTop': '5px'}),
+                            dash_table.DataTable(
+                                id='comparison-table',
+                                columns=[{'name': label, 'id': column} for column, label in COMPARISON_COLUMNS],
+                                data=[],
+                                sort_action='native',
+                                page_size=15,
+                                style_table={'overflowX': 'auto', 'marginTop': '10px'},
+                                style_cell={'padding': '4px', 'textAlign': 'left'},
+                                style_header={'fontWeight': 'bold'}
+                            )
+                        ], style={'marginTop': '20px'})
                     ]),
                     
                     # Recipe list container on the right
@@ -202,14 +412,6 @@ app.layout = html.Div([
                         html.H3("Recipe List"),
                         html.Ul(
                             id='recipe-list',
-                            children=[
-                                html.Li(
-                                    recipe,
-                                    id={'type': 'recipe-item', 'index': i},
-                                    n_clicks=0,
-                                    style={'cursor': 'pointer', 'padding': '4px'}
-                                ) for i, recipe in enumerate(sidebar_names)
-                            ],
                             style={'height': '65vh', 'overflowY': 'auto', 'listStyleType': 'none', 'padding': 0}
                         )
                     ])
@@ -344,11 +546,62 @@ app.layout = html.Div([
                         value='protein',
                         clearable=False,
                         style={'width': '300px'}
+                    ),
+                    html.Label("Statistic:", style={'marginTop': '10px'}),
+                    dcc.Dropdown(
+                        id='heatmap-statistic-dropdown',
+                        options=statistic_options,
+                        value='mean',
+                        clearable=False,
+                        style={'width': '300px'}
+                    ),
+                    html.Label("Rows:", style={'marginTop': '10px'}),
+                    dcc.Dropdown(
+                        id='heatmap-rows-dropdown',
+                        options=row_options,
+                        value='Time_Category',
+                        clearable=False,
+                        style={'width': '300px'}
+                    ),
+                    html.Label("Columns:", style={'marginTop': '10px'}),
+                    dcc.Dropdown(
+                        id='heatmap-group-dropdown',
+                        options=group_options,
+                        value='Diet_Type',
+                        clearable=False,
+                        style={'width': '300px'}
+                    ),
+                    dcc.Checklist(
+                        id='heatmap-scope',
+                        options=[{"label": " Only recipes selected in the explorer", "value": "selection"}],
+                        value=[],
+                        style={'marginTop': '10px'}
                     )
                 ], style={'backgroundColor': '#f8f9fa', 'padding': '20px', 'borderRadius': '10px', 'marginBottom': '20px'}),
                 
-                # Heatmap
+                # Heatmap; the interval polls for the exact figure behind a preview
                 dcc.Graph(id='nutrient-heatmap'),
+                dcc.Interval(id='heatmap-refresh', interval=1000, disabled=True),
+
+                # Drill-down: the recipes behind a clicked cell, paged on the server
+                html.Div([
+                    html.H4("Click a cell to list its recipes", id='drilldown-title'),
+                    dash_table.DataTable(
+                        id='drilldown-table',
+                        columns=[{'name': label, 'id': column} for column, label in COMPARISON_COLUMNS],
+                        data=[],
+                        page_action='custom',
+                        page_current=0,
+                        page_size=DRILLDOWN_PAGE_SIZE,
+                        page_count=0,
+                        sort_action='custom',
+                        sort_mode='single',
+                        sort_by=[],
+                        style_table={'overflowX': 'auto'},
+                        style_cell={'padding': '4px', 'textAlign': 'left'},
+                        style_header={'fontWeight': 'bold'}
+                    )
+                ], style={'marginTop': '20px'}),
                 
                 # Statistics Panel
                 html.Div(id='stats-panel', style={'marginTop': '20px', 'padding': '20px', 'backgroundColor': '#f8f9fa', 'borderRadius': '10px'}),
@@ -430,28 +683,7 @@ app.layout = html.Div([
                     # 1. Preparation Time vs Ratings (Regression Plot)
                     html.Div([
                         dcc.Graph(
-                            id='time-vs-rating',
-                            figure=px.scatter(
-                                df,
-                                x='minutes',
-                                y='rating',
-                                opacity=0.4,
-                                color_discrete_sequence=['#2ecc71'],
-                                title='Preparation Time vs Ratings',
-                                labels={'minutes': 'Time (minutes)', 'rating': 'Rating'},
-                                height=500
-                            ).update_layout(
-                                title_font_size=14,
-                                xaxis_title_font_size=12,
-                                yaxis_title_font_size=12,
-                                xaxis_gridcolor='lightgray',
-                                yaxis_gridcolor='lightgray',
-                                xaxis_title='Time (minutes)',
-                                yaxis_title='Rating',
-                                plot_bgcolor='white'
-                            ).update_traces(
-                                marker=dict(size=8)
-                            )
+                            id='time-vs-rating'
                         ),
                         # Explanation for Time vs Rating
                         html.Div([
@@ -479,28 +711,7 @@ app.layout = html.Div([
                     # 2. Number of Steps vs Ratings (Regression Plot)
                     html.Div([
                         dcc.Graph(
-                            id='steps-vs-rating',
-                            figure=px.scatter(
-                                df,
-                                x='n_steps',
-                                y='rating',
-                                opacity=0.4,
-                                color_discrete_sequence=['#3498db'],
-                                title='Number of Steps vs Ratings',
-                                labels={'n_steps': 'Number of Steps', 'rating': 'Rating'},
-                                height=500
-                            ).update_layout(
-                                title_font_size=14,
-                                xaxis_title_font_size=12,
-                                yaxis_title_font_size=12,
-                                xaxis_gridcolor='lightgray',
-                                yaxis_gridcolor='lightgray',
-                                xaxis_title='Number of Steps',
-                                yaxis_title='Rating',
-                                plot_bgcolor='white'
-                            ).update_traces(
-                                marker=dict(size=8)
-                            )
+                            id='steps-vs-rating'
                         ),
                         # Explanation for Steps vs Rating
                         html.Div([
@@ -574,22 +785,7 @@ app.layout = html.Div([
                     # Protein vs Ratings
                     html.Div([
                         dcc.Graph(
-                            id='protein-rating-bars',
-                            figure=px.histogram(
-                                df,
-                                x='rating',
-                                color='protein_level',
-                                barmode='group',
-                                labels={'rating': 'Rating', 'protein_level': 'Protein Level'},
-                                title='Rating Distribution by Protein Level',
-                                color_discrete_sequence=px.colors.qualitative.Set2,
-                                category_orders={"rating": sorted(df['rating'].unique())}
-                            ).update_layout(
-                                xaxis_title='Rating',
-                                yaxis_title='Count',
-                                legend_title='Protein Level',
-                                plot_bgcolor='white'
-                            )
+                            id='protein-rating-bars'
                         ),
                         # Explanation for Protein Impact
                         html.Div([
@@ -617,22 +813,7 @@ app.layout = html.Div([
                     # Carbs vs Ratings
                     html.Div([
                         dcc.Graph(
-                            id='carbs-rating-bars',
-                            figure=px.histogram(
-                                df,
-                                x='rating',
-                                color='carbs_level',
-                                barmode='group',
-                                labels={'rating': 'Rating', 'carbs_level': 'Carbs Level'},
-                                title='Rating Distribution by Carbohydrate Level',
-                                color_discrete_sequence=px.colors.qualitative.Set2,
-                                category_orders={"rating": sorted(df['rating'].unique())}
-                            ).update_layout(
-                                xaxis_title='Rating',
-                                yaxis_title='Count',
-                                legend_title='Carbs Level',
-                                plot_bgcolor='white'
-                            )
+                            id='carbs-rating-bars'
                         ),
                         # Explanation for Carbs Impact
                         html.Div([
@@ -663,22 +844,7 @@ app.layout = html.Div([
                     # Sugar vs Ratings
                     html.Div([
                         dcc.Graph(
-                            id='sugar-rating-bars',
-                            figure=px.histogram(
-                                df,
-                                x='rating',
-                                color='sugar_level',
-                                barmode='group',
-                                labels={'rating': 'Rating', 'sugar_level': 'Sugar Level'},
-                                title='Rating Distribution by Sugar Level',
-                                color_discrete_sequence=px.colors.qualitative.Set2,
-                                category_orders={"rating": sorted(df['rating'].unique())}
-                            ).update_layout(
-                                xaxis_title='Rating',
-                                yaxis_title='Count',
-                                legend_title='Sugar Level',
-                                plot_bgcolor='white'
-                            )
+                            id='sugar-rating-bars'
                         ),
                         # Explanation for Sugar Impact
                         html.Div([
@@ -706,22 +872,7 @@ app.layout = html.Div([
                     # Fat vs Ratings
                     html.Div([
                         dcc.Graph(
-                            id='fat-rating-bars',
-                            figure=px.histogram(
-                                df,
-                                x='rating',
-                                color='fat_level',
-                                barmode='group',
-                                labels={'rating': 'Rating', 'fat_level': 'Fat Level'},
-                                title='Rating Distribution by Fat Level',
-                                color_discrete_sequence=px.colors.qualitative.Set2,
-                                category_orders={"rating": sorted(df['rating'].unique())}
-                            ).update_layout(
-                                xaxis_title='Rating',
-                                yaxis_title='Count',
-                                legend_title='Fat Level',
-                                plot_bgcolor='white'
-                            )
+                            id='fat-rating-bars'
                         ),
                         # Explanation for Fat Impact
                         html.Div([
@@ -750,22 +901,7 @@ app.layout = html.Div([
                 # Calories Impact
                 html.Div([
                     dcc.Graph(
-                        id='calories-rating-bars',
-                        figure=px.histogram(
-                            df,
-                            x='rating',
-                            color='calories_level',
-                            barmode='group',
-                            labels={'rating': 'Rating', 'calories_level': 'Calories Level'},
-                            title='Rating Distribution by Calories Level',
-                            color_discrete_sequence=px.colors.qualitative.Set2,
-                            category_orders={"rating": sorted(df['rating'].unique())}
-                        ).update_layout(
-                            xaxis_title='Rating',
-                            yaxis_title='Count',
-                            legend_title='Calories Level',
-                            plot_bgcolor='white'
-                        )
+                        id='calories-rating-bars'
                     ),
                     # Explanation for Calories Impact
                     html.Div([
@@ -834,26 +970,7 @@ app.layout = html.Div([
                 # Bar Plot (Health Score vs. Rating Category)
                 html.Div([
                     dcc.Graph(
-                        id='health-rating-bar',
-                        figure=px.histogram(
-                            df.assign(Health_Score_Range=pd.cut(
-                                df['Health_Score'], 
-                                bins=[-100, -50, 0, 50, 100],
-                                labels=['Very Low (-100 to -50)', 'Low (-50 to 0)', 'High (0 to 50)', 'Very High (50 to 100)']
-                            )),
-                            x='Health_Score_Range',
-                            color='Rating_Category',
-                            barmode='group',
-                            title='Count of Recipes by Health Score and Rating Category',
-                            color_discrete_sequence=px.colors.qualitative.Set2,
-                            labels={'Health_Score_Range': 'Health Score Range', 'count': 'Number of Recipes'}
-                        ).update_layout(
-                            xaxis_title='Health Score Range',
-                            yaxis_title='Count of Recipes',
-                            legend_title='Rating Category',
-                            plot_bgcolor='white',
-                            height=600
-                        )
+                        id='health-rating-bar'
                     ),
                     
                     # Detailed Explanation
@@ -925,25 +1042,9 @@ app.layout = html.Div([
                 # Scatter Plot (Health Score vs. Rating)
                 html.Div([
                     dcc.Graph(
-                        id='health-rating-scatter',
-                        figure=px.scatter(
-                            df,
-                            x='Health_Score',
-                            y='rating',
-                            color='Category',
-                            color_discrete_map={'Moderate': 'orange', 'Healthy': 'green', 'Unhealthy': 'red'},
-                            opacity=0.7,
-                            title='Relationship Between Health Score and Rating',
-                            labels={'Health_Score': 'Health Score', 'rating': 'Rating'},
-                            hover_data=['name', 'calories', 'protein']
-                        ).update_layout(
-                            xaxis_title='Health Score',
-                            yaxis_title='Rating',
-                            legend_title='Health Category',
-                            plot_bgcolor='white',
-                            height=600
-                        )
+                        id='health-rating-scatter'
                     ),
+                    html.Div(DETAIL_PLACEHOLDER, id='health-detail', style=DETAIL_STYLE),
                     
                     # Detailed Explanation
                     html.Div([
@@ -1076,297 +1177,210 @@ app.layout = html.Div([
 
 # Callbacks
 @app.callback(
-    Output("scatter-plot", "figure"),
-    [Input({'type': 'recipe-item', 'index': ALL}, 'n_clicks')]
+    Output('health-settings', 'data'),
+    [Input({'type': 'health-weight', 'index': ALL}, 'value'),
+     Input({'type': 'health-threshold', 'index': ALL}, 'value')],
+    prevent_initial_call=True
 )
-def update_graph(clicks):
-    highlight_index = None
-    if any(clicks):
-        highlight_index = max([i for i, v in enumerate(clicks) if v])
-
-    filtered = df
-    
-    color_map = {
-        'Moderate': 'red',
-        'Healthy': 'green',
-        'Unhealthy': 'blue'
-    }
-    label_map = {
-        'Moderate': 'Moderate (High)',
-        'Healthy': 'Healthy (Low)',
-        'Unhealthy': 'Unhealthy (Medium)'
+def update_health_settings(weights, thresholds):
+    # Empty inputs fall back to the default for that term
+    weight_ids = [item['id']['index'] for item in ctx.inputs_list[0]]
+    threshold_ids = [item['id']['index'] for item in ctx.inputs_list[1]]
+    return {
+        'weights': {k: v for k, v in zip(weight_ids, weights) if v is not None},
+        'thresholds': {k: v for k, v in zip(threshold_ids, thresholds) if v is not None}
     }
 
-    fig = px.scatter(
-        filtered,
-        x="calories",
-        y="Health_Score",
-        color="Category",
-        color_discrete_map=color_map,
-        hover_data=['name'],
-        title='',
-        category_orders={'Category': ['Moderate', 'Healthy', 'Unhealthy']}
-    )
+@app.callback(
+    Output('session-key', 'data'),
+    Input('url', 'pathname'),
+    State('session-key', 'data')
+)
+def ensure_session(pathname, session):
+    # One key per browser tab; what it points to lives in session_store
+    return session or new_session_key()
+
+@app.callback(
+    [Output('url', 'search'),
+     Output('dataset-dropdown', 'value')],
+    [Input('url', 'search'),
+     Input('dataset-dropdown', 'value')]
+)
+def sync_dataset(search, dataset):
+    # ?dataset=<name> selects the dataset; picking one updates the URL
+    if ctx.triggered_id == 'dataset-dropdown':
+        return '?' + urlencode({'dataset': dataset}), dash.no_update
+    requested = parse_qs((search or '').lstrip('?')).get('dataset', [None])[0]
+    selected = datasets.resolve(requested)
+    return dash.no_update, selected if selected != dataset else dash.no_update
+
+@dataset_callback(
+    [Output('bin-scheme-dropdown', 'options'),
+     Output('bin-scheme-dropdown', 'value')],
+    [State('bin-scheme-dropdown', 'value')]
+)
+def update_bin_schemes(dataset, scheme):
+    # Only the schemes this dataset supports ("From dataset" needs the CSV's
+    # own category columns); an unsupported choice falls back to its default
+    schemes = dataset.bin_schemes()
+    return bin_scheme_options(schemes), scheme if scheme in schemes else dataset.default_bins
 
-    # Using responsive layout settings
-    fig.update_layout(
-        autosize=True,
-        margin=dict(l=50, r=50, t=30, b=50),
-        plot_bgcolor='rgba(240,240,240,0.2)',
-        paper_bgcolor='rgba(0,0,0,0)'
-    )
-    
-    # Make points slightly larger for better visibility
-    fig.update_traces(marker=dict(size=8))
+@dataset_callback(
+    [Output(name, 'figure') for name in DATASET_FIGURES] + [Output('recipe-list', 'children')],
+    [Input('bin-scheme-dropdown', 'value')]
+)
+def update_dataset_figures(dataset, scheme):
+    recipe_items = [
+        html.Li(
+            recipe,
+            id={'type': 'recipe-item', 'index': i},
+            n_clicks=0,
+            style={'cursor': 'pointer', 'padding': '4px'}
+        ) for i, recipe in enumerate(dataset.sidebar_names)
+    ]
+    store = dataset.store(scheme)
+    return [store.get(name) for name in DATASET_FIGURES] + [recipe_items]
 
-    for trace in fig.data:
-        cat = trace.name
-        if cat in label_map:
-            trace.name = label_map[cat]
+@dataset_callback(
+    [Output("scatter-plot", "figure"),
+     Output('comparison-table', 'data'),
+     Output('selection-token', 'data')],
+    [Input({'type': 'recipe-item', 'index': ALL}, 'n_clicks'),
+     Input('health-settings', 'data'),
+     Input('scatter-plot', 'relayoutData'),
+     Input('compare-button', 'n_clicks'),
+     State('compare-names', 'value'),
+     State('session-key', 'data')]
+)
+def update_graph(dataset, clicks, settings, relayout, compare_clicks, pasted, session):
+    key = health_settings_key(settings)
+    fig = dataset.health_figure('scatter-plot', key)
 
-    if highlight_index is not None:
-        recipe_name = sidebar_names.iloc[highlight_index]
-        match = filtered[filtered['name'] == recipe_name]
-        if not match.empty:
-            recipe_row = match.iloc[0]
-            fig.add_annotation(
-                x=recipe_row['calories'],
-                y=recipe_row['Health_Score'],
-                text=f"<b>{recipe_row['name']}</b><br>Category: {recipe_row['Category']}",
-                showarrow=True,
-                arrowhead=2,
-                arrowsize=1,
-                arrowwidth=2,
-                ax=40,
-                ay=-40,
-                bgcolor='white',
-                bordercolor='black',
-                borderwidth=2,
-                font=dict(size=14, color='black')
-            )
+    if ctx.triggered_id == 'scatter-plot':
+        relayout = relayout or {}
+        if relayout.get('xaxis.autorange') or relayout.get('yaxis.autorange'):
+            return reset_viewport_patch(fig), dash.no_update, dash.no_update
+        if axis_range(relayout, 'xaxis') is None and axis_range(relayout, 'yaxis') is None:
+            return dash.no_update, dash.no_update, dash.no_update
+        return viewport_patch(dataset, fig, key, relayout), dash.no_update, dash.no_update
 
-    fig.add_vline(x=200, line_dash="dash", line_color="gray", line_width=3, opacity=0.8)
-    fig.add_hline(y=7, line_dash="dash", line_color="green", line_width=3, opacity=0.8)
-    fig.add_hline(y=4, line_dash="dash", line_color="blue", line_width=3, opacity=0.8)
+    # Odd click counts select a sidebar recipe; pasted names add to those
+    names = [dataset.sidebar_names.iloc[i] for i, v in enumerate(clicks)
+             if v and v % 2 and i < len(dataset.sidebar_names)]
+    names += [line.strip() for line in (pasted or '').splitlines() if line.strip()]
+    selected = dataset.lookup(key, names[:MAX_COMPARE])
+    token = selection_token(dataset, session, selected)
+    if selected.empty:
+        return fig, [], token
 
-    return fig
+    # Copy only what changes so the shared snapshot is never mutated
+    fig = dict(fig, data=list(fig['data']) + [encode_trace(selection_overlay(selected))])
+    if len(selected) == 1:
+        layout = dict(fig['layout'])
+        layout['annotations'] = list(layout.get('annotations', [])) + [recipe_annotation(
+            selected.iloc[0], dataset.recipe_ranks(key, selected.iloc[0]))]
+        fig['layout'] = layout
+    return fig, comparison_rows(selected), token
 
-@app.callback(
+@dataset_callback(
+    Output('explorer-detail', 'children'),
+    [Input('scatter-plot', 'hoverData'),
+     Input('scatter-plot', 'clickData'),
+     Input('health-settings', 'data')]
+)
+def update_explorer_detail(dataset, hover, click, settings):
+    return recipe_detail_panel(dataset, health_settings_key(settings), hover, click)
+
+@dataset_callback(
+    Output('health-detail', 'children'),
+    [Input('health-rating-scatter', 'hoverData'),
+     Input('health-rating-scatter', 'clickData'),
+     Input('health-settings', 'data')]
+)
+def update_health_detail(dataset, hover, click, settings):
+    return recipe_detail_panel(dataset, health_settings_key(settings), hover, click)
+
+@dataset_callback(
+    [Output('health-rating-bar', 'figure'),
+     Output('health-rating-scatter', 'figure')],
+    [Input('health-settings', 'data'),
+     Input('bin-scheme-dropdown', 'value')]
+)
+def update_health_figures(dataset, settings, scheme):
+    key = health_settings_key(settings)
+    return (dataset.health_figure('health-rating-bar', key, scheme),
+            dataset.health_figure('health-rating-scatter', key))
+
+@dataset_callback(
     [Output('nutrient-heatmap', 'figure'),
-     Output('stats-panel', 'children')],
-    [Input('heatmap-nutrient-dropdown', 'value')]
+     Output('stats-panel', 'children'),
+     Output('heatmap-refresh', 'disabled')],
+    [Input('heatmap-nutrient-dropdown', 'value'),
+     Input('heatmap-statistic-dropdown', 'value'),
+     Input('heatmap-rows-dropdown', 'value'),
+     Input('heatmap-group-dropdown', 'value'),
+     Input('bin-scheme-dropdown', 'value'),
+     Input('heatmap-scope', 'value'),
+     Input('selection-token', 'data'),
+     Input('heatmap-refresh', 'n_intervals'),
+     State('session-key', 'data')]
 )
-def update_heatmap(nutrient):
-    nutrients = ["protein", "calories", "fat", "sugar", "carbs"]
-    
-    def create_stats_panel(selected_nutrient, pivot_data):
-        # Find highest and lowest values
-        max_val = pivot_data.max().max()
-        min_val = pivot_data.min().min()
-        max_loc = np.where(pivot_data.values == max_val)
-        min_loc = np.where(pivot_data.values == min_val)
-        
-        # Calculate correlations
-        correlations = {}
-        for other_nut in nutrients:
-            if other_nut != selected_nutrient:
-                corr = df[selected_nutrient].corr(df[other_nut])
-                correlations[other_nut] = corr
-        
-        # Sort correlations by absolute value
-        sorted_corr = sorted(correlations.items(), key=lambda x: abs(x[1]), reverse=True)
-        
-        return html.Div([
-            html.H4("Statistics and Insights", style={'marginBottom': '15px'}),
-            
-            # Highest and Lowest Values
-            html.Div([
-                html.Div([
-                    html.H5("Highest Value:", style={'color': '#2ecc71'}),
-                    html.P([
-                        f"{max_val:.2f} ",
-                        html.Span(f"({pivot_data.index[max_loc[0][0]]} - {pivot_data.columns[max_loc[1][0]]})",
-                                style={'color': '#7f8c8d'})
-                    ])
-                ], style={'flex': 1}),
-                html.Div([
-                    html.H5("Lowest Value:", style={'color': '#e74c3c'}),
-                    html.P([
-                        f"{min_val:.2f} ",
-                        html.Span(f"({pivot_data.index[min_loc[0][0]]} - {pivot_data.columns[min_loc[1][0]]})",
-                                style={'color': '#7f8c8d'})
-                    ])
-                ], style={'flex': 1}),
-                html.Div([
-                    html.H5("Average:", style={'color': '#3498db'}),
-                    html.P(f"{pivot_data.mean().mean():.2f}")
-                ], style={'flex': 1})
-            ], style={'display': 'flex', 'marginBottom': '20px', 'gap': '20px'}),
-            
-            # Correlations
-            html.Div([
-                html.H5("Nutrient Correlations:", style={'marginBottom': '10px'}),
-                html.Div([
-                    html.Div([
-                        html.Div([
-                            html.Strong(f"{nut.title()}: "),
-                            html.Span(f"{corr:.3f}",
-                                    style={'color': '#2ecc71' if corr > 0 else '#e74c3c'})
-                        ], style={'marginBottom': '5px'})
-                        for nut, corr in sorted_corr
-                    ])
-                ], style={'backgroundColor': '#fff', 'padding': '10px', 'borderRadius': '5px'})
-            ])
-        ])
+def update_heatmap(dataset, nutrient, statistic, rows, grouping, scheme, scope, token, refreshes, session):
+    store = dataset.store(scheme)
+    name = heatmap_name(nutrient, statistic, (rows, grouping))
+    if 'selection' in (scope or []):
+        selected = dataset.load_rows(session, 'selection', scheme)
+        if selected is not None and len(selected):
+            # Per-user subset: rendered for this request only
+            fig, stats_panel = render_snapshot(selected, name)
+            return fig, stats_panel, True
+    if store.progressive() and store.peek(name) is None:
+        # Answer from the sample now; the interval picks up the exact figure
+        store.refine(name)
+        if ctx.triggered_id == 'heatmap-refresh':
+            return dash.no_update, dash.no_update, False
+        fig, stats_panel = store.preview(name)
+        return fig, stats_panel, False
+    fig, stats_panel = store.get(name)
+    return fig, stats_panel, True
 
-    if nutrient == "all":
-        n = len(nutrients)
-        cols = 3
-        rows = (n + cols - 1) // cols
-        fig = make_subplots(
-            rows=rows, cols=cols,
-            subplot_titles=[f"{nut.title()}" for nut in nutrients],
-            horizontal_spacing=0.18,
-            vertical_spacing=0.32
-        )
-        
-        all_stats = []
-        for i, nut in enumerate(nutrients):
-            pivot = df.pivot_table(
-                index='Time_Category',
-                columns='Diet_Type',
-                values=nut,
-                aggfunc=np.mean
-            )
-            
-            # Calculate statistics for each nutrient
-            all_stats.append(create_stats_panel(nut, pivot))
-            
-            std_dev = df.pivot_table(
-                index='Time_Category',
-                columns='Diet_Type',
-                values=nut,
-                aggfunc=np.std
-            )
-            count = df.pivot_table(
-                index='Time_Category',
-                columns='Diet_Type',
-                values=nut,
-                aggfunc='count'
-            )
-            
-            col = i % cols + 1
-            row = i // cols + 1
-            
-            if col == 3:
-                colorbar_x = (col - 0.5) / cols + 0.18
-            else:
-                colorbar_x = (col - 0.5) / cols + 0.13
-            colorbar_y = 1.0 - (row - 0.5) / rows
-            
-            hover_text = [[
-                f"Diet Type: {col}<br>" +
-                f"Time Category: {idx}<br>" +
-                f"Average {nut.title()}: {val:.1f}<br>" +
-                f"Std Dev: {std_dev.loc[idx, col]:.2f}<br>" +
-                f"Sample Size: {count.loc[idx, col]:.0f}"
-                for col, val in zip(pivot.columns, row_vals)
-            ] for idx, row_vals in zip(pivot.index, pivot.values)]
-            
-            heatmap = go.Heatmap(
-                z=pivot.values,
-                x=pivot.columns,
-                y=pivot.index,
-                colorscale='RdBu',
-                colorbar=dict(
-                    title=dict(
-                        text=f"{nut.title()}",
-                        side="right"
-                    ),
-                    x=colorbar_x,
-                    y=colorbar_y,
-                    len=0.5/rows,
-                    thickness=18,
-                    outlinewidth=1
-                ),
-                text=[[f"{v:.1f}" if v==v else '' for v in row] for row in pivot.values],
-                texttemplate="%{text}",
-                hovertext=hover_text,
-                hoverinfo='text',
-                showscale=True
-            )
-            fig.add_trace(heatmap, row=row, col=col)
-        
-        fig.update_layout(
-            height=370*rows,
-            width=500*cols + 120,
-            title={
-                'text': "Nutrient Heat Maps by Diet Type and Preparation Time",
-                'x': 0.5,
-                'xanchor': 'center'
-            },
-            margin=dict(t=80, l=20, r=20, b=20),
-            dragmode='pan'
-        )
-        
-        # Combine all statistics
-        stats_panel = html.Div(all_stats, style={'display': 'flex', 'flexWrap': 'wrap', 'gap': '20px'})
-        return fig, stats_panel
-    
-    else:
-        pivot = df.pivot_table(
-            index='Time_Category',
-            columns='Diet_Type',
-            values=nutrient,
-            aggfunc=np.mean
-        )
-        
-        std_dev = df.pivot_table(
-            index='Time_Category',
-            columns='Diet_Type',
-            values=nutrient,
-            aggfunc=np.std
-        )
-        count = df.pivot_table(
-            index='Time_Category',
-            columns='Diet_Type',
-            values=nutrient,
-            aggfunc='count'
-        )
-        
-        hover_text = [[
-            f"Diet Type: {col}<br>" +
-            f"Time Category: {idx}<br>" +
-            f"Average {nutrient.title()}: {val:.1f}<br>" +
-            f"Std Dev: {std_dev.loc[idx, col]:.2f}<br>" +
-            f"Sample Size: {count.loc[idx, col]:.0f}"
-            for col, val in zip(pivot.columns, row_vals)
-        ] for idx, row_vals in zip(pivot.index, pivot.values)]
-        
-        fig = go.Figure(data=go.Heatmap(
-            z=pivot.values,
-            x=pivot.columns,
-            y=pivot.index,
-            colorscale='RdBu',
-            text=[[f"{v:.1f}" if v==v else '' for v in row] for row in pivot.values],
-            texttemplate="%{text}",
-            hovertext=hover_text,
-            hoverinfo='text'
-        ))
-        
-        fig.update_layout(
-            height=700,
-            title={
-                'text': f"Average {nutrient.title()} by Diet Type and Preparation Time",
-                'x': 0.5,
-                'xanchor': 'center'
-            },
-            dragmode='pan'
-        )
-        
-        # Create statistics panel for single nutrient
-        stats_panel = create_stats_panel(nutrient, pivot)
-        return fig, stats_panel
+@dataset_callback(
+    [Output('drilldown-table', 'data'),
+     Output('drilldown-table', 'page_count'),
+     Output('drilldown-table', 'page_current'),
+     Output('drilldown-title', 'children')],
+    [Input('nutrient-heatmap', 'clickData'),
+     Input('drilldown-table', 'page_current'),
+     Input('drilldown-table', 'sort_by'),
+     State('heatmap-rows-dropdown', 'value'),
+     State('heatmap-group-dropdown', 'value'),
+     State('bin-scheme-dropdown', 'value'),
+     State('heatmap-scope', 'value'),
+     State('session-key', 'data')],
+    prevent_initial_call=True
+)
+def update_drilldown(dataset, click, page, sort_by, rows, grouping, scheme, scope, session):
+    if not click or not click.get('points'):
+        return [], 0, 0, "Click a cell to list its recipes"
+    point = click['points'][0]
+    # A new cell starts over at the first page
+    page = 0 if ctx.triggered_id in (None, 'nutrient-heatmap') else page or 0
+    sort = sort_by[0] if sort_by else {}
+    # Same rows as the heat map: the explorer selection when it is scoped to one
+    within = None
+    if 'selection' in (scope or []):
+        within = dataset.load_rows(session, 'selection', scheme)
+        if within is not None and not len(within):
+            within = None
+    total, recipes = dataset.drilldown(
+        scheme, (rows, grouping), point['y'], point['x'], page * DRILLDOWN_PAGE_SIZE, DRILLDOWN_PAGE_SIZE,
+        sort.get('column_id'), sort.get('direction') == 'desc', within)
+    pages = max(1, -(-total // DRILLDOWN_PAGE_SIZE))
+    return comparison_rows(recipes), pages, page, f"{point['y']} \u00d7 {point['x']}: {total:,} recipes"
+
+# The server can bind now; data loads behind /readyz
+warmup.imported()
+warmup.start()
 
 # Run server
 if __name__ == '__main__':
@@ -0,0 +1,109 @@
+"""Compare the query backends on the dashboard's heavy queries.
+
+Loads a recipe CSV, repeats it until it has at least ``--rows`` rows, then
+times heat map pivots, export filters, histograms and correlations on every
+requested backend (see ``query_backends.py``):
+
+    python benchmark_backends.py --rows 2000000 --backends pandas polars duckdb
+
+Setup (building the backend, including writing the Parquet cache) is timed
+separately from the queries; the report lists the median of ``--repeat``
+runs per query.
+"""
+import argparse
+import json
+import statistics
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from aggregates import nutrients
+from query_backends import BACKENDS, DuckDBQuery
+from recipe_data import DATA_PATH, HealthScorer, read_recipes
+
+QUERIES = {
+    'heatmap': lambda q: q.pivot('protein', 'Time_Category', 'Diet_Type'),
+    'filter': lambda q: q.filter_rows({'Category': ['Healthy'], 'Diet_Type': ['Vegan']}, None, 400),
+    'histogram': lambda q: q.histogram('calories', 50),
+    'correlations': lambda q: q.correlations(nutrients),
+}
+
+
+def scaled_frame(path, rows):
+    df = HealthScorer(read_recipes(path)).apply()
+    copies = max(1, -(-rows // len(df)))
+    return pd.concat([df] * copies, ignore_index=True) if copies > 1 else df
+
+
+def timed(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return result, statistics.median(times)
+
+
+def run(df, names, repeat, directory):
+    results = {}
+    reference = {}
+    for name in names:
+        start = time.perf_counter()
+        if name == 'duckdb':
+            backend = DuckDBQuery(df, f"benchmark-{len(df)}", directory)
+        else:
+            backend = BACKENDS[name](df)
+        row = {'setup_ms': (time.perf_counter() - start) * 1e3}
+        for query, func in QUERIES.items():
+            result, seconds = timed(lambda: func(backend), repeat)
+            row[f'{query}_ms'] = seconds * 1e3
+            reference.setdefault(query, result)
+            row[f'{query}_matches'] = same(reference[query], result)
+        results[name] = row
+    return results
+
+
+def same(a, b):
+    # Results agree with the first backend's, up to float rounding
+    if isinstance(a, tuple):
+        return all(same(x, y) for x, y in zip(a, b))
+    if isinstance(a, (pd.DataFrame, pd.Series)):
+        return a.shape == b.shape and np.allclose(a.to_numpy(dtype=np.float64), b.to_numpy(dtype=np.float64),
+                                                  equal_nan=True)
+    return np.array_equal(np.asarray(a), np.asarray(b))
+
+
+def print_report(results, rows):
+    print(f"{rows:,} rows (median ms)")
+    print(f"{'backend':<10}{'setup':>10}" + ''.join(f"{query:>14}" for query in QUERIES))
+    for name, row in results.items():
+        cells = ''.join(f"{row[f'{query}_ms']:>13.1f}{' ' if row[f'{query}_matches'] else '!'}"
+                        for query in QUERIES)
+        print(f"{name:<10}{row['setup_ms']:>10.1f}{cells}")
+    if not all(row[f'{query}_matches'] for row in results.values() for query in QUERIES):
+        print("! result differs from the first backend's")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard's query backends.")
+    parser.add_argument('--data', default=DATA_PATH, help="recipe CSV to load")
+    parser.add_argument('--rows', type=int, default=1000000, help="repeat the data to at least this many rows")
+    parser.add_argument('--backends', nargs='+', default=list(BACKENDS), choices=list(BACKENDS))
+    parser.add_argument('--repeat', type=int, default=5, help="runs per query")
+    parser.add_argument('--json', help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    df = scaled_frame(args.data, args.rows)
+    with tempfile.TemporaryDirectory() as directory:
+        results = run(df, args.backends, args.repeat, directory)
+    print_report(results, len(df))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'rows': len(df), 'results': results}, f, indent=2)
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""Compare gunicorn worker setups on the same box.
+
+Starts ``gunicorn app:server`` once per configuration and replays the same
+browser-like sessions as ``loadtest.py`` against it, at the same
+concurrency:
+
+    python benchmark_workers.py --configs sync:4x1 gthread:1x4 gthread:2x4 --concurrency 16
+
+A configuration is ``worker_class:WORKERSxTHREADS``.  The report lists
+throughput, p95 latency and error rate per configuration, plus the resident
+memory of the whole gunicorn process tree once the run ends (Linux only).
+"""
+import argparse
+import json
+import os
+
+from loadtest import free_port, report, run, start_server
+
+DEFAULT_CONFIGS = ['sync:4x1', 'gthread:1x4', 'gthread:2x4']
+
+
+def parse_config(text):
+    worker_class, _, shape = text.partition(':')
+    workers, _, threads = shape.partition('x')
+    return worker_class, int(workers or 1), int(threads or 1)
+
+
+def tree_rss(pid):
+    # Resident bytes of pid and its descendants, from /proc
+    try:
+        parents = {}
+        for entry in os.listdir('/proc'):
+            if entry.isdigit():
+                try:
+                    with open(f'/proc/{entry}/stat') as f:
+                        # Fields after the parenthesised command: state, ppid, ...
+                        parents[int(entry)] = int(f.read().rsplit(')', 1)[1].split()[1])
+                except OSError:
+                    continue
+    except OSError:
+        return None
+    tree, frontier = {pid}, [pid]
+    while frontier:
+        parent = frontier.pop()
+        children = [child for child, ppid in parents.items() if ppid == parent]
+        tree.update(children)
+        frontier.extend(children)
+    total = 0
+    for member in tree:
+        try:
+            with open(f'/proc/{member}/statm') as f:
+                total += int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except OSError:
+            continue
+    return total
+
+
+def measure(config, concurrency, duration, actions, dataset, seed):
+    worker_class, workers, threads = parse_config(config)
+    port = free_port()
+    process = start_server(port, workers, worker_class, threads)
+    try:
+        stats, elapsed = run('127.0.0.1', port, concurrency, duration, actions, dataset, seed)
+        rss = tree_rss(process.pid)
+    finally:
+        process.terminate()
+        process.wait()
+    summary = report(stats, elapsed)
+    errors = sum(stats.errors.values())
+    latencies = sorted(v for values in stats.latencies.values() for v in values)
+    return {
+        'config': config,
+        'requests': summary['requests'],
+        'throughput': summary['throughput'],
+        'p50_ms': latencies[len(latencies) // 2] * 1e3 if latencies else None,
+        'p95_ms': latencies[int(len(latencies) * 0.95)] * 1e3 if latencies else None,
+        'error_rate': errors / summary['requests'] if summary['requests'] else 0.0,
+        'rss_mb': rss / 2 ** 20 if rss is not None else None,
+    }
+
+
+def print_report(results, concurrency):
+    print(f"{concurrency} concurrent users")
+    print(f"{'config':<16}{'requests':>10}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'errors':>8}{'RSS MB':>9}")
+    for row in results:
+        rss = f"{row['rss_mb']:>9.0f}" if row['rss_mb'] is not None else f"{'-':>9}"
+        print(f"{row['config']:<16}{row['requests']:>10}{row['throughput']:>9.1f}"
+              f"{row['p50_ms'] or 0:>9.1f}{row['p95_ms'] or 0:>9.1f}{row['error_rate']:>8.1%}{rss}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare gunicorn worker classes and counts.")
+    parser.add_argument('--configs', nargs='+', default=DEFAULT_CONFIGS,
+                        help="worker_class:WORKERSxTHREADS, e.g. sync:4x1 gthread:2x4")
+    parser.add_argument('--concurrency', type=int, default=16, help="concurrent virtual users")
+    parser.add_argument('--duration', type=float, default=30, help="seconds per configuration")
+    parser.add_argument('--actions', type=int, default=20, help="user actions per page load")
+    parser.add_argument('--dataset', default='', help="dataset name to select (default: the server's default)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    results = [measure(config, args.concurrency, args.duration, args.actions, args.dataset, args.seed)
+               for config in args.configs]
+    print_report(results, args.concurrency)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'concurrency': args.concurrency, 'duration': args.duration, 'results': results}, f,
+                      indent=2)
+    return results
+
+
+if __name__ == '__main__':
+    main()
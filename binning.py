@@ -0,0 +1,87 @@
+"""Category columns derived from the raw columns with configurable bin edges.
+
+A binning scheme maps each derived column to its source column, its bin
+edges and one label per bin.  Edges are either explicit numbers or
+``{"quantiles": n}``, resolved against the loaded data so each bin holds a
+similar share of recipes.  Values are digitized with one ``searchsorted``
+per column straight into categorical codes.  The ``dataset`` scheme keeps
+the columns as they come in the CSV.
+
+Extra or replacement schemes can be given as JSON in ``RECIPE_BIN_SCHEMES``:
+
+    RECIPE_BIN_SCHEMES='{"quick": {"Time_Category": {"source": "minutes",
+        "edges": [15, 45], "labels": ["Quick", "Medium", "Long"]}}}'
+
+Columns a scheme leaves out keep their CSV values.
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+LEVELS = ['Low', 'Medium', 'High']
+NUTRIENT_LEVELS = ['protein', 'carbs', 'sugar', 'fat', 'calories']
+DERIVED_COLUMNS = ['Time_Category'] + [f'{n}_level' for n in NUTRIENT_LEVELS] + ['Rating_Category']
+
+
+def _scheme(time_edges, time_labels, levels, level_labels, rating_edges, rating_labels):
+    scheme = {'Time_Category': {'source': 'minutes', 'edges': time_edges, 'labels': time_labels}}
+    for nutrient in NUTRIENT_LEVELS:
+        scheme[f'{nutrient}_level'] = {'source': nutrient, 'edges': {'quantiles': levels}, 'labels': level_labels}
+    scheme['Rating_Category'] = {'source': 'rating', 'edges': rating_edges, 'labels': rating_labels}
+    return scheme
+
+
+BIN_SCHEMES = {
+    'dataset': {},
+    'standard': _scheme([30, 60, 120], ['Quick', 'Medium', 'Long', 'Very Long'],
+                        3, LEVELS, [3, 4], LEVELS),
+    'fine': _scheme([15, 30, 60, 120, 240], ['<15 min', '15-30 min', '30-60 min', '1-2 h', '2-4 h', '4 h+'],
+                    5, ['Very Low', 'Low', 'Medium', 'High', 'Very High'],
+                    [2, 3, 4, 5], ['1', '2', '3', '4', '5']),
+}
+BIN_SCHEMES.update(json.loads(os.environ.get("RECIPE_BIN_SCHEMES", "{}")))
+
+
+def default_scheme(df):
+    # Keep the CSV's own categories when it has them
+    env = os.environ.get("BIN_SCHEME")
+    if env:
+        return env
+    return 'dataset' if all(column in df.columns for column in DERIVED_COLUMNS) else 'standard'
+
+
+def resolve_scheme(df, name, quantiles=None):
+    # Concrete edges for this data: quantile edges become numbers, exact over
+    # df unless quantiles(source, qs) estimates them (df is then unused)
+    resolved = {}
+    for column, spec in BIN_SCHEMES[name].items():
+        edges = spec['edges']
+        if isinstance(edges, dict):
+            inner = np.linspace(0, 1, edges['quantiles'] + 1)[1:-1]
+            if quantiles is None:
+                edges = np.nanquantile(df[spec['source']].to_numpy(dtype=np.float64), inner).tolist()
+            else:
+                edges = list(quantiles(spec['source'], inner))
+        if len(spec['labels']) != len(edges) + 1:
+            raise ValueError(f"{name}.{column}: {len(edges)} edges need {len(edges) + 1} labels")
+        resolved[column] = (spec['source'], tuple(float(e) for e in edges), tuple(spec['labels']))
+    return resolved
+
+
+def bin_key(resolved):
+    # Hashable identity of a resolved scheme, for caches
+    return tuple(sorted(resolved.items()))
+
+
+def apply_bins(df, resolved):
+    if not resolved:
+        return df
+    columns = {}
+    for column, (source, edges, labels) in resolved.items():
+        values = df[source].to_numpy(dtype=np.float64)
+        codes = np.searchsorted(np.asarray(edges), values, side='right').astype(np.int8)
+        codes[np.isnan(values)] = -1
+        columns[column] = pd.Categorical.from_codes(codes, categories=list(labels), ordered=True)
+    return df.assign(**columns)
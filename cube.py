@@ -0,0 +1,226 @@
+"""Rollup cube of nutrient aggregates over the categorical dimensions.
+
+The base cube has one cell per combination of ``DIMENSIONS`` codes and keeps,
+per nutrient, the count, sum and sum of squares of the recipes in it, plus a
+KLL sketch.  Any heat map grouping (a row dimension against one column
+dimension or several combined) is a sum over the other axes of those
+arrays, and its quantiles are the base sketches merged per target cell, so
+regrouping never goes back over the rows.
+
+``CellRows`` keeps the row positions of each base cell, ordered by row and
+(on first use) by any sort column, so a page of a heat map cell's recipes
+only touches the first ``offset + size`` rows of each base cell feeding it.
+"""
+import numpy as np
+import pandas as pd
+
+from aggregates import nutrients
+from quantile_sketch import DEFAULT_K, INGEST_CHUNK_ROWS, CellSketches, KLLSketch
+
+DIMENSIONS = ['Time_Category', 'Diet_Type', 'Category', 'Rating_Category']
+# Heat map column groupings (the app's group options) -> cube dimensions
+GROUPINGS = {
+    'Diet_Type': ('Diet_Type',),
+    'Category': ('Category',),
+    'Rating_Category': ('Rating_Category',),
+    'Time_Category': ('Time_Category',),
+    'both': ('Diet_Type', 'Category'),
+}
+COMBINED_SEPARATOR = ' / '
+
+
+def dimension_codes(column):
+    # Codes in display order: category order for categoricals, sorted otherwise
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return column.cat.codes.to_numpy(), list(column.cat.categories)
+    codes, uniques = pd.factorize(column, sort=True)
+    return codes, list(uniques)
+
+
+class RollupCube:
+    def __init__(self, dimensions, labels, k=DEFAULT_K):
+        self.dimensions = list(dimensions)
+        self.labels = labels
+        self.shape = tuple(len(labels[d]) for d in self.dimensions)
+        self.k = k
+        size = (len(nutrients),) + self.shape
+        self.count = np.zeros(size)
+        self.total = np.zeros(size)
+        self.squares = np.zeros(size)
+        self.sketches = {}
+        self.rows = None
+        self._regrouped = {}
+
+    @classmethod
+    def from_frame(cls, df, dimensions=DIMENSIONS, chunk_rows=INGEST_CHUNK_ROWS, k=DEFAULT_K):
+        dimensions = [d for d in dimensions if d in df.columns]
+        coded = {d: dimension_codes(df[d]) for d in dimensions}
+        cube = cls(dimensions, {d: labels for d, (_, labels) in coded.items()}, k)
+        codes = np.stack([coded[d][0] for d in dimensions])
+        keep = (codes >= 0).all(axis=0)
+        cells = np.full(len(df), -1, dtype=np.int64)
+        cells[keep] = np.ravel_multi_index(codes[:, keep], cube.shape)
+        for start in range(0, len(df), chunk_rows):
+            chunk = slice(start, start + chunk_rows)
+            cube.ingest(cells[chunk], df[nutrients].iloc[chunk].to_numpy(dtype=np.float64))
+        cube.rows = CellRows(df, cells, int(np.prod(cube.shape)))
+        return cube
+
+    def ingest(self, cells, values):
+        # cells: flat base-cell index per row (-1 to skip); values: rows x nutrients
+        keep = cells >= 0
+        cells, values = cells[keep], values[keep]
+        size = int(np.prod(self.shape))
+        present = ~np.isnan(values)
+        filled = np.where(present, values, 0.0)
+        for i in range(len(nutrients)):
+            self.count[i].flat += np.bincount(cells, weights=present[:, i], minlength=size)
+            self.total[i].flat += np.bincount(cells, weights=filled[:, i], minlength=size)
+            self.squares[i].flat += np.bincount(cells, weights=filled[:, i] ** 2, minlength=size)
+        order = np.argsort(cells, kind='stable')
+        starts = np.flatnonzero(np.r_[True, np.diff(cells[order]) != 0])
+        for rows in np.split(order, starts[1:]):
+            if not len(rows):
+                continue
+            cell = int(cells[rows[0]])
+            for i, nutrient in enumerate(nutrients):
+                key = (nutrient, cell)
+                if key not in self.sketches:
+                    self.sketches[key] = KLLSketch(self.k, seed=cell * len(nutrients) + i)
+                self.sketches[key].update(values[rows, i])
+        self._regrouped.clear()
+        return self
+
+    def _target(self, index, grouping):
+        # Row dimension followed by the column dimensions of the grouping
+        columns = GROUPINGS[grouping]
+        target = [index] + list(columns)
+        for d in target:
+            if d not in self.dimensions:
+                raise KeyError(f"{d} is not a cube dimension")
+        return target, columns
+
+    def _rolled(self, arrays, target):
+        # Sum out the dimensions not in the target; a dimension repeated in
+        # the target (rows and columns alike) only keeps its diagonal
+        unique = list(dict.fromkeys(target))
+        axes = tuple(1 + i for i, d in enumerate(self.dimensions) if d not in unique)
+        shape = tuple(len(self.labels[d]) for d in target)
+        grid = np.indices(shape)
+        order = [d for d in self.dimensions if d in unique]
+        take = tuple(grid[target.index(d)] for d in order)
+        diagonal = np.ones(shape, dtype=bool)
+        for i, d in enumerate(target):
+            diagonal &= grid[i] == grid[target.index(d)]
+        rolled = []
+        for array in arrays:
+            summed = array.sum(axis=axes)
+            rolled.append(np.where(diagonal, summed[(slice(None),) + take], 0.0))
+        return rolled
+
+    def _labels(self, columns):
+        if len(columns) == 1:
+            return list(self.labels[columns[0]])
+        codes = np.indices([len(self.labels[d]) for d in columns]).reshape(len(columns), -1)
+        return [COMBINED_SEPARATOR.join(str(self.labels[d][c]) for d, c in zip(columns, cell))
+                for cell in codes.T]
+
+    def pivots(self, nutrient, index='Time_Category', grouping='Diet_Type'):
+        # Mean, sample standard deviation and count, like aggregates.nutrient_pivots
+        target, columns = self._target(index, grouping)
+        count, total, squares = self._rolled((self.count, self.total, self.squares), target)
+        i = nutrients.index(nutrient)
+        rows = len(self.labels[index])
+        count, total, squares = (a[i].reshape(rows, -1) for a in (count, total, squares))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = total / count
+            std = np.sqrt(np.maximum(squares - total * mean, 0) / (count - 1))
+        std[count < 2] = np.nan
+        count = np.where(count > 0, count, np.nan)
+        frames = [pd.DataFrame(a, index=pd.Index(self.labels[index], name=index),
+                               columns=pd.Index(self._labels(columns), name=grouping))
+                  for a in (mean, std, count)]
+        # Like pivot_table(observed=True): only rows and columns with recipes
+        observed = frames[2].notna()
+        return tuple(f.loc[observed.any(axis=1), observed.any(axis=0)] for f in frames)
+
+    def cell_sketches(self, index='Time_Category', grouping='Diet_Type'):
+        # Base sketches merged per target cell, as a CellSketches
+        key = (index, grouping)
+        if key not in self._regrouped:
+            _, columns = self._target(index, grouping)
+            sketches = CellSketches(self.k, index=index, columns=grouping)
+            for (nutrient, cell), sketch in self.sketches.items():
+                coords = dict(zip(self.dimensions, np.unravel_index(cell, self.shape)))
+                row = self.labels[index][coords[index]]
+                if len(columns) == 1:
+                    col = self.labels[columns[0]][coords[columns[0]]]
+                else:
+                    col = COMBINED_SEPARATOR.join(str(self.labels[d][coords[d]]) for d in columns)
+                sketches._sketch(nutrient, row, col).merge(sketch)
+            self._regrouped[key] = sketches
+        return self._regrouped[key]
+
+    def base_cells(self, index, grouping, row, column):
+        # Flat base cells that roll up into one (row, column) heat map cell
+        _, columns = self._target(index, grouping)
+        labels = [str(label) for label in self._labels(columns)]
+        if str(column) not in labels or str(row) not in map(str, self.labels[index]):
+            return np.empty(0, dtype=np.int64)
+        wanted = [(index, [str(label) for label in self.labels[index]].index(str(row)))]
+        codes = np.unravel_index(labels.index(str(column)), [len(self.labels[d]) for d in columns])
+        wanted += list(zip(columns, codes))
+        grid = np.indices(self.shape).reshape(len(self.shape), -1)
+        match = np.ones(grid.shape[1], dtype=bool)
+        for d, code in wanted:
+            match &= grid[self.dimensions.index(d)] == code
+        return np.flatnonzero(match)
+
+
+def sort_key(values):
+    # Numeric sort values, missing ones lowest; text sorts by factorized code
+    if pd.api.types.is_numeric_dtype(values):
+        key = values.to_numpy(dtype=np.float64)
+        return np.where(np.isnan(key), -np.inf, key)
+    return pd.factorize(values, sort=True)[0].astype(np.float64)
+
+
+def ranked(positions, key, descending=False):
+    # positions by key in either direction; ties always by ascending position
+    return positions[np.lexsort((positions, -key if descending else key))]
+
+
+class CellRows:
+    def __init__(self, df, cells, size):
+        self.df = df
+        self.cells = cells
+        counts = np.bincount(cells[cells >= 0], minlength=size)
+        # Rows with a missing dimension (cell -1) sort first and are skipped
+        self.starts = np.r_[0, np.cumsum(counts)] + np.count_nonzero(cells < 0)
+        self._orders = {(None, False): np.argsort(cells, kind='stable')}
+        self._keys = {}
+
+    def sort_key(self, column):
+        if column not in self._keys:
+            self._keys[column] = sort_key(self.df[column])
+        return self._keys[column]
+
+    def order(self, column=None, descending=False):
+        # Row positions grouped by cell, by ``column`` within each cell (by
+        # position without one), ties by ascending position
+        if (column, descending) not in self._orders:
+            key = np.arange(len(self.cells), dtype=np.float64) if column is None else self.sort_key(column)
+            self._orders[column, descending] = np.lexsort((-key if descending else key, self.cells))
+        return self._orders[column, descending]
+
+    def count(self, cells):
+        return int(sum(self.starts[c + 1] - self.starts[c] for c in cells))
+
+    def page(self, cells, offset, size, sort_by=None, descending=False):
+        # Merge the first offset + size rows of each cell, then slice the page
+        order = self.order(sort_by, descending)
+        end = offset + size
+        heads = [order[self.starts[c]:self.starts[c + 1]][:end] for c in cells]
+        rows = np.concatenate(heads) if heads else np.empty(0, dtype=np.int64)
+        key = rows.astype(np.float64) if sort_by is None else self.sort_key(sort_by)[rows]
+        return ranked(rows, key, descending)[offset:end]
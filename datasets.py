@@ -0,0 +1,495 @@
+"""Named recipe datasets, each with its own engine, loaded on first use.
+
+A ``RecipeDataset`` owns everything derived from one export: the scored
+frame, the sidebar names, its figure snapshots and the per-settings figure
+cache.  With ``RECIPE_STORAGE=sqlite`` the export lives in an indexed SQLite
+file instead (see ``sqlite_store.py``) and the scored frame is a resident
+sample of it.  ``DatasetRegistry`` loads datasets lazily and evicts the least
+recently used ones once their combined footprint exceeds the memory budget.
+The footprint includes everything built since the load (cubes, sketches,
+query backend copies, per-scheme stores, cached figures) and is re-checked
+every ``BUDGET_CHECK_SECONDS``, not only when a dataset loads.
+
+A loaded dataset is one immutable data version: its frames are never
+modified, only memoized results are added, under locks, so callbacks can
+share it across gunicorn threads.  When a dataset's CSV changes, the next
+version is built on a background thread while the old one keeps serving,
+then swapped in with a single assignment; requests already holding the old
+version finish on it.
+"""
+from collections import OrderedDict
+import contextlib
+import hashlib
+import logging
+import os
+import sys
+import threading
+import time
+import types
+
+import numpy as np
+import pandas as pd
+
+from binning import BIN_SCHEMES, apply_bins, bin_key, resolve_scheme
+from cube import COMBINED_SEPARATOR, GROUPINGS, ranked, sort_key
+from recipe_data import (
+    CATEGORIES, DATASETS, DEFAULT_DATASET, DEFAULT_SETTINGS, HealthScorer,
+    read_recipes, settings_from_key, sidebar_recipe_names
+)
+from figure_encoding import encode_trace
+from locks import ForkSafeLock
+from ranks import RANK_COLUMNS, RANK_GROUP, permille_ranks, row_ranks
+from recipe_visualizations import FIGURE_LOCK, explorer_scatter_figure
+from sampling import POINT_BUDGET
+from session_store import sessions
+from shared_cache import shared_cache
+from snapshots import SNAPSHOT_DIR, SnapshotStore, dataset_fingerprint, render_snapshot, serialize_output
+from spatial_index import GridIndex
+from sqlite_store import STORAGE, RecipeDB, SQLiteQuery, cell_conditions, in_range
+
+MEMORY_BUDGET = int(float(os.environ.get("DATASET_MEMORY_BUDGET_MB", 2048)) * 2**20)
+# Most explorer points sent for one zoomed-in viewport
+VIEWPORT_POINTS = int(os.environ.get("EXPLORER_VIEWPORT_POINTS", POINT_BUDGET or 20000))
+# Health figures drawn from every recipe, and the base columns they read
+WHOLE_DATA_FIGURES = {'health-rating-bar': ['Rating_Category']}
+# Seconds between re-measurements of the loaded datasets against the budget
+BUDGET_CHECK_SECONDS = 10
+# Seconds between checks of a loaded dataset's CSV for a new version (0: never)
+REFRESH_SECONDS = float(os.environ.get("DATASET_REFRESH_SECONDS", 30))
+
+logger = logging.getLogger(__name__)
+
+
+def entries(container):
+    # A copy of a container other request threads may be adding to.  The copy
+    # runs in C without giving up the GIL; the retry covers the rare case
+    # where an entry's __eq__ or a free-threaded build lets a writer in
+    for _ in range(8):
+        try:
+            return list(container.items()) if isinstance(container, dict) else list(container)
+        except RuntimeError:
+            continue
+    return []
+
+
+def state(value):
+    # An object's attributes, each with a copy of its entries if it is a
+    # container; taken under the object's own lock when it has one
+    lock = getattr(value, '_lock', None)
+    with lock if isinstance(lock, ForkSafeLock) else contextlib.nullcontext():
+        return [(attr, entries(attr) if isinstance(attr, (dict, list, set)) else None)
+                for attr in entries(vars(value).values())]
+
+
+def footprint(value, seen, items=None):
+    # Rough resident bytes of value and all it references, each object once.
+    # Frames count shallow: derived frames share the base frame's strings.
+    # Containers are walked from copies of their entries (items, when the
+    # caller took one), so concurrent inserts are harmless
+    if id(value) in seen or isinstance(value, (type, types.ModuleType, types.FunctionType, types.MethodType)):
+        return 0
+    seen.add(id(value))
+    if isinstance(value, (np.ndarray, pd.api.extensions.ExtensionArray)):
+        return int(value.nbytes)
+    if isinstance(value, (pd.DataFrame, pd.Series, pd.Index)):
+        usage = value.memory_usage(deep=False)
+        return int(usage.sum() if isinstance(usage, pd.Series) else usage)
+    if hasattr(value, 'estimated_size'):
+        # Polars frames
+        return int(value.estimated_size())
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(footprint(k, seen) + footprint(v, seen) for k, v in (entries(value) if items is None else items))
+    if isinstance(value, (list, tuple, set, frozenset)):
+        items = entries(value) if items is None else items
+        if items and isinstance(items[0], (int, float, str)):
+            # Figure JSON holds long lists of numbers; estimate from the first
+            return sys.getsizeof(value) + len(items) * sys.getsizeof(items[0])
+        return sys.getsizeof(value) + sum(footprint(item, seen) for item in items)
+    if hasattr(value, '__dict__'):
+        return sys.getsizeof(value) + sum(footprint(attr, seen, items) for attr, items in state(value))
+    return sys.getsizeof(value)
+
+
+def source_stamp(path):
+    # Cheap change check; the fingerprint hashes the whole file
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class RecipeDataset:
+    def __init__(self, name, path, figure_cache_size=8, storage=STORAGE):
+        self.name = name
+        self.path = path
+        # Taken first: a file replaced during the load is picked up next check
+        self.stamp = source_stamp(path)
+        self.fingerprint = dataset_fingerprint(path)
+        self.db = None
+        if storage == 'sqlite':
+            self.db = RecipeDB.open(path, self.fingerprint)
+            base = self.db.resident().drop(columns=['Health_Score', 'Category'])
+            base.attrs['bin_scheme'] = self.db.scheme
+            # Charts from the resident sample must not pass for full-data snapshots
+            self.fingerprint = f"{self.fingerprint}:sqlite-{len(base)}"
+        else:
+            base = read_recipes(path)
+        self.scorer = HealthScorer(base)
+        self.df = self.scorer.apply()
+        self.sidebar_names = self.db.sidebar_names() if self.db else sidebar_recipe_names(self.df)
+        self.snapshots = SnapshotStore(self.df, self.fingerprint, os.path.join(SNAPSHOT_DIR, name),
+                                       query=SQLiteQuery(self.db) if self.db else None)
+        self.default_bins = self.scorer.base.attrs.get('bin_scheme', 'dataset')
+        self.figure_cache_size = figure_cache_size
+        self._figures = OrderedDict()
+        self._memo = {}
+        self._lock = ForkSafeLock()
+        # The base owns the strings every derived frame points at
+        self._base_bytes = int(self.scorer.base.memory_usage(deep=True).sum())
+        self.ranks()
+
+    @property
+    def nbytes(self):
+        # The base plus everything derived from it so far
+        return self._base_bytes + footprint(self, {id(self.scorer.base)})
+
+    def cached(self, key, compute):
+        # Derived structures that only depend on this dataset's data version;
+        # concurrent first requests may both compute, the first result is kept
+        with self._lock:
+            if key in self._memo:
+                return self._memo[key]
+        value = compute()
+        with self._lock:
+            return self._memo.setdefault(key, value)
+
+    @property
+    def query(self):
+        # Query backend (QUERY_BACKEND, or SQL on the SQLite store) for the default settings
+        return self.snapshots.query
+
+    def shared(self, key, compute):
+        # JSON-able results shared with the other workers, per data version
+        return shared_cache.get_or_compute(f"{self.fingerprint}:{key}", compute)
+
+    def bin_schemes(self):
+        # The CSV's own columns are gone once another scheme was applied at load
+        return [name for name in BIN_SCHEMES if name != 'dataset' or self.default_bins == 'dataset']
+
+    def bins(self, scheme):
+        # Resolved edges for a scheme, or None for the one the frame was loaded with
+        if scheme in (None, self.default_bins) or scheme not in self.bin_schemes():
+            return None
+        return self.cached(('bins', scheme), lambda: resolve_scheme(self.df, scheme))
+
+    def bin_tag(self, scheme):
+        resolved = self.bins(scheme)
+        if resolved is None:
+            return ''
+        return f"bins-{scheme}-{hashlib.sha256(repr(bin_key(resolved)).encode()).hexdigest()[:12]}"
+
+    def store(self, scheme=None):
+        # Figure store for a binning scheme; binned frames are cached per scheme
+        resolved = self.bins(scheme)
+        if resolved is None:
+            return self.snapshots
+        return self.cached(('store', bin_key(resolved)), lambda: SnapshotStore(
+            apply_bins(self.df, resolved), f"{self.fingerprint}:{self.bin_tag(scheme)}",
+            directory=None, sample=self.snapshots.sample))
+
+    def scoring(self, key=DEFAULT_SETTINGS):
+        # (scores, in-range mask, category codes) over the base rows
+        return self.scorer.scoring(*settings_from_key(key))
+
+    def scored_rows(self, key, rows=None, columns=None):
+        # Scored frame of just the base positions and columns a caller needs
+        return self.scorer.frame(*settings_from_key(key), rows=rows, columns=columns)
+
+    def sample_rows(self):
+        # Base positions of the shared chart sample, or None for every row
+        sample = self.snapshots.sample
+        if sample is None:
+            return None
+        return self.cached('sample-rows', lambda: self.scorer.base.index.get_indexer(sample))
+
+    def ranks(self):
+        # uint16 permille ranks aligned with the default-settings frame
+        return self.cached('ranks', lambda: permille_ranks(self.df))
+
+    def _rank_values(self):
+        base = self.scorer.base
+        values = {column: base[column].to_numpy(dtype=np.float64)
+                  for column in RANK_COLUMNS if column in base.columns}
+        codes, uniques = pd.factorize(base[RANK_GROUP]) if RANK_GROUP in base.columns else (None, None)
+        return values, codes, uniques
+
+    def recipe_ranks(self, key, row):
+        # Ranks of one looked-up recipe.  Default settings read the table;
+        # otherwise, and for SQLite rows that may not be resident, the recipe
+        # is ranked against the in-range base rows on the spot
+        if self.db is None and key == DEFAULT_SETTINGS:
+            return self.ranks().loc[row.name]
+        scores, keep, _ = self.scoring(key)
+        values, codes, uniques = self.cached('rank-values', self._rank_values)
+        return row_ranks(dict(values, Health_Score=scores), row, keep, codes, uniques)
+
+    def _lru(self, name, key, compute):
+        # Per-settings results, bounded to the most recent few
+        with self._lock:
+            if (name, key) in self._figures:
+                self._figures.move_to_end((name, key))
+                return self._figures[name, key]
+        value = compute()
+        with self._lock:
+            value = self._figures.setdefault((name, key), value)
+            self._figures.move_to_end((name, key))
+            if len(self._figures) > self.figure_cache_size:
+                self._figures.popitem(last=False)
+        return value
+
+    def health_figure(self, name, key=DEFAULT_SETTINGS, scheme=None):
+        if key == DEFAULT_SETTINGS:
+            return self.store(scheme).get(name)
+        tag = self.bin_tag(scheme)
+        return self._lru((name, tag), key, lambda: self.shared(
+            f"{name}:{key}:{tag}", lambda: self._render_health_figure(name, key, scheme)))
+
+    def _render_health_figure(self, name, key, scheme=None):
+        # Point charts score only the sample's rows; the others read every
+        # row but only the columns they plot
+        resolved = self.bins(scheme)
+        if name in WHOLE_DATA_FIGURES:
+            columns = WHOLE_DATA_FIGURES[name]
+            if resolved is not None:
+                resolved = {column: bins for column, bins in resolved.items() if column in columns}
+                columns = columns + [source for source, _, _ in resolved.values()]
+            scored = self.scored_rows(key, columns=dict.fromkeys(columns))
+        else:
+            scored = self.scored_rows(key, rows=self.sample_rows())
+        if resolved is not None:
+            scored = apply_bins(scored, resolved)
+        if name == 'scatter-plot':
+            _, thresholds = settings_from_key(key)
+            with FIGURE_LOCK:
+                return serialize_output(name, explorer_scatter_figure(scored, thresholds))
+        return render_snapshot(scored, name, sample=self.snapshots.sample)
+
+    def lookup(self, key, names):
+        # Rows for a batch of recipe names (first recipe per name), in the given
+        # order; one get_indexer call against a cached unique-name index
+        if self.db is not None:
+            rows = self.db.lookup(names, key)
+            if key == DEFAULT_SETTINGS:
+                return rows
+            return HealthScorer(rows.drop(columns=['Health_Score', 'Category'])).apply(*settings_from_key(key))
+        _, keep, _ = self.scoring(key)
+        index, order, starts = self.cached('name-index', self._name_index)
+        rows = []
+        for code in index.get_indexer(pd.unique(pd.Series(names, dtype=object))):
+            if code >= 0:
+                # First in-range recipe of that name
+                segment = order[starts[code]:starts[code + 1]]
+                segment = segment[keep[segment]]
+                if len(segment):
+                    rows.append(segment[0])
+        return self.scored_rows(key, rows=np.array(rows, dtype=np.int64))
+
+    def _name_index(self):
+        # Unique names, and base positions grouped by name in row order
+        codes, uniques = pd.factorize(self.scorer.base['name'])
+        order = np.argsort(codes, kind='stable')
+        starts = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+        return pd.Index(uniques), order, starts
+
+    def record(self, key, point):
+        # The recipe behind a figure point id (its row label), or None
+        if self.db is not None:
+            rows = self.db.record(point)
+            # Rescored even for the defaults: out-of-range rows are stored too
+            if rows is not None:
+                rows = HealthScorer(rows.drop(columns=['Health_Score', 'Category'])).apply(*settings_from_key(key))
+            return rows.iloc[0] if rows is not None and len(rows) else None
+        position = self.scorer.base.index.get_indexer([point])
+        rows = self.scored_rows(key, rows=position[position >= 0])
+        return rows.iloc[0] if len(rows) else None
+
+    def drilldown(self, scheme, grouping, row, column, offset, size, sort_by=None, descending=False, within=None):
+        # One page of the recipes behind a heat map cell, and how many there
+        # are; within: a per-user subset (e.g. the explorer selection) the
+        # heat map is limited to, small enough to filter and sort in memory
+        if within is not None:
+            cell = within[self._cell_mask(within, grouping, row, column)]
+            positions = np.arange(len(cell))
+            key = positions.astype(np.float64) if sort_by is None else sort_key(cell[sort_by])
+            return len(cell), cell.iloc[ranked(positions, key, descending)[offset:offset + size]]
+        if self.db is not None:
+            index, group = grouping
+            columns = GROUPINGS[group]
+            values = [column] if len(columns) == 1 else str(column).split(COMBINED_SEPARATOR)
+            conditions = cell_conditions(zip([index, *columns], [row, *values]), self.bins(scheme)) + [in_range()]
+            return self.db.page(conditions, offset, size, sort_by, descending)
+        cube = self.store(scheme).cube
+        cells = cube.base_cells(*grouping, row, column)
+        positions = cube.rows.page(cells, offset, size, sort_by, descending)
+        return cube.rows.count(cells), cube.rows.df.iloc[positions]
+
+    @staticmethod
+    def _cell_mask(frame, grouping, row, column):
+        # Rows of frame in a heat map cell; labels arrive as clickData strings
+        index, group = grouping
+        columns = GROUPINGS[group]
+        values = [column] if len(columns) == 1 else str(column).split(COMBINED_SEPARATOR)
+        mask = (frame[index].astype(str) == str(row)).to_numpy()
+        for name, value in zip(columns, values):
+            mask &= (frame[name].astype(str) == str(value)).to_numpy()
+        return mask
+
+    def save_rows(self, session, name, frame):
+        # A subset of any frame derived from this dataset, kept server-side;
+        # SQLite-backed frames are already indexed by table position
+        if self.db is not None:
+            positions, universe = frame.index.to_numpy(), self.db.rows
+        else:
+            base = self.scorer.base.index
+            positions, universe = base.get_indexer(frame.index), len(base)
+        sessions.put_rows(session, self.fingerprint, name, positions, universe)
+
+    def load_rows(self, session, name, scheme=None):
+        # The saved subset with default settings, binned by ``scheme``, or
+        # None if nothing is saved
+        positions = sessions.get_rows(session, self.fingerprint, name)
+        if positions is None:
+            return None
+        if self.db is None:
+            frame = self.store(scheme).df
+            return frame[frame.index.isin(self.scorer.base.index[positions])]
+        rows = self.db.take(positions)
+        return rows if self.bins(scheme) is None else apply_bins(rows, self.bins(scheme))
+
+    def explorer_window(self, key, x_range=None, y_range=None, budget=VIEWPORT_POINTS):
+        # Explorer points inside the viewport at full resolution, up to the budget,
+        # as encoded trace data per health category
+        scores, keep, codes = self.scoring(key)
+        calories = self.scorer.calories
+
+        def build():
+            rows = np.flatnonzero(keep)
+            return rows, GridIndex(calories[rows], scores[rows])
+
+        rows, index = self._lru('explorer-index', key, build)
+        window = rows[index.query(x_range, y_range, budget)]
+        labels = self.scorer.base.index.to_numpy()
+        traces = {}
+        for code in pd.unique(codes[window]):
+            members = window[codes[window] == code]
+            traces[CATEGORIES[code]] = encode_trace({
+                'x': calories[members],
+                'y': scores[members],
+                'customdata': labels[members][:, None],
+            })
+        return traces
+
+
+class DatasetRegistry:
+    def __init__(self, paths=DATASETS, memory_budget=MEMORY_BUDGET, refresh_seconds=REFRESH_SECONDS):
+        self.paths = paths
+        self.memory_budget = memory_budget
+        self.refresh_seconds = refresh_seconds
+        self._loaded = OrderedDict()
+        self._checked = {}
+        self._budget_checked = time.monotonic()
+        self._reset_locks()
+        # A worker forked mid-load must not inherit locks held by a thread it lacks
+        os.register_at_fork(after_in_child=self._reset_locks)
+
+    def _reset_locks(self):
+        self._lock = threading.Lock()
+        self._loading = {name: threading.Lock() for name in self.paths}
+
+    def names(self):
+        return list(self.paths)
+
+    def resolve(self, name):
+        return name if name in self.paths else DEFAULT_DATASET
+
+    def get(self, name):
+        name = self.resolve(name)
+        with self._lock:
+            if name in self._loaded:
+                self._loaded.move_to_end(name)
+                dataset = self._loaded[name]
+            else:
+                dataset = None
+        if dataset is not None:
+            self._maybe_refresh(name, dataset)
+            self._check_budget(name)
+            return dataset
+
+        # One loader per dataset; other datasets keep serving meanwhile
+        with self._loading[name]:
+            with self._lock:
+                if name in self._loaded:
+                    return self._loaded[name]
+            dataset = RecipeDataset(name, self.paths[name])
+            with self._lock:
+                self._loaded[name] = dataset
+                self._evict(keep=name)
+        return dataset
+
+    def _maybe_refresh(self, name, dataset):
+        # Datasets are never mutated: a changed CSV is loaded into a new
+        # RecipeDataset in the background, and requests keep the old one until
+        # it is swapped in whole
+        if not self.refresh_seconds:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if now - self._checked.get(name, 0) < self.refresh_seconds:
+                return
+            self._checked[name] = now
+        stamp = source_stamp(dataset.path)
+        if stamp is None or stamp == dataset.stamp:
+            return
+        # Busy loading means a rebuild is already on its way
+        if self._loading[name].acquire(blocking=False):
+            threading.Thread(target=self._reload, args=(name,), daemon=True).start()
+
+    def _reload(self, name):
+        try:
+            dataset = RecipeDataset(name, self.paths[name])
+            with self._lock:
+                # Dropped while loading: the next request loads it fresh
+                if name in self._loaded:
+                    self._loaded[name] = dataset
+                    self._evict(keep=name)
+            logger.info("Reloaded dataset %s as %s", name, dataset.fingerprint)
+        except Exception:
+            logger.exception("Reloading dataset %s failed; keeping the loaded version", name)
+        finally:
+            self._loading[name].release()
+
+    def _check_budget(self, keep):
+        # Datasets grow as figures, cubes and backends are built on use
+        now = time.monotonic()
+        with self._lock:
+            if now - self._budget_checked < BUDGET_CHECK_SECONDS:
+                return
+            self._budget_checked = now
+            self._evict(keep)
+
+    def _evict(self, keep):
+        sizes = {name: dataset.nbytes for name, dataset in self._loaded.items()}
+        for cold in list(self._loaded):
+            if len(self._loaded) == 1 or sum(sizes.values()) <= self.memory_budget:
+                break
+            if cold != keep:
+                del self._loaded[cold]
+                del sizes[cold]
+
+    def memory_used(self):
+        return sum(dataset.nbytes for dataset in self._loaded.values())
+
+    def loaded(self):
+        with self._lock:
+            return list(self._loaded)
@@ -0,0 +1,73 @@
+"""Chunked CSV / Parquet export of filtered recipes.
+
+Only the matching row positions are materialized up front; rows are then
+read from the dataset's query backend (``take``), encoded and handed to the
+client one fixed-size chunk at a time, so memory stays flat however many
+recipes match.
+"""
+import io
+
+import numpy as np
+
+EXPORT_CHUNK_ROWS = 10000
+
+# Query parameter -> column for the categorical filters
+FILTER_COLUMNS = {'category': 'Category', 'diet': 'Diet_Type', 'time': 'Time_Category'}
+
+
+def filter_rows(df, filters=None, calories_min=None, calories_max=None):
+    # filters: {column: allowed values}; empty value lists do not filter
+    mask = np.ones(len(df), dtype=bool)
+    for column, values in (filters or {}).items():
+        if values:
+            mask &= df[column].isin(values).to_numpy()
+    calories = df['calories'].to_numpy()
+    if calories_min is not None:
+        mask &= calories >= calories_min
+    if calories_max is not None:
+        mask &= calories <= calories_max
+    return np.flatnonzero(mask)
+
+
+def iter_chunks(source, rows, chunk_rows=EXPORT_CHUNK_ROWS):
+    # source: a query backend, whose take() reads recipes by position
+    for start in range(0, len(rows), chunk_rows):
+        yield source.take(rows[start:start + chunk_rows])
+
+
+def iter_csv(source, rows, chunk_rows=EXPORT_CHUNK_ROWS):
+    yield source.head(0).to_csv(index=False)
+    for chunk in iter_chunks(source, rows, chunk_rows):
+        yield chunk.to_csv(index=False, header=False)
+
+
+class _Drain(io.RawIOBase):
+    # Write-only sink whose buffered bytes are handed out after each row group
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.buffer += data
+        return len(data)
+
+    def drain(self):
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+def iter_parquet(source, rows, chunk_rows=EXPORT_CHUNK_ROWS):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # Infer column types from real rows; an empty frame would type strings as null
+    schema = pa.Schema.from_pandas(source.head(1000), preserve_index=False)
+    sink = _Drain()
+    with pq.ParquetWriter(sink, schema) as writer:
+        for chunk in iter_chunks(source, rows, chunk_rows):
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            yield sink.drain()
+    yield sink.drain()
@@ -0,0 +1,195 @@
+"""Compact wire encoding for point-heavy figures.
+
+Works on JSON-decoded figure dicts.  Numeric trace arrays are rounded to a
+configurable number of significant digits and sent as base64 typed arrays,
+narrowed to float32 or a small integer type when that loses nothing at the
+chosen precision.  String columns are pulled out of ``customdata`` into
+``text`` so the numeric rest can be typed too, and arrays holding a single
+repeated string collapse to a scalar.
+"""
+import argparse
+import base64
+import json
+import os
+import re
+
+import numpy as np
+from plotly.io.json import to_json_plotly
+
+SIGNIFICANT_DIGITS = int(os.environ.get("FIGURE_SIGNIFICANT_DIGITS", 6))
+
+# Point clouds worth the encoding pass
+ENCODED_FIGURES = ('scatter-plot', 'health-rating-scatter', 'time-vs-rating', 'steps-vs-rating')
+
+# Trace attributes holding one value per point
+DATA_ARRAYS = ('x', 'y', 'z', 'customdata')
+# Per-point attributes plotly.js also accepts as a single scalar
+SCALAR_OK = ('text', 'hovertext')
+
+_TYPED = {
+    'f4': np.float32, 'f8': np.float64,
+    'i1': np.int8, 'i2': np.int16, 'i4': np.int32,
+    'u1': np.uint8, 'u2': np.uint16, 'u4': np.uint32,
+}
+_SHORT = {np.dtype(v): k for k, v in _TYPED.items()}
+
+
+def decode_array(value):
+    if isinstance(value, dict) and 'bdata' in value:
+        arr = np.frombuffer(base64.b64decode(value['bdata']), dtype=_TYPED[value['dtype']])
+        if 'shape' in value:
+            arr = arr.reshape([int(n) for n in str(value['shape']).split(',')])
+        return arr
+    return value
+
+
+def typed_array(arr):
+    spec = {'dtype': _SHORT[arr.dtype], 'bdata': base64.b64encode(np.ascontiguousarray(arr)).decode('ascii')}
+    if arr.ndim > 1:
+        spec['shape'] = ', '.join(str(n) for n in arr.shape)
+    return spec
+
+
+def round_significant(arr, digits=SIGNIFICANT_DIGITS):
+    arr = np.asarray(arr, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        magnitude = np.floor(np.log10(np.abs(arr)))
+    magnitude[~np.isfinite(magnitude)] = 0
+    scale = 10.0 ** (digits - 1 - magnitude)
+    return np.round(arr * scale) / scale
+
+
+def narrow_numeric(arr, digits=SIGNIFICANT_DIGITS):
+    if arr.dtype.kind in 'iu':
+        for dtype in (np.int8, np.int16, np.int32):
+            info = np.iinfo(dtype)
+            if arr.size == 0 or (arr.min() >= info.min and arr.max() <= info.max):
+                return arr.astype(dtype)
+        return arr
+
+    rounded = round_significant(arr, digits)
+    finite = np.isfinite(rounded)
+    if finite.all() and np.array_equal(rounded, np.round(rounded)):
+        as_int = narrow_numeric(rounded.astype(np.int64), digits)
+        if as_int.dtype != np.int64:
+            return as_int
+
+    # float32 keeps ~7 significant digits; use it when that covers the rounding
+    single = rounded.astype(np.float32)
+    tolerance = 0.5 * 10.0 ** (1 - digits)
+    with np.errstate(invalid='ignore', over='ignore'):
+        error = np.abs(single.astype(np.float64) - rounded)
+    if np.all(error[finite] <= tolerance * np.abs(rounded[finite])) and np.isfinite(single[finite]).all():
+        return single
+    return rounded
+
+
+def _as_numeric(values):
+    try:
+        arr = np.asarray(values)
+        # Integer arrays (point ids) stay exact; rounding is for measurements
+        if arr.dtype.kind in 'iu':
+            return arr
+        arr = np.asarray(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        return None
+    return arr
+
+
+def _split_customdata(trace):
+    # customdata mixes recipe names with numbers; move a single string column
+    # into ``text`` and renumber the hovertemplate references to the rest
+    rows = trace.get('customdata')
+    if not isinstance(rows, list) or not rows or not isinstance(rows[0], list) or 'text' in trace:
+        return
+    columns = list(zip(*rows))
+    string_columns = [i for i, col in enumerate(columns) if any(isinstance(v, str) for v in col)]
+    if len(string_columns) != 1:
+        return
+
+    text_column = string_columns[0]
+    keep = [i for i in range(len(columns)) if i != text_column]
+    renumber = {old: new for new, old in enumerate(keep)}
+
+    def replace(match):
+        index = int(match.group(1))
+        if index == text_column:
+            return '%{text' + match.group(2)
+        return f'%{{customdata[{renumber[index]}]' + match.group(2)
+
+    template = trace.get('hovertemplate')
+    if template is not None:
+        trace['hovertemplate'] = re.sub(r'%\{customdata\[(\d+)\]([^}]*\})', replace, template)
+    trace['text'] = list(columns[text_column])
+    if keep:
+        trace['customdata'] = [list(row) for row in zip(*(columns[i] for i in keep))]
+    else:
+        del trace['customdata']
+
+
+def _format_customdata(trace, digits):
+    # Axis values go through the axis number formatting, but customdata is
+    # printed raw, so float32 noise would show unless we format it back
+    template = trace.get('hovertemplate')
+    if template is not None:
+        trace['hovertemplate'] = re.sub(r'(%\{customdata\[\d+\])\}', rf'\1:.{digits}~g}}', template)
+
+
+def encode_trace(trace, digits=SIGNIFICANT_DIGITS):
+    trace = dict(trace)
+    _split_customdata(trace)
+
+    for key in DATA_ARRAYS:
+        if key not in trace:
+            continue
+        arr = _as_numeric(decode_array(trace[key]))
+        if arr is None or arr.size == 0:
+            continue
+        narrowed = narrow_numeric(arr, digits)
+        if key == 'customdata' and narrowed.dtype == np.float32:
+            _format_customdata(trace, digits)
+        trace[key] = typed_array(narrowed)
+
+    for key in SCALAR_OK:
+        values = trace.get(key)
+        if isinstance(values, list) and values and all(v == values[0] for v in values):
+            trace[key] = values[0]
+    return trace
+
+
+def encode_figure(fig, digits=SIGNIFICANT_DIGITS):
+    if not isinstance(fig, dict):
+        fig = json.loads(to_json_plotly(fig))
+    encoded = dict(fig)
+    encoded['data'] = [encode_trace(trace, digits) for trace in fig.get('data', [])]
+    return encoded
+
+
+def encoded_size(fig):
+    return len(to_json_plotly(fig).encode())
+
+
+def size_report(fig, digits=SIGNIFICANT_DIGITS):
+    plain = encoded_size(fig)
+    compact = encoded_size(encode_figure(fig, digits))
+    return {'plain_bytes': plain, 'encoded_bytes': compact, 'ratio': compact / plain if plain else 1.0}
+
+
+def main():
+    from recipe_data import DATA_PATH, load_recipes
+    from recipe_visualizations import STATIC_FIGURES
+
+    parser = argparse.ArgumentParser(description="Report figure payload sizes before and after compact encoding.")
+    parser.add_argument('--data', default=DATA_PATH, help="recipe CSV to render from")
+    parser.add_argument('--digits', type=int, default=SIGNIFICANT_DIGITS, help="significant digits to keep")
+    args = parser.parse_args()
+
+    df = load_recipes(args.data)
+    print(f"{'figure':<24}{'plain':>12}{'encoded':>12}{'ratio':>8}")
+    for name in ENCODED_FIGURES:
+        report = size_report(STATIC_FIGURES[name](df), args.digits)
+        print(f"{name:<24}{report['plain_bytes']:>12,}{report['encoded_bytes']:>12,}{report['ratio']:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""Serve ``/_dash-layout`` from a body serialized and compressed once.
+
+The layout tree does not change between page loads, yet Dash serializes it
+again for every one.  ``LayoutCache`` asks Dash for it once per layout
+version, keeps the JSON plus gzip and (if the ``brotli`` package is
+installed) brotli copies, and answers with whichever encoding the browser
+accepts.  Each encoding has its own strong ETag (the JSON's hash, suffixed
+with the content coding), so caches never confuse the copies, and a
+returning visitor revalidating with any of them gets a 304 with no body.
+
+A new version is built when ``app.layout`` is replaced.  Layout functions
+are served by Dash as before, since they may differ per request.
+"""
+import gzip
+import hashlib
+
+from flask import Response, request
+
+from locks import ForkSafeLock
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class LayoutPayload:
+    def __init__(self, body):
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        self.bodies = {'identity': body, 'gzip': gzip.compress(body, 9, mtime=0)}
+        if brotli is not None:
+            self.bodies['br'] = brotli.compress(body, quality=11)
+        # A strong validator must differ between content codings
+        self.etags = {name: digest if name == 'identity' else f"{digest}-{name}" for name in self.bodies}
+
+    def encoding(self, accept):
+        # The smallest copy the client accepts
+        offered = sorted(self.bodies, key=lambda name: len(self.bodies[name]))
+        return next((name for name in offered if name == 'identity' or accept[name]), 'identity')
+
+    def response(self):
+        encoding = self.encoding(request.accept_encodings)
+        if any(request.if_none_match.contains(etag) for etag in self.etags.values()):
+            response = Response(status=304)
+        else:
+            response = Response(self.bodies[encoding], mimetype='application/json')
+            if encoding != 'identity':
+                response.headers['Content-Encoding'] = encoding
+        response.set_etag(self.etags[encoding])
+        response.headers['Vary'] = 'Accept-Encoding'
+        # Revalidate every load; the ETag makes that a bodyless 304
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+
+class LayoutCache:
+    def __init__(self, app):
+        self.app = app
+        self._serve = app.serve_layout
+        self._layout = None
+        self._payload = None
+        self._lock = ForkSafeLock()
+
+    def install(self):
+        endpoint = self.app.config.routes_pathname_prefix + '_dash-layout'
+        self.app.server.view_functions[endpoint] = self.serve
+
+    def payload(self):
+        layout = self.app.layout
+        with self._lock:
+            if self._layout is not layout:
+                self._payload = LayoutPayload(self._serve().get_data())
+                self._layout = layout
+            return self._payload
+
+    def serve(self):
+        if self.app._layout_is_function:
+            return self._serve()
+        return self.payload().response()
@@ -0,0 +1,298 @@
+"""Replay realistic dashboard sessions against a local gunicorn server.
+
+Each virtual user loads the page, fires the initial callbacks, then keeps
+switching heat map nutrients, clicking sidebar recipes and switching tabs
+until the run ends.  Requests go to ``/_dash-update-component`` exactly as
+the browser sends them, built from the app's own ``/_dash-dependencies``.
+
+    python loadtest.py --workers 4 --worker-class gthread --threads 8 --concurrency 32
+
+Throughput and p50/p95/p99 latency plus error rates are reported per
+callback, so worker counts and worker classes can be compared on one box.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlparse
+
+# Share of user actions once the page is loaded
+ACTIONS = {'heatmap': 0.4, 'sidebar': 0.4, 'tab': 0.2}
+NUTRIENTS = ['all', 'protein', 'calories', 'fat', 'sugar', 'carbs']
+STATISTICS = ['mean', 'mean', 'median', 'p10', 'p90', 'iqr']
+GROUPINGS = ['Diet_Type', 'Diet_Type', 'Category', 'both']
+# Graphs whose callbacks a tab switch stands in for
+TAB_GRAPHS = ['health-rating-bar', 'time-vs-rating']
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port, workers, worker_class, threads, timeout=180):
+    cmd = [sys.executable, '-m', 'gunicorn', 'app:server',
+           '--bind', f'127.0.0.1:{port}',
+           '--workers', str(workers),
+           '--worker-class', worker_class,
+           '--threads', str(threads),
+           '--timeout', '300',
+           '--log-level', 'warning',
+           '--pythonpath', os.path.dirname(os.path.abspath(__file__))]
+    # Run from the current directory so relative dataset paths resolve as for the app
+    process = subprocess.Popen(cmd)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with code {process.returncode}")
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            # Ready once the data has loaded, not merely once gunicorn binds
+            conn.request('GET', '/readyz')
+            if conn.getresponse().status == 200:
+                return process
+            time.sleep(0.5)
+        except OSError:
+            time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError("gunicorn did not come up in time")
+
+
+def parse_outputs(output):
+    # "..a.figure...b.children.." for multi-output callbacks, "a.figure" otherwise
+    multi = output.startswith('..')
+    specs = []
+    for part in output.strip('.').split('...') if multi else [output]:
+        component, prop = part.rsplit('.', 1)
+        specs.append({'id': json.loads(component) if component.startswith('{') else component,
+                      'property': prop})
+    return specs if multi else specs[0]
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, label, seconds, ok):
+        with self.lock:
+            self.latencies[label].append(seconds)
+            if not ok:
+                self.errors[label] += 1
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return float('nan')
+    rank = max(0, min(len(sorted_values) - 1, int(round(q / 100 * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+
+class VirtualUser:
+    def __init__(self, host, port, dependencies, stats, dataset, rng):
+        self.conn = http.client.HTTPConnection(host, port, timeout=300)
+        self.dependencies = dependencies
+        self.stats = stats
+        self.dataset = dataset
+        self.rng = rng
+        self.session = f'{rng.getrandbits(128):032x}'
+        self.clicks = []
+
+    def request(self, label, method, path, body=None):
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        start = time.perf_counter()
+        try:
+            self.conn.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+            response = self.conn.getresponse()
+            data = response.read()
+            ok = response.status < 400
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            data, ok = b'', False
+        self.stats.record(label, time.perf_counter() - start, ok)
+        return data if ok else None
+
+    def input_value(self, spec):
+        component = spec['id']
+        if isinstance(component, dict):
+            # Wildcard (ALL) inputs carry one entry per matching component
+            if component.get('type') != 'recipe-item':
+                return []
+            return [{'id': {'type': 'recipe-item', 'index': i}, 'property': spec['property'], 'value': clicks}
+                    for i, clicks in enumerate(self.clicks)]
+        value = {
+            'dataset-dropdown': self.dataset,
+            'heatmap-nutrient-dropdown': self.nutrient,
+            'heatmap-statistic-dropdown': self.statistic,
+            'bin-scheme-dropdown': 'dataset',
+            'heatmap-rows-dropdown': 'Time_Category',
+            'heatmap-group-dropdown': self.grouping,
+            'heatmap-scope': [],
+            'session-key': self.session,
+            'url': '',
+        }.get(component)
+        return {'id': component, 'property': spec['property'], 'value': value}
+
+    def fire(self, dependency):
+        inputs = []
+        for spec in dependency['inputs']:
+            component = spec['id']
+            if component.startswith('{'):
+                spec = dict(spec, id=json.loads(component))
+            inputs.append(self.input_value(spec))
+        body = {
+            'output': dependency['output'],
+            'outputs': parse_outputs(dependency['output']),
+            'inputs': inputs,
+            'state': [self.input_value(spec) for spec in dependency.get('state', [])],
+            'changedPropIds': [],
+        }
+        label = dependency['label']
+        data = self.request(label, 'POST', '/_dash-update-component', body)
+        return json.loads(data) if data else None
+
+    def callback_for(self, graph):
+        for dependency in self.dependencies:
+            if graph in dependency['output']:
+                return dependency
+        return None
+
+    def load_page(self):
+        self.nutrient = 'protein'
+        self.statistic = 'mean'
+        self.grouping = 'Diet_Type'
+        self.request('GET /', 'GET', '/')
+        self.request('GET /_dash-layout', 'GET', '/_dash-layout')
+        self.clicks = []
+        for dependency in self.dependencies:
+            if dependency['initial']:
+                result = self.fire(dependency)
+                recipe_list = (result or {}).get('response', {}).get('recipe-list')
+                if recipe_list is not None:
+                    self.clicks = [0] * len(recipe_list.get('children') or [])
+
+    def act(self):
+        action = self.rng.choices(list(ACTIONS), weights=list(ACTIONS.values()))[0]
+        if action == 'heatmap':
+            self.nutrient = self.rng.choice(NUTRIENTS)
+            self.statistic = self.rng.choice(STATISTICS)
+            self.grouping = self.rng.choice(GROUPINGS)
+            dependency = self.callback_for('nutrient-heatmap')
+        elif action == 'sidebar' and self.clicks:
+            self.clicks[self.rng.randrange(len(self.clicks))] += 1
+            dependency = self.callback_for('scatter-plot.figure')
+        else:
+            dependency = self.callback_for(self.rng.choice(TAB_GRAPHS))
+        if dependency is not None:
+            self.fire(dependency)
+
+
+def label_for(output):
+    first = parse_outputs(output)
+    first = first[0] if isinstance(first, list) else first
+    component = first['id']
+    return f"cb {component if isinstance(component, str) else json.dumps(component)}"
+
+
+def run(host, port, concurrency, duration, actions_per_session, dataset, seed):
+    conn = http.client.HTTPConnection(host, port, timeout=60)
+    conn.request('GET', '/_dash-dependencies')
+    dependencies = json.loads(conn.getresponse().read())
+    for dependency in dependencies:
+        dependency['label'] = label_for(dependency['output'])
+        dependency['initial'] = not dependency.get('prevent_initial_call')
+
+    stats = Stats()
+    deadline = time.time() + duration
+
+    def user(index):
+        vu = VirtualUser(host, port, dependencies, stats, dataset, random.Random(seed + index))
+        while time.time() < deadline:
+            vu.load_page()
+            for _ in range(actions_per_session):
+                if time.time() >= deadline:
+                    break
+                vu.act()
+
+    threads = [threading.Thread(target=user, args=(i,), daemon=True) for i in range(concurrency)]
+    started = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return stats, time.time() - started
+
+
+def report(stats, elapsed):
+    rows = []
+    total = sum(len(v) for v in stats.latencies.values())
+    for label in sorted(stats.latencies):
+        values = sorted(stats.latencies[label])
+        rows.append({
+            'name': label,
+            'requests': len(values),
+            'throughput': len(values) / elapsed,
+            'p50_ms': percentile(values, 50) * 1e3,
+            'p95_ms': percentile(values, 95) * 1e3,
+            'p99_ms': percentile(values, 99) * 1e3,
+            'error_rate': stats.errors[label] / len(values),
+        })
+    return {'elapsed_s': elapsed, 'requests': total, 'throughput': total / elapsed, 'callbacks': rows}
+
+
+def print_report(summary):
+    print(f"{'request':<36}{'count':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}")
+    for row in summary['callbacks']:
+        print(f"{row['name'][:35]:<36}{row['requests']:>8}{row['throughput']:>9.1f}"
+              f"{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}{row['p99_ms']:>9.1f}{row['error_rate']:>8.1%}")
+    print(f"\n{summary['requests']} requests in {summary['elapsed_s']:.1f}s: {summary['throughput']:.1f} req/s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the dashboard's Dash callbacks.")
+    parser.add_argument('--url', help="test a running server instead of starting gunicorn")
+    parser.add_argument('--workers', type=int, default=2, help="gunicorn worker processes")
+    parser.add_argument('--worker-class', default='sync', help="gunicorn worker class (sync, gthread, ...)")
+    parser.add_argument('--threads', type=int, default=1, help="threads per gunicorn worker")
+    parser.add_argument('--concurrency', type=int, default=8, help="concurrent virtual users")
+    parser.add_argument('--duration', type=float, default=30, help="seconds to run")
+    parser.add_argument('--actions', type=int, default=20, help="user actions per page load")
+    parser.add_argument('--dataset', default='', help="dataset name to select (default: the server's default)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help="also write the report to this file")
+    args = parser.parse_args(argv)
+
+    process = None
+    if args.url:
+        parsed = urlparse(args.url)
+        host, port = parsed.hostname, parsed.port or 80
+    else:
+        host, port = '127.0.0.1', free_port()
+        process = start_server(port, args.workers, args.worker_class, args.threads)
+    try:
+        stats, elapsed = run(host, port, args.concurrency, args.duration, args.actions, args.dataset, args.seed)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    summary = report(stats, elapsed)
+    summary['config'] = {k: v for k, v in vars(args).items() if k != 'json'}
+    print_report(summary)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summary, f, indent=2)
+    return summary
+
+
+if __name__ == '__main__':
+    main()
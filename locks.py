@@ -0,0 +1,47 @@
+"""Locks for engine state shared by threaded workers.
+
+Gunicorn forks workers from a ``--preload`` master whose warm-up thread may
+be holding a lock at that moment; a plain lock would stay held forever in
+the child.  ``ForkSafeLock`` notices it is in a new process (like the
+per-process connections in ``shared_cache``) and starts over unlocked.
+"""
+import os
+import threading
+
+# Guards the swap to a fresh lock after a fork; itself reset by the hook below
+_guard = threading.Lock()
+
+
+def _reset_guard():
+    global _guard
+    _guard = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_guard)
+
+
+class ForkSafeLock:
+    def __init__(self, reentrant=False):
+        self._factory = threading.RLock if reentrant else threading.Lock
+        self._lock = self._factory()
+        self._pid = os.getpid()
+
+    def _current(self):
+        if self._pid != os.getpid():
+            with _guard:
+                if self._pid != os.getpid():
+                    self._lock, self._pid = self._factory(), os.getpid()
+        return self._lock
+
+    def acquire(self, blocking=True, timeout=-1):
+        return self._current().acquire(blocking, timeout)
+
+    def release(self):
+        self._current().release()
+
+    def __enter__(self):
+        self._current().acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self._current().release()
@@ -0,0 +1,188 @@
+"""Mergeable KLL quantile sketches per (time category, diet type) cell.
+
+A KLL sketch keeps a stack of sorted compactors; level ``h`` holds items of
+weight ``2**h``.  When a level fills up it is sorted and every other item
+(random offset) is promoted to the next level, so the sketch stays at
+O(k log(n/k)) items however many values stream through it.  Two sketches
+merge by concatenating their levels and compacting again, which is what lets
+per-chunk or per-worker sketches be combined.
+
+Error bound: a quantile answered by a sketch with parameter ``k`` has a
+normalized rank error below ``2.296 / k**0.9723`` with 99% confidence, the
+bound published for KLL by Apache DataSketches.  With the default ``k=200``
+the reported median is within about 1.3 percentile points of the true
+median.
+"""
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from aggregates import nutrients
+
+DEFAULT_K = 200
+INGEST_CHUNK_ROWS = 65536
+
+# Heat map statistic -> (label, quantiles it needs)
+STATISTICS = {
+    'mean': ("Average", ()),
+    'median': ("Median", (0.5,)),
+    'p10': ("10th Percentile", (0.1,)),
+    'p90': ("90th Percentile", (0.9,)),
+    'iqr': ("Interquartile Range", (0.25, 0.75)),
+}
+
+
+def rank_error(k=DEFAULT_K):
+    return 2.296 / k ** 0.9723
+
+
+class KLLSketch:
+    def __init__(self, k=DEFAULT_K, seed=0):
+        self.k = k
+        self.n = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(2, int(np.ceil(self.k * (2 / 3) ** depth)))
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if len(values):
+            self.n += len(values)
+            self.min = min(self.min, values.min())
+            self.max = max(self.max, values.max())
+            self.levels[0] = np.concatenate([self.levels[0], values])
+            self._compress()
+        return self
+
+    def merge(self, other):
+        self.n += other.n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        for level, items in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self._compress()
+        return self
+
+    def _compress(self):
+        # Compact the lowest full level until the sketch fits its total capacity
+        while self.size() >= sum(self._capacity(h) for h in range(len(self.levels))):
+            level = next(h for h, items in enumerate(self.levels) if len(items) >= self._capacity(h))
+            if level + 1 == len(self.levels):
+                self.levels.append(np.empty(0))
+            items = np.sort(self.levels[level])
+            # An odd item out stays behind at its current weight
+            even = len(items) - len(items) % 2
+            promoted = items[:even][self._rng.integers(2)::2]
+            self.levels[level] = items[even:]
+            self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+
+    def size(self):
+        return sum(len(items) for items in self.levels)
+
+    def quantiles(self, qs):
+        qs = np.atleast_1d(np.asarray(qs, dtype=np.float64))
+        if self.n == 0:
+            return np.full(len(qs), np.nan)
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level), 2.0 ** h) for h, level in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        items, cumulative = items[order], np.cumsum(weights[order])
+        positions = np.searchsorted(cumulative, qs * cumulative[-1], side='left')
+        result = items[np.minimum(positions, len(items) - 1)]
+        result[qs <= 0] = self.min
+        result[qs >= 1] = self.max
+        return result
+
+    def quantile(self, q):
+        return self.quantiles([q])[0]
+
+
+class CellSketches:
+    def __init__(self, k=DEFAULT_K, index='Time_Category', columns='Diet_Type'):
+        self.k = k
+        self.index = index
+        self.columns = columns
+        self.cells = {}
+
+    def _sketch(self, nutrient, row, col):
+        key = (nutrient, row, col)
+        if key not in self.cells:
+            # Seed from the cell key so rebuilds are reproducible across processes
+            self.cells[key] = KLLSketch(self.k, seed=zlib.crc32(repr(key).encode()))
+        return self.cells[key]
+
+    def ingest(self, df):
+        for (row, col), positions in df.groupby([self.index, self.columns], observed=True).indices.items():
+            for nutrient in nutrients:
+                self._sketch(nutrient, row, col).update(df[nutrient].to_numpy()[positions])
+        return self
+
+    def merge(self, other):
+        for (nutrient, row, col), sketch in other.cells.items():
+            self._sketch(nutrient, row, col).merge(sketch)
+        return self
+
+    @classmethod
+    def from_frame(cls, df, chunk_rows=INGEST_CHUNK_ROWS, **kwargs):
+        sketches = cls(**kwargs)
+        for start in range(0, len(df), chunk_rows):
+            sketches.ingest(df.iloc[start:start + chunk_rows])
+        return sketches
+
+    def _grid(self, nutrient, value):
+        cells = {(row, col): value(sketch) for (nut, row, col), sketch in self.cells.items() if nut == nutrient}
+        rows = sorted({row for row, _ in cells})
+        cols = sorted({col for _, col in cells})
+        grid = pd.DataFrame(np.nan, index=pd.Index(rows, name=self.index), columns=pd.Index(cols, name=self.columns))
+        for (row, col), v in cells.items():
+            grid.loc[row, col] = v
+        return grid
+
+    def quantile_grid(self, nutrient, q):
+        return self._grid(nutrient, lambda sketch: sketch.quantile(q))
+
+    def count_grid(self, nutrient):
+        return self._grid(nutrient, lambda sketch: sketch.n)
+
+    def statistic_grid(self, nutrient, statistic):
+        _, qs = STATISTICS[statistic]
+        if len(qs) == 2:
+            return self._grid(nutrient, lambda sketch: np.subtract(*sketch.quantiles(qs)[::-1]))
+        return self.quantile_grid(nutrient, qs[0])
+
+    def interval_grids(self, nutrient, statistic, z):
+        # Confidence bounds for a sample statistic: each quantile q is bracketed
+        # by the quantiles at ranks q -/+ z * sqrt(q (1 - q) / n)
+        _, qs = STATISTICS[statistic]
+
+        def bounds(sketch):
+            half = z * np.sqrt(np.multiply(qs, np.subtract(1, qs)) / max(sketch.n, 1))
+            low = sketch.quantiles(np.clip(np.subtract(qs, half), 0, 1))
+            high = sketch.quantiles(np.clip(np.add(qs, half), 0, 1))
+            if len(qs) == 2:
+                return high[1] - low[0], low[1] - high[0]
+            return low[0], high[0]
+
+        return (self._grid(nutrient, lambda sketch: min(bounds(sketch))),
+                self._grid(nutrient, lambda sketch: max(bounds(sketch))))
+
+    def summary(self, nutrient):
+        # One row per cell: p10, median, p90 and IQR.  Fixed 'row'/'col' keys,
+        # since the row dimension and the grouping may be the same column
+        rows = []
+        for (nut, row, col), sketch in sorted(self.cells.items(), key=lambda item: item[0][1:]):
+            if nut != nutrient:
+                continue
+            p10, p25, median, p75, p90 = sketch.quantiles([0.1, 0.25, 0.5, 0.75, 0.9])
+            rows.append({'row': row, 'col': col, 'p10': p10, 'median': median,
+                         'p90': p90, 'iqr': p75 - p25, 'count': sketch.n})
+        return rows
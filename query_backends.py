@@ -0,0 +1,258 @@
+"""Interchangeable in-process query engines for the dashboard's aggregates.
+
+Heat map pivots, nutrient correlations, category counts, export filters and
+histograms go through a small interface, implemented on:
+
+* ``pandas`` (default): the frame the dashboard already holds.
+* ``polars``: a Polars copy of the frame.
+* ``duckdb``: embedded DuckDB over a Parquet copy of the frame, written once
+  per data version to ``PARQUET_CACHE_DIR``.
+
+``QUERY_BACKEND`` picks one.  Polars and DuckDB are optional; if the chosen
+one is not installed, the dashboard logs a warning and uses pandas.  Every
+backend returns the same pandas/numpy shapes, so callers do not care which
+one ran the query.  ``python benchmark_backends.py`` compares them.  With
+``RECIPE_STORAGE=sqlite`` datasets answer through ``sqlite_store.SQLiteQuery``
+instead, over their SQLite file.
+"""
+import logging
+import os
+import tempfile
+import threading
+
+import numpy as np
+import pandas as pd
+
+from aggregates import nutrient_pivots
+from exports import filter_rows
+
+QUERY_BACKEND = os.environ.get("QUERY_BACKEND", "pandas")
+PARQUET_CACHE_DIR = os.environ.get(
+    "PARQUET_CACHE_DIR", os.path.join(tempfile.gettempdir(), 'recipe-dashboard-parquet'))
+
+logger = logging.getLogger(__name__)
+
+
+def label_order(column):
+    # Display order of a grouping column, as pivot_table(observed=True) gives it
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return list(column.cat.categories)
+    return sorted(column.dropna().unique())
+
+
+def grids(long, df, index, columns):
+    # Long (index, columns, mean, std, count) rows -> three aligned grids
+    rows = [label for label in label_order(df[index]) if label in set(long[index])]
+    cols = [label for label in label_order(df[columns]) if label in set(long[columns])]
+    result = []
+    for value in ('mean', 'std', 'count'):
+        grid = long.pivot(index=index, columns=columns, values=value).reindex(index=rows, columns=cols)
+        grid.index.name, grid.columns.name = index, columns
+        result.append(grid.astype(np.float64))
+    return tuple(result)
+
+
+def histogram_edges(low, high, bins):
+    if low == high:
+        low, high = low - 0.5, high + 0.5
+    return np.linspace(low, high, bins + 1)
+
+
+class PandasQuery:
+    name = 'pandas'
+
+    def __init__(self, df):
+        self.df = df
+
+    def pivot(self, nutrient, index='Time_Category', columns='Diet_Type'):
+        return nutrient_pivots(self.df, nutrient, index, columns)
+
+    def correlations(self, columns):
+        return self.df[columns].corr()
+
+    def category_counts(self, column='Category'):
+        return self.df[column].value_counts()
+
+    def filter_rows(self, filters=None, calories_min=None, calories_max=None):
+        return filter_rows(self.df, filters, calories_min, calories_max)
+
+    def histogram(self, column, bins=50):
+        values = self.df[column].to_numpy(dtype=np.float64)
+        values = values[~np.isnan(values)]
+        edges = histogram_edges(values.min(), values.max(), bins)
+        return np.histogram(values, edges)[0], edges
+
+    def take(self, rows):
+        # Whole recipes at filter_rows positions, for exports
+        return self.df.iloc[rows]
+
+    def head(self, size):
+        return self.df.head(size)
+
+
+class PolarsQuery(PandasQuery):
+    name = 'polars'
+
+    def __init__(self, df):
+        import polars as pl
+
+        super().__init__(df)
+        self.pl = pl
+        # Grouping columns as plain strings; nutrients stay numeric with NaN as null
+        frame = df.reset_index(drop=True)
+        text = [c for c in frame.columns if not pd.api.types.is_numeric_dtype(frame[c])]
+        self.frame = pl.from_pandas(frame.astype({c: object for c in text}))
+
+    def pivot(self, nutrient, index='Time_Category', columns='Diet_Type'):
+        pl = self.pl
+        value = pl.col(nutrient)
+        long = (self.frame.filter(pl.col(index).is_not_null() & pl.col(columns).is_not_null())
+                .group_by([index, columns])
+                .agg(value.mean().alias('mean'), value.std().alias('std'), value.count().alias('count'))
+                .filter(pl.col('count') > 0)
+                .to_pandas())
+        return grids(long, self.df, index, columns)
+
+    def correlations(self, columns):
+        pl = self.pl
+        # Pairwise-complete Pearson correlations, like DataFrame.corr
+        pairs = [(a, b) for i, a in enumerate(columns) for b in columns[i:]]
+        values = self.frame.select([
+            pl.corr(pl.when(pl.col(b).is_not_null()).then(pl.col(a)),
+                     pl.when(pl.col(a).is_not_null()).then(pl.col(b))).alias(f'{a}|{b}')
+            for a, b in pairs
+        ]).row(0)
+        matrix = pd.DataFrame(np.nan, index=columns, columns=columns)
+        for (a, b), v in zip(pairs, values):
+            matrix.loc[a, b] = matrix.loc[b, a] = v
+        return matrix
+
+    def category_counts(self, column='Category'):
+        counts = self.frame.get_column(column).drop_nulls().value_counts(sort=True)
+        return pd.Series(counts.get_column('count').to_numpy(), index=counts.get_column(column).to_list(),
+                         name='count')
+
+    def filter_rows(self, filters=None, calories_min=None, calories_max=None):
+        pl = self.pl
+        condition = pl.lit(True)
+        for column, values in (filters or {}).items():
+            if values:
+                condition &= pl.col(column).is_in(list(values))
+        if calories_min is not None:
+            condition &= pl.col('calories') >= calories_min
+        if calories_max is not None:
+            condition &= pl.col('calories') <= calories_max
+        rows = self.frame.with_row_index('row').filter(condition).get_column('row')
+        return rows.to_numpy().astype(np.int64)
+
+    def histogram(self, column, bins=50):
+        pl = self.pl
+        values = self.frame.get_column(column).drop_nulls().drop_nans()
+        edges = histogram_edges(values.min(), values.max(), bins)
+        width = edges[1] - edges[0]
+        codes = ((values - edges[0]) / width).floor().cast(pl.Int64).clip(0, bins - 1)
+        return np.bincount(codes.to_numpy(), minlength=bins), edges
+
+
+def parquet_cache(df, key, directory=PARQUET_CACHE_DIR):
+    # One Parquet file per data version; written once, then reused
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{key.replace(':', '-')}.parquet")
+    if not os.path.exists(path):
+        tmp = f"{path}.{os.getpid()}.tmp"
+        df.reset_index(drop=True).to_parquet(tmp, index=False)
+        os.replace(tmp, path)
+    return path
+
+
+class DuckDBQuery(PandasQuery):
+    name = 'duckdb'
+
+    def __init__(self, df, key, directory=PARQUET_CACHE_DIR):
+        import duckdb
+
+        super().__init__(df)
+        self.path = parquet_cache(df, key, directory)
+        self.connection = duckdb.connect()
+        # DDL cannot take parameters; quote the path as a SQL literal
+        literal = self.path.replace("'", "''")
+        self.connection.execute(f"CREATE VIEW recipes AS SELECT * FROM read_parquet('{literal}', file_row_number = true)")
+        self._local = threading.local()
+
+    def _cursor(self):
+        # DuckDB connections are shared; each thread queries through its own cursor
+        cursor = getattr(self._local, 'cursor', None)
+        if cursor is None:
+            cursor = self._local.cursor = self.connection.cursor()
+        return cursor
+
+    def _query(self, sql, params=()):
+        return self._cursor().execute(sql, list(params))
+
+    def pivot(self, nutrient, index='Time_Category', columns='Diet_Type'):
+        long = self._query(
+            f'SELECT "{index}"::VARCHAR AS "{index}", "{columns}"::VARCHAR AS "{columns}", '
+            f'avg("{nutrient}") AS mean, stddev_samp("{nutrient}") AS std, count("{nutrient}") AS count '
+            f'FROM recipes WHERE "{index}" IS NOT NULL AND "{columns}" IS NOT NULL '
+            f'GROUP BY 1, 2 HAVING count("{nutrient}") > 0').df()
+        return grids(long, self.df, index, columns)
+
+    def correlations(self, columns):
+        pairs = [(a, b) for i, a in enumerate(columns) for b in columns[i:]]
+        values = self._query('SELECT ' + ', '.join(f'corr("{a}", "{b}")' for a, b in pairs)
+                             + ' FROM recipes').fetchone()
+        matrix = pd.DataFrame(np.nan, index=columns, columns=columns)
+        for (a, b), v in zip(pairs, values):
+            matrix.loc[a, b] = matrix.loc[b, a] = 1.0 if a == b and v is not None else v
+        return matrix
+
+    def category_counts(self, column='Category'):
+        counts = self._query(f'SELECT "{column}"::VARCHAR, count(*) FROM recipes WHERE "{column}" IS NOT NULL '
+                             f'GROUP BY 1 ORDER BY 2 DESC').fetchall()
+        return pd.Series([n for _, n in counts], index=[label for label, _ in counts], name='count')
+
+    def filter_rows(self, filters=None, calories_min=None, calories_max=None):
+        clauses, params = ['TRUE'], []
+        for column, values in (filters or {}).items():
+            if values:
+                clauses.append(f'"{column}"::VARCHAR IN ({", ".join("?" * len(values))})')
+                params += list(values)
+        if calories_min is not None:
+            clauses.append('calories >= ?')
+            params.append(calories_min)
+        if calories_max is not None:
+            clauses.append('calories <= ?')
+            params.append(calories_max)
+        rows = self._query(f'SELECT file_row_number FROM recipes WHERE {" AND ".join(clauses)} '
+                           'ORDER BY 1', params).fetchnumpy()['file_row_number']
+        return np.asarray(rows, dtype=np.int64)
+
+    def histogram(self, column, bins=50):
+        low, high = self._query(f'SELECT min("{column}"), max("{column}") FROM recipes '
+                                f'WHERE NOT isnan("{column}")').fetchone()
+        edges = histogram_edges(low, high, bins)
+        width = edges[1] - edges[0]
+        counts = self._query(
+            f'SELECT least(floor(("{column}" - ?) / ?)::BIGINT, ?) AS bin, count(*) FROM recipes '
+            f'WHERE "{column}" IS NOT NULL AND NOT isnan("{column}") GROUP BY 1',
+            [edges[0], width, bins - 1]).fetchall()
+        result = np.zeros(bins, dtype=np.int64)
+        for b, n in counts:
+            result[b] = n
+        return result, edges
+
+
+BACKENDS = {'pandas': PandasQuery, 'polars': PolarsQuery, 'duckdb': DuckDBQuery}
+
+
+def query_backend(df, key, name=QUERY_BACKEND):
+    # key: data version, names the DuckDB backend's Parquet file
+    if name not in BACKENDS:
+        raise ValueError(f"unsupported QUERY_BACKEND: {name}")
+    try:
+        if name == 'duckdb':
+            return DuckDBQuery(df, key)
+        return BACKENDS[name](df)
+    except ImportError as exc:
+        logger.warning("Query backend %s unavailable (%s); using pandas", name, exc)
+        return PandasQuery(df)
@@ -0,0 +1,89 @@
+"""Percentile ranks of every recipe, overall and within its diet type.
+
+For each nutrient and ``Health_Score`` a recipe's rank is the share of
+recipes with a strictly lower value, in permille, stored as ``uint16``
+(``MISSING`` where the value is missing).  Ranks come from one value sort
+per column, so looking up a clicked recipe is a single row read.  Under
+custom health settings only the looked-up recipe is ranked, by counting the
+in-range recipes below it, instead of re-sorting every column.
+"""
+import numpy as np
+import pandas as pd
+
+from binning import NUTRIENT_LEVELS
+
+RANK_COLUMNS = NUTRIENT_LEVELS + ['Health_Score']
+RANK_GROUP = 'Diet_Type'
+MISSING = np.iinfo(np.uint16).max
+
+
+def _permille(values, by_value, codes, groups):
+    # Share of the recipe's group with a strictly lower value.  by_value is
+    # argsort(values); a stable sort of it by group code orders by (group,
+    # value), and a recipe's count below is where its run of equal values
+    # starts minus where its group starts
+    n = len(values)
+    order = by_value[np.argsort(codes[by_value], kind='stable')] if groups > 1 else by_value
+    value, code = values[order], codes[order]
+    positions = np.arange(n)
+    new_group = np.r_[True, code[1:] != code[:-1]]
+    new_run = new_group | np.r_[True, value[1:] != value[:-1]]
+    below = np.empty(n, dtype=np.int64)
+    below[order] = (np.maximum.accumulate(np.where(new_run, positions, 0))
+                    - np.maximum.accumulate(np.where(new_group, positions, 0)))
+    present = ~np.isnan(values)
+    counts = np.bincount(codes, weights=present, minlength=groups)[codes]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        permille = np.floor(below * 1000 / counts)
+    return np.where(present, permille, MISSING).astype(np.uint16)
+
+
+def permille_ranks(df, columns=RANK_COLUMNS, group=RANK_GROUP):
+    # One uint16 column per rank: '<column>' overall, '<column>_group' within group
+    columns = [column for column in columns if column in df.columns]
+    overall = np.zeros(len(df), dtype=np.int64)
+    if group in df.columns:
+        codes, uniques = pd.factorize(df[group])
+        missing = codes < 0
+        codes = np.where(missing, len(uniques), codes)
+    ranks = {}
+    for column in columns:
+        values = df[column].to_numpy(dtype=np.float64)
+        by_value = np.argsort(values, kind='stable')
+        ranks[column] = _permille(values, by_value, overall, 1)
+        if group in df.columns:
+            permille = _permille(values, by_value, codes, len(uniques) + 1)
+            ranks[f'{column}_group'] = np.where(missing, MISSING, permille).astype(np.uint16)
+    return pd.DataFrame(ranks, index=df.index)
+
+
+def row_ranks(values, row, members, codes=None, uniques=None, group=RANK_GROUP):
+    # One recipe's ranks, as a permille_ranks row, counted among the
+    # ``members`` rows of aligned arrays (values: column -> float array,
+    # codes/uniques: factorized group column).  For settings other than the
+    # precomputed ones, and for recipes outside the frame that is in memory
+    scopes = [('', members)]
+    if codes is not None:
+        code = uniques.get_indexer([row[group]])[0]
+        scopes.append(('_group', members & (codes == code) if code >= 0 else np.zeros_like(members)))
+    ranks = {}
+    for column, column_values in values.items():
+        value = float(row[column]) if pd.notna(row[column]) else np.nan
+        below = column_values < value
+        present = ~np.isnan(column_values)
+        for suffix, scope in scopes:
+            count = np.count_nonzero(scope & present)
+            if np.isnan(value) or not count:
+                ranks[column + suffix] = MISSING
+            else:
+                ranks[column + suffix] = np.uint16(np.count_nonzero(scope & below) * 1000 // count)
+    return pd.Series(ranks, name=row.name)
+
+
+def rank_label(permille):
+    # 'top 5%' for the upper half, 'bottom 20%' for the lower
+    if permille == MISSING:
+        return None
+    if permille >= 500:
+        return f"top {max(1000 - int(permille), 1) / 10:g}%"
+    return f"bottom {(int(permille) + 1) / 10:g}%"
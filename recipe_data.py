@@ -0,0 +1,142 @@
+from collections import OrderedDict
+import os
+
+import numpy as np
+import pandas as pd
+
+from binning import apply_bins, default_scheme, resolve_scheme
+from locks import ForkSafeLock
+
+DATA_PATH = "Dv_Final.csv"
+
+
+def dataset_paths(spec=None):
+    # RECIPE_DATASETS="us=exports/us.csv,eu=exports/eu.csv"; the first is the default
+    spec = spec if spec is not None else os.environ.get("RECIPE_DATASETS", "")
+    paths = OrderedDict()
+    for entry in spec.split(','):
+        if entry.strip():
+            name, _, path = entry.partition('=')
+            paths[name.strip()] = path.strip()
+    return paths or OrderedDict(default=DATA_PATH)
+
+
+DATASETS = dataset_paths()
+DEFAULT_DATASET = next(iter(DATASETS))
+
+# Limit to first 10,000 unique names for sidebar list
+MAX_RECIPES = 10000
+
+# Health_Score = sum(weight * nutrient / calories)
+HEALTH_WEIGHTS = {'protein': 100, 'sugar': -50, 'fat': -30}
+# Healthy: calories <= 'calories' and score >= 'healthy'
+# Unhealthy: calories > 'calories' and score <= 'unhealthy'
+CATEGORY_THRESHOLDS = {'calories': 200, 'healthy': 7, 'unhealthy': 4}
+HEALTH_SCORE_RANGE = (-100, 100)
+
+CATEGORIES = np.array(['Moderate', 'Healthy', 'Unhealthy'], dtype=object)
+
+
+def read_recipes(path=DATA_PATH):
+    df = pd.read_csv(path)
+    df.columns = df.columns.str.strip()
+    df = df[df['calories'] < 2000]
+    # Derive any category columns the CSV does not carry
+    scheme = default_scheme(df)
+    df = apply_bins(df, resolve_scheme(df, scheme))
+    df.attrs['bin_scheme'] = scheme
+    return df
+
+
+def category_codes(calories, scores, thresholds=CATEGORY_THRESHOLDS):
+    # 0 = Moderate, 1 = Healthy, 2 = Unhealthy (indexes into CATEGORIES)
+    low_calorie = calories <= thresholds['calories']
+    healthy = low_calorie & (scores >= thresholds['healthy'])
+    unhealthy = ~low_calorie & (scores <= thresholds['unhealthy'])
+    return healthy.view(np.int8) + 2 * unhealthy.view(np.int8)
+
+
+def settings_key(weights=None, thresholds=None):
+    weights = dict(HEALTH_WEIGHTS, **(weights or {}))
+    thresholds = dict(CATEGORY_THRESHOLDS, **(thresholds or {}))
+    return (tuple(float(weights[n]) for n in HEALTH_WEIGHTS),
+            tuple(float(thresholds[n]) for n in CATEGORY_THRESHOLDS))
+
+
+def settings_from_key(key):
+    weight_values, threshold_values = key
+    return dict(zip(HEALTH_WEIGHTS, weight_values)), dict(zip(CATEGORY_THRESHOLDS, threshold_values))
+
+
+DEFAULT_SETTINGS = settings_key()
+
+
+class HealthScorer:
+    def __init__(self, base, cache_size=4):
+        self.base = base
+        self.calories = base['calories'].to_numpy(dtype=np.float64)
+        # Per-calorie nutrient ratios, one row per recipe, so a score for any
+        # set of weights is a single matrix-vector product over this block
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.ratios = np.ascontiguousarray(
+                base[list(HEALTH_WEIGHTS)].to_numpy(dtype=np.float64) / self.calories[:, None])
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._scorings = OrderedDict()
+        self._lock = ForkSafeLock()
+
+    def scores(self, weights):
+        with np.errstate(invalid='ignore'):
+            return self.ratios @ np.asarray(weights, dtype=np.float64)
+
+    def evaluate(self, weights=None, thresholds=None):
+        # Scores, the in-range mask and category codes for every base row
+        weight_values, threshold_values = settings_key(weights, thresholds)
+        scores = self.scores(weight_values)
+        low, high = HEALTH_SCORE_RANGE
+        keep = (scores > low) & (scores < high)
+        codes = category_codes(self.calories, scores, dict(zip(CATEGORY_THRESHOLDS, threshold_values)))
+        return scores, keep, codes
+
+    def _lru(self, cache, key, compute):
+        with self._lock:
+            if key in cache:
+                cache.move_to_end(key)
+                return cache[key]
+        value = compute()
+        with self._lock:
+            # A concurrent request may have scored the same settings first
+            value = cache.setdefault(key, value)
+            cache.move_to_end(key)
+            if len(cache) > self.cache_size:
+                cache.popitem(last=False)
+        return value
+
+    def scoring(self, weights=None, thresholds=None):
+        # evaluate(), cached per settings; three arrays, no copy of the frame
+        return self._lru(self._scorings, settings_key(weights, thresholds),
+                         lambda: self.evaluate(weights, thresholds))
+
+    def frame(self, weights=None, thresholds=None, rows=None, columns=None):
+        # Scored recipes at base positions ``rows`` (default: all), with only
+        # ``columns`` of the base (default: all); out-of-range rows are dropped
+        scores, keep, codes = self.scoring(weights, thresholds)
+        rows = np.flatnonzero(keep) if rows is None else rows[keep[rows]]
+        base = self.base if columns is None else self.base[list(columns)]
+        df = base.iloc[rows].assign(Health_Score=scores[rows])
+        df['Category'] = CATEGORIES[codes[rows]]
+        return df
+
+    def apply(self, weights=None, thresholds=None):
+        # Every in-range recipe; callers needing only some rows or columns
+        # should use frame() instead of copying the whole base
+        return self._lru(self._cache, settings_key(weights, thresholds),
+                         lambda: self.frame(weights, thresholds))
+
+
+def load_recipes(path=DATA_PATH):
+    return HealthScorer(read_recipes(path)).apply()
+
+
+def sidebar_recipe_names(df):
+    return df['name'].drop_duplicates().head(MAX_RECIPES)
@@ -1 +1,634 @@
- 
\ No newline at end of file
+import pandas as pd
+import numpy as np
+import plotly.express as px
+import plotly.graph_objects as go
+from dash import dash_table, html
+
+from aggregates import nutrient_correlations, nutrient_pivots, nutrients
+from cube import RollupCube
+from locks import ForkSafeLock
+from quantile_sketch import STATISTICS, CellSketches, rank_error
+from ranks import RANK_COLUMNS, rank_label
+from recipe_data import CATEGORY_THRESHOLDS
+
+
+# Heat map row dimensions and column groupings
+DIMENSION_LABELS = {
+    'Time_Category': "Preparation Time",
+    'Diet_Type': "Diet Type",
+    'Category': "Health Category",
+    'Rating_Category': "Rating Category",
+    'both': "Diet Type + Health Category",
+}
+DEFAULT_GROUPING = ('Time_Category', 'Diet_Type')
+# Normal quantile for the 95% intervals of sampled previews
+CONFIDENCE_Z = 1.96
+# Plotly figure construction shares template objects between figures and is
+# not thread-safe; threaded workers build and serialize one figure at a time.
+# Held only around plotly calls: the data behind a figure is computed outside
+FIGURE_LOCK = ForkSafeLock(reentrant=True)
+# Point clouds carry only this id per point (the recipe's row label); the
+# recipe itself is fetched when a point is hovered or clicked
+POINT_ID = 'point_id'
+
+
+def with_point_ids(df):
+    return df.assign(**{POINT_ID: df.index.to_numpy()})
+
+
+def explorer_scatter_figure(df, thresholds=CATEGORY_THRESHOLDS):
+    color_map = {
+        'Moderate': 'red',
+        'Healthy': 'green',
+        'Unhealthy': 'blue'
+    }
+    label_map = {
+        'Moderate': 'Moderate (High)',
+        'Healthy': 'Healthy (Low)',
+        'Unhealthy': 'Unhealthy (Medium)'
+    }
+    order = ['Moderate', 'Healthy', 'Unhealthy']
+
+    fig = px.scatter(
+        with_point_ids(df),
+        x="calories",
+        y="Health_Score",
+        color="Category",
+        color_discrete_map=color_map,
+        custom_data=[POINT_ID],
+        title='',
+        category_orders={'Category': order}
+    )
+
+    # Using responsive layout settings
+    fig.update_layout(
+        autosize=True,
+        margin=dict(l=50, r=50, t=30, b=50),
+        plot_bgcolor='rgba(240,240,240,0.2)',
+        paper_bgcolor='rgba(0,0,0,0)'
+    )
+
+    # One trace per category even when the sample has no points in it, so a
+    # zoomed viewport (app.viewport_patch) has a trace to fill for each
+    present = {trace.legendgroup for trace in fig.data}
+    if fig.data:
+        template = fig.data[0]
+        for cat in order:
+            if cat not in present:
+                trace = template.to_plotly_json()
+                trace.update(name=cat, legendgroup=cat, x=[], y=[], customdata=[],
+                             hovertemplate=trace['hovertemplate'].replace(template.legendgroup, cat),
+                             marker=dict(trace['marker'], color=color_map[cat]))
+                fig.add_trace(trace)
+        fig.data = sorted(fig.data, key=lambda trace: order.index(trace.legendgroup))
+
+    # Make points slightly larger for better visibility
+    fig.update_traces(marker=dict(size=8))
+
+    for trace in fig.data:
+        cat = trace.name
+        if cat in label_map:
+            trace.name = label_map[cat]
+
+    fig.add_vline(x=thresholds['calories'], line_dash="dash", line_color="gray", line_width=3, opacity=0.8)
+    fig.add_hline(y=thresholds['healthy'], line_dash="dash", line_color="green", line_width=3, opacity=0.8)
+    fig.add_hline(y=thresholds['unhealthy'], line_dash="dash", line_color="blue", line_width=3, opacity=0.8)
+
+    return fig
+
+
+def rank_lines(ranks, group):
+    # One line per ranked column: overall rank, then rank within the diet type
+    lines = []
+    for column in RANK_COLUMNS:
+        overall = rank_label(ranks[column]) if column in ranks else None
+        if overall is None:
+            continue
+        line = f"{column.replace('_', ' ').title()}: {overall}"
+        within = rank_label(ranks[f'{column}_group']) if f'{column}_group' in ranks else None
+        if within is not None:
+            line += f" ({within} of {group})"
+        lines.append(line)
+    return lines
+
+
+def recipe_annotation(recipe_row, ranks=None):
+    text = f"<b>{recipe_row['name']}</b><br>Category: {recipe_row['Category']}"
+    if ranks is not None:
+        text += ''.join(f"<br>{line}" for line in rank_lines(ranks, recipe_row.get('Diet_Type')))
+    return dict(
+        x=recipe_row['calories'],
+        y=recipe_row['Health_Score'],
+        text=text,
+        align='left',
+        showarrow=True,
+        arrowhead=2,
+        arrowsize=1,
+        arrowwidth=2,
+        ax=40,
+        ay=-40,
+        bgcolor='white',
+        bordercolor='black',
+        borderwidth=2,
+        font=dict(size=14, color='black')
+    )
+
+
+def selection_overlay(rows):
+    # Every selected recipe in one ringed marker trace on top of the explorer
+    return dict(
+        type='scatter',
+        mode='markers',
+        name=f"Selected ({len(rows)})",
+        x=rows['calories'].to_numpy(),
+        y=rows['Health_Score'].to_numpy(),
+        text=rows['name'].tolist(),
+        marker=dict(size=14, color='rgba(0,0,0,0)', line=dict(width=2, color='black')),
+        hovertemplate="<b>%{text}</b><br>Calories: %{x}<br>Health Score: %{y:.2f}<extra>Selected</extra>"
+    )
+
+
+COMPARISON_COLUMNS = [
+    ('name', "Recipe"), ('Category', "Category"), ('Health_Score', "Health Score"),
+    ('calories', "Calories"), ('protein', "Protein"), ('fat', "Fat"), ('sugar', "Sugar"),
+    ('carbs', "Carbs"), ('rating', "Rating"), ('Diet_Type', "Diet Type")
+]
+
+
+# How the detail panel prints numeric columns (the rest print as they are)
+DETAIL_FORMATS = {
+    'Health_Score': "{:.2f}", 'calories': "{:.1f} kcal", 'protein': "{:.1f} g", 'fat': "{:.1f} g",
+    'sugar': "{:.1f} g", 'carbs': "{:.1f} g", 'rating': "{:g}",
+}
+
+
+def detail_value(column, value):
+    if pd.isna(value):
+        return "n/a"
+    return DETAIL_FORMATS[column].format(float(value)) if column in DETAIL_FORMATS else str(value)
+
+
+def recipe_details(recipe_row, ranks=None):
+    # Detail panel for one hovered or clicked recipe
+    items = [html.Li(f"{label}: {detail_value(column, recipe_row[column])}")
+             for column, label in COMPARISON_COLUMNS[1:] if column in recipe_row]
+    if ranks is not None:
+        items += [html.Li(line) for line in rank_lines(ranks, recipe_row.get('Diet_Type'))]
+    return [html.H4(str(recipe_row['name'])), html.Ul(items)]
+
+
+def comparison_rows(rows):
+    table = rows[[column for column, _ in COMPARISON_COLUMNS]].copy()
+    table['Health_Score'] = table['Health_Score'].round(2)
+    return table.astype({'Category': str, 'Diet_Type': str}).to_dict('records')
+
+
+def time_vs_rating_figure(df):
+    return px.scatter(
+        df,
+        x='minutes',
+        y='rating',
+        opacity=0.4,
+        color_discrete_sequence=['#2ecc71'],
+        title='Preparation Time vs Ratings',
+        labels={'minutes': 'Time (minutes)', 'rating': 'Rating'},
+        height=500
+    ).update_layout(
+        title_font_size=14,
+        xaxis_title_font_size=12,
+        yaxis_title_font_size=12,
+        xaxis_gridcolor='lightgray',
+        yaxis_gridcolor='lightgray',
+        xaxis_title='Time (minutes)',
+        yaxis_title='Rating',
+        plot_bgcolor='white'
+    ).update_traces(
+        marker=dict(size=8)
+    )
+
+
+def steps_vs_rating_figure(df):
+    return px.scatter(
+        df,
+        x='n_steps',
+        y='rating',
+        opacity=0.4,
+        color_discrete_sequence=['#3498db'],
+        title='Number of Steps vs Ratings',
+        labels={'n_steps': 'Number of Steps', 'rating': 'Rating'},
+        height=500
+    ).update_layout(
+        title_font_size=14,
+        xaxis_title_font_size=12,
+        yaxis_title_font_size=12,
+        xaxis_gridcolor='lightgray',
+        yaxis_gridcolor='lightgray',
+        xaxis_title='Number of Steps',
+        yaxis_title='Rating',
+        plot_bgcolor='white'
+    ).update_traces(
+        marker=dict(size=8)
+    )
+
+
+def level_orders(df, *columns):
+    # Binned columns are ordered categoricals; keep their bin order in legends
+    return {column: list(df[column].cat.categories) for column in columns
+            if isinstance(df[column].dtype, pd.CategoricalDtype)}
+
+
+def rating_by_level_figure(df, level_column, level_label, title):
+    return px.histogram(
+        df,
+        x='rating',
+        color=level_column,
+        barmode='group',
+        labels={'rating': 'Rating', level_column: level_label},
+        title=title,
+        color_discrete_sequence=px.colors.qualitative.Set2,
+        category_orders={"rating": sorted(df['rating'].unique()), **level_orders(df, level_column)}
+    ).update_layout(
+        xaxis_title='Rating',
+        yaxis_title='Count',
+        legend_title=level_label,
+        plot_bgcolor='white'
+    )
+
+
+HEALTH_SCORE_RANGES = ['Very Low (-100 to -50)', 'Low (-50 to 0)', 'High (0 to 50)', 'Very High (50 to 100)']
+
+
+def health_rating_bar_figure(df):
+    # Counted before plotting, so the figure holds one bar per group rather
+    # than every recipe's score
+    ranges = pd.cut(df['Health_Score'], bins=[-100, -50, 0, 50, 100], labels=HEALTH_SCORE_RANGES).cat.codes
+    ratings = df['Rating_Category'].astype('category')
+    labels = ratings.cat.categories
+    ratings = ratings.cat.codes
+    present = ((ranges >= 0) & (ratings >= 0)).to_numpy()
+    cells = np.bincount(ranges.to_numpy()[present] * len(labels) + ratings.to_numpy()[present],
+                        minlength=len(HEALTH_SCORE_RANGES) * len(labels))
+    nonzero = np.flatnonzero(cells)
+    counts = pd.DataFrame({
+        'Health_Score_Range': np.asarray(HEALTH_SCORE_RANGES, dtype=object)[nonzero // len(labels)],
+        'Rating_Category': labels.to_numpy()[nonzero % len(labels)],
+        'count': cells[nonzero],
+    })
+    return px.bar(
+        counts,
+        x='Health_Score_Range',
+        y='count',
+        color='Rating_Category',
+        category_orders={'Health_Score_Range': HEALTH_SCORE_RANGES, **level_orders(df, 'Rating_Category')},
+        barmode='group',
+        title='Count of Recipes by Health Score and Rating Category',
+        color_discrete_sequence=px.colors.qualitative.Set2,
+        labels={'Health_Score_Range': 'Health Score Range', 'count': 'Number of Recipes'}
+    ).update_layout(
+        xaxis_title='Health Score Range',
+        yaxis_title='Count of Recipes',
+        legend_title='Rating Category',
+        plot_bgcolor='white',
+        height=600
+    )
+
+
+def health_rating_scatter_figure(df):
+    return px.scatter(
+        with_point_ids(df),
+        x='Health_Score',
+        y='rating',
+        color='Category',
+        color_discrete_map={'Moderate': 'orange', 'Healthy': 'green', 'Unhealthy': 'red'},
+        opacity=0.7,
+        title='Relationship Between Health Score and Rating',
+        labels={'Health_Score': 'Health Score', 'rating': 'Rating'},
+        custom_data=[POINT_ID]
+    ).update_layout(
+        xaxis_title='Health Score',
+        yaxis_title='Rating',
+        legend_title='Health Category',
+        plot_bgcolor='white',
+        height=600
+    )
+
+
+# Figures embedded in the layout, keyed by their dcc.Graph id.  They depend
+# only on the dataset, so they can be rendered ahead of time.
+STATIC_FIGURES = {
+    'time-vs-rating': time_vs_rating_figure,
+    'steps-vs-rating': steps_vs_rating_figure,
+    'protein-rating-bars': lambda df: rating_by_level_figure(
+        df, 'protein_level', 'Protein Level', 'Rating Distribution by Protein Level'),
+    'carbs-rating-bars': lambda df: rating_by_level_figure(
+        df, 'carbs_level', 'Carbs Level', 'Rating Distribution by Carbohydrate Level'),
+    'sugar-rating-bars': lambda df: rating_by_level_figure(
+        df, 'sugar_level', 'Sugar Level', 'Rating Distribution by Sugar Level'),
+    'fat-rating-bars': lambda df: rating_by_level_figure(
+        df, 'fat_level', 'Fat Level', 'Rating Distribution by Fat Level'),
+    'calories-rating-bars': lambda df: rating_by_level_figure(
+        df, 'calories_level', 'Calories Level', 'Rating Distribution by Calories Level'),
+    'health-rating-bar': health_rating_bar_figure,
+    'health-rating-scatter': health_rating_scatter_figure,
+    'scatter-plot': explorer_scatter_figure,
+}
+
+
+def quantile_table(sketches, nutrient):
+    # Per-cell spread served straight from the sketches
+    rows = sketches.summary(nutrient)
+    for row in rows:
+        for key in ('p10', 'median', 'p90', 'iqr'):
+            row[key] = round(float(row[key]), 2)
+    return html.Div([
+        html.H5(f"{nutrient.title()} Distribution per Cell:", style={'marginBottom': '10px'}),
+        dash_table.DataTable(
+            columns=[
+                {'name': DIMENSION_LABELS.get(sketches.index, sketches.index), 'id': 'row'},
+                {'name': DIMENSION_LABELS.get(sketches.columns, sketches.columns), 'id': 'col'},
+                {'name': 'P10', 'id': 'p10'},
+                {'name': 'Median', 'id': 'median'},
+                {'name': 'P90', 'id': 'p90'},
+                {'name': 'IQR', 'id': 'iqr'},
+                {'name': 'Sample Size', 'id': 'count'},
+            ],
+            data=rows,
+            sort_action='native',
+            page_size=12,
+            style_cell={'padding': '4px', 'textAlign': 'left'},
+            style_header={'fontWeight': 'bold'}
+        ),
+        html.P(f"Quantiles are approximate: within \u00b1{rank_error(sketches.k):.1%} in rank (99% confidence).",
+               style={'color': '#7f8c8d', 'fontSize': '12px', 'marginTop': '5px'})
+    ], style={'marginTop': '20px'})
+
+
+def interval_pivots(nutrient, statistic, pivot, std_dev, count, sketches):
+    # 95% bounds per cell when the frame is a uniform sample of the data
+    if statistic == 'mean':
+        half = CONFIDENCE_Z * std_dev.reindex_like(pivot) / np.sqrt(count.reindex_like(pivot))
+        return pivot - half, pivot + half
+    low, high = sketches.interval_grids(nutrient, statistic, CONFIDENCE_Z)
+    return low.reindex_like(pivot), high.reindex_like(pivot)
+
+
+def interval_table(nutrient, pivot, interval, sketches):
+    low, high = interval
+    rows = []
+    for row in pivot.index:
+        for col in pivot.columns:
+            if pivot.loc[row, col] == pivot.loc[row, col]:
+                rows.append({'row': str(row), 'col': str(col), 'estimate': round(float(pivot.loc[row, col]), 2),
+                             'low': round(float(low.loc[row, col]), 2), 'high': round(float(high.loc[row, col]), 2)})
+    return html.Div([
+        html.H5(f"{nutrient.title()} Estimates per Cell (95% confidence):", style={'marginBottom': '10px'}),
+        dash_table.DataTable(
+            columns=[
+                {'name': DIMENSION_LABELS.get(sketches.index, sketches.index), 'id': 'row'},
+                {'name': DIMENSION_LABELS.get(sketches.columns, sketches.columns), 'id': 'col'},
+                {'name': 'Estimate', 'id': 'estimate'},
+                {'name': 'Low', 'id': 'low'},
+                {'name': 'High', 'id': 'high'},
+            ],
+            data=rows,
+            sort_action='native',
+            page_size=12,
+            style_cell={'padding': '4px', 'textAlign': 'left'},
+            style_header={'fontWeight': 'bold'}
+        )
+    ], style={'marginTop': '20px'})
+
+
+def create_stats_panel(df, selected_nutrient, pivot_data, sketches=None, interval=None, total=None, query=None,
+                       correlations=None):
+    # Find highest and lowest values
+    max_val = pivot_data.max().max()
+    min_val = pivot_data.min().min()
+    max_loc = np.where(pivot_data.values == max_val)
+    min_loc = np.where(pivot_data.values == min_val)
+
+    # Calculate correlations
+    if correlations is not None:
+        corr_matrix = correlations
+    else:
+        corr_matrix = query.correlations(nutrients) if query is not None else nutrient_correlations(df)
+    correlations = {}
+    for other_nut in nutrients:
+        if other_nut != selected_nutrient:
+            correlations[other_nut] = corr_matrix.loc[selected_nutrient, other_nut]
+
+    # Sort correlations by absolute value
+    sorted_corr = sorted(correlations.items(), key=lambda x: abs(x[1]), reverse=True)
+
+    return html.Div([
+        html.H4("Statistics and Insights", style={'marginBottom': '15px'}),
+        html.P(f"Preview from a random sample of {len(df):,} of {total:,} recipes; "
+               "exact values replace it when they are ready.",
+               style={'color': '#e67e22'}) if interval is not None else None,
+
+        # Highest and Lowest Values
+        html.Div([
+            html.Div([
+                html.H5("Highest Value:", style={'color': '#2ecc71'}),
+                html.P([
+                    f"{max_val:.2f} ",
+                    html.Span(f"({pivot_data.index[max_loc[0][0]]} - {pivot_data.columns[max_loc[1][0]]})",
+                            style={'color': '#7f8c8d'})
+                ])
+            ], style={'flex': 1}),
+            html.Div([
+                html.H5("Lowest Value:", style={'color': '#e74c3c'}),
+                html.P([
+                    f"{min_val:.2f} ",
+                    html.Span(f"({pivot_data.index[min_loc[0][0]]} - {pivot_data.columns[min_loc[1][0]]})",
+                            style={'color': '#7f8c8d'})
+                ])
+            ], style={'flex': 1}),
+            html.Div([
+                html.H5("Average:", style={'color': '#3498db'}),
+                html.P(f"{pivot_data.mean().mean():.2f}")
+            ], style={'flex': 1})
+        ], style={'display': 'flex', 'marginBottom': '20px', 'gap': '20px'}),
+
+        # Correlations
+        html.Div([
+            html.H5("Nutrient Correlations:", style={'marginBottom': '10px'}),
+            html.Div([
+                html.Div([
+                    html.Div([
+                        html.Strong(f"{nut.title()}: "),
+                        html.Span(f"{corr:.3f}",
+                                style={'color': '#2ecc71' if corr > 0 else '#e74c3c'})
+                    ], style={'marginBottom': '5px'})
+                    for nut, corr in sorted_corr
+                ])
+            ], style={'backgroundColor': '#fff', 'padding': '10px', 'borderRadius': '5px'})
+        ]),
+
+        interval_table(selected_nutrient, pivot_data, interval, sketches) if interval is not None
+        else quantile_table(sketches, selected_nutrient) if sketches is not None else None
+    ])
+
+
+def statistic_pivots(df, nutrient, statistic, sketches, cube=None, query=None):
+    # The mean grid is exact; quantile grids come from the per-cell sketches.
+    # Other groupings than the default are rolled up from the cube
+    if cube is None and query is not None:
+        pivot, std_dev, count = query.pivot(nutrient)
+    elif cube is None:
+        pivot, std_dev, count = nutrient_pivots(df, nutrient)
+    else:
+        pivot, std_dev, count = cube.pivots(nutrient, sketches.index, sketches.columns)
+    if statistic != 'mean':
+        pivot = sketches.statistic_grid(nutrient, statistic).reindex_like(pivot)
+    return pivot, std_dev, count
+
+
+def heatmap_cells(nutrient, pivot, std_dev, count, statistic='mean', k=None, grouping=DEFAULT_GROUPING,
+                  interval=None):
+    # Cell labels and hover details as whole-grid arrays: one customdata stack
+    # of (value, std, count[, low, high]) read by a single hovertemplate
+    values = pivot.to_numpy(dtype=np.float64)
+    text = np.where(np.isnan(values), '', np.char.mod('%.1f', values))
+    layers = [values, std_dev.reindex_like(pivot), count.reindex_like(pivot)]
+    if interval is not None:
+        layers += list(interval)
+    customdata = np.dstack([np.asarray(layer, dtype=np.float64) for layer in layers])
+    label = STATISTICS[statistic][0]
+    note = "" if statistic == 'mean' else f"<br>Approximate: \u00b1{rank_error(k):.1%} rank error"
+    if interval is not None:
+        note = "<br>95% CI: %{customdata[3]:.1f} to %{customdata[4]:.1f} (sampled)"
+    return dict(
+        text=text,
+        customdata=customdata,
+        hovertemplate=(
+            f"{DIMENSION_LABELS[grouping[1]]}: %{{x}}<br>"
+            f"{DIMENSION_LABELS[grouping[0]]}: %{{y}}<br>"
+            f"{label} {nutrient.title()}: %{{customdata[0]:.1f}}<br>"
+            "Std Dev: %{customdata[1]:.2f}<br>"
+            "Sample Size: %{customdata[2]:.0f}"
+            f"{note}"
+            "<extra></extra>"
+        )
+    )
+
+
+def heatmap_figure(df, nutrient, statistic='mean', sketches=None, grouping=DEFAULT_GROUPING, cube=None,
+                   total=None, query=None, correlations=None):
+    # grouping: (row dimension, column grouping); see cube.GROUPINGS.
+    # total: row count of the full data when df is a uniform sample of it.
+    # query: backend for the default grouping's pivots and the correlations.
+    # correlations: a precomputed nutrient correlation matrix, so regrouping
+    # never rescans the rows for it
+    grouping = tuple(grouping)
+    if grouping != DEFAULT_GROUPING:
+        cube = cube if cube is not None else RollupCube.from_frame(df)
+        sketches = cube.cell_sketches(*grouping)
+    else:
+        cube = None
+    if sketches is None:
+        sketches = CellSketches.from_frame(df)
+    label = STATISTICS[statistic][0]
+    by = f"by {DIMENSION_LABELS[grouping[1]]} and {DIMENSION_LABELS[grouping[0]]}"
+    if total is not None:
+        by += " (preview)"
+
+    # Grids, hover data and stats panels first; only building the plotly
+    # figure needs FIGURE_LOCK
+    cells, stats = [], []
+    for nut in (nutrients if nutrient == "all" else [nutrient]):
+        pivot, std_dev, count = statistic_pivots(df, nut, statistic, sketches, cube, query)
+        interval = None
+        if total is not None:
+            interval = interval_pivots(nut, statistic, pivot, std_dev, count, sketches)
+        cells.append((nut, pivot, heatmap_cells(nut, pivot, std_dev, count, statistic, sketches.k, grouping, interval)))
+        stats.append(create_stats_panel(df, nut, pivot, sketches, interval, total, query, correlations))
+
+    if nutrient == "all":
+        # Only the combined view needs subplots; keep it off the import path
+        from plotly.subplots import make_subplots
+
+        n = len(nutrients)
+        cols = 3
+        rows = (n + cols - 1) // cols
+        with FIGURE_LOCK:
+            fig = make_subplots(
+                rows=rows, cols=cols,
+                subplot_titles=[f"{nut.title()}" for nut in nutrients],
+                horizontal_spacing=0.18,
+                vertical_spacing=0.32
+            )
+
+            for i, (nut, pivot, hover) in enumerate(cells):
+                col = i % cols + 1
+                row = i // cols + 1
+
+                if col == 3:
+                    colorbar_x = (col - 0.5) / cols + 0.18
+                else:
+                    colorbar_x = (col - 0.5) / cols + 0.13
+                colorbar_y = 1.0 - (row - 0.5) / rows
+
+                heatmap = go.Heatmap(
+                    z=pivot.values,
+                    x=pivot.columns,
+                    y=pivot.index,
+                    colorscale='RdBu',
+                    colorbar=dict(
+                        title=dict(
+                            text=f"{nut.title()}",
+                            side="right"
+                        ),
+                        x=colorbar_x,
+                        y=colorbar_y,
+                        len=0.5/rows,
+                        thickness=18,
+                        outlinewidth=1
+                    ),
+                    texttemplate="%{text}",
+                    showscale=True,
+                    **hover
+                )
+                fig.add_trace(heatmap, row=row, col=col)
+
+            fig.update_layout(
+                height=370*rows,
+                width=500*cols + 120,
+                title={
+                    'text': f"Nutrient Heat Maps {by}"
+                            + ("" if statistic == 'mean' else f" ({label})"),
+                    'x': 0.5,
+                    'xanchor': 'center'
+                },
+                margin=dict(t=80, l=20, r=20, b=20),
+                dragmode='pan'
+            )
+
+        # Combine all statistics
+        stats_panel = html.Div(stats, style={'display': 'flex', 'flexWrap': 'wrap', 'gap': '20px'})
+        return fig, stats_panel
+
+    else:
+        _, pivot, hover = cells[0]
+        with FIGURE_LOCK:
+            fig = go.Figure(data=go.Heatmap(
+                z=pivot.values,
+                x=pivot.columns,
+                y=pivot.index,
+                colorscale='RdBu',
+                texttemplate="%{text}",
+                **hover
+            ))
+
+            fig.update_layout(
+                height=700,
+                title={
+                    'text': f"{label} {nutrient.title()} {by}",
+                    'x': 0.5,
+                    'xanchor': 'center'
+                },
+                dragmode='pan'
+            )
+
+        # Statistics panel for the single nutrient
+        return fig, stats[0]
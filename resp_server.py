@@ -0,0 +1,163 @@
+"""Small in-memory server speaking the Redis protocol (RESP2).
+
+A stand-in for Redis when sharing the figure cache between machines or
+containers without installing Redis; it implements just the commands
+``shared_cache.RedisCache`` uses plus a few for inspection:
+
+    python resp_server.py --port 6379
+    CACHE_URL=redis://127.0.0.1:6379/0 gunicorn app:server
+
+Keys live in memory only and expire lazily on access.
+"""
+import argparse
+import socketserver
+import threading
+import time
+
+
+class Store:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.items = {}
+
+    def _live(self, key):
+        item = self.items.get(key)
+        if item is not None and item[1] is not None and item[1] <= time.monotonic():
+            del self.items[key]
+            return None
+        return item
+
+    def get(self, key):
+        with self.lock:
+            item = self._live(key)
+            return None if item is None else item[0]
+
+    def set(self, key, value, ttl=None, nx=False, xx=False):
+        with self.lock:
+            exists = self._live(key) is not None
+            if (nx and exists) or (xx and not exists):
+                return False
+            self.items[key] = (value, None if ttl is None else time.monotonic() + ttl)
+            return True
+
+    def delete(self, keys):
+        with self.lock:
+            return sum(self.items.pop(key, None) is not None for key in keys)
+
+    def exists(self, keys):
+        with self.lock:
+            return sum(self._live(key) is not None for key in keys)
+
+    def flush(self):
+        with self.lock:
+            self.items.clear()
+
+    def size(self):
+        with self.lock:
+            return sum(self._live(key) is not None for key in list(self.items))
+
+
+def parse_set(args):
+    # SET key value [NX|XX] [EX seconds|PX milliseconds]
+    options = {'ttl': None, 'nx': False, 'xx': False}
+    words = [arg.upper() for arg in args]
+    i = 0
+    while i < len(words):
+        if words[i] in (b'NX', b'XX'):
+            options[words[i].decode().lower()] = True
+        elif words[i] in (b'EX', b'PX') and i + 1 < len(args):
+            options['ttl'] = int(args[i + 1]) / (1 if words[i] == b'EX' else 1000)
+            i += 1
+        else:
+            raise ValueError("syntax error")
+        i += 1
+    return options
+
+
+class RespHandler(socketserver.StreamRequestHandler):
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b'*'):
+            return line.split()
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def reply(self, value):
+        if value is None:
+            data = b'$-1\r\n'
+        elif isinstance(value, bool):
+            data = b'+OK\r\n' if value else b'$-1\r\n'
+        elif isinstance(value, int):
+            data = b':%d\r\n' % value
+        elif isinstance(value, Exception):
+            data = f'-ERR {value}\r\n'.encode()
+        elif isinstance(value, str):
+            data = f'+{value}\r\n'.encode()
+        else:
+            data = b'$%d\r\n%s\r\n' % (len(value), value)
+        self.wfile.write(data)
+
+    def handle(self):
+        store = self.server.store
+        while True:
+            args = self.read_command()
+            if args is None:
+                return
+            if not args:
+                continue
+            command, args = args[0].upper(), args[1:]
+            try:
+                if command == b'PING':
+                    result = 'PONG'
+                elif command == b'GET':
+                    result = store.get(args[0])
+                elif command == b'SET':
+                    result = store.set(args[0], args[1], **parse_set(args[2:]))
+                elif command == b'DEL':
+                    result = store.delete(args)
+                elif command == b'EXISTS':
+                    result = store.exists(args)
+                elif command == b'DBSIZE':
+                    result = store.size()
+                elif command in (b'FLUSHDB', b'FLUSHALL'):
+                    store.flush()
+                    result = 'OK'
+                elif command in (b'SELECT', b'AUTH'):
+                    result = 'OK'
+                elif command == b'QUIT':
+                    self.reply('OK')
+                    return
+                else:
+                    result = ValueError(f"unknown command '{command.decode(errors='replace')}'")
+            except (IndexError, ValueError) as exc:
+                result = exc if isinstance(exc, ValueError) else ValueError("wrong number of arguments")
+            self.reply(result)
+
+
+class RespServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address):
+        super().__init__(address, RespHandler)
+        self.store = Store()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve an in-memory Redis-protocol cache.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6379)
+    args = parser.parse_args()
+
+    with RespServer((args.host, args.port)) as server:
+        print(f"Listening on {args.host}:{args.port}")
+        server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
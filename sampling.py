@@ -0,0 +1,59 @@
+"""Seeded stratified sampling for the point-cloud charts.
+
+Large exports have too many recipes to plot every one, so the scatter charts
+draw from one shared sample of at most ``FIGURE_POINT_BUDGET`` rows.  The
+sample is stratified by health category and rating category: a quarter of
+the budget is split evenly between the strata so rare ones stay visible, and
+the rest is shared in proportion to stratum size.  The same data, budget and
+seed always give the same sample.  Progressive heat maps use a plain uniform
+sample instead, so their estimates and confidence intervals are unbiased.
+"""
+import os
+
+import numpy as np
+
+POINT_BUDGET = int(os.environ.get("FIGURE_POINT_BUDGET", 20000))
+SAMPLE_SEED = int(os.environ.get("FIGURE_SAMPLE_SEED", 0))
+# Rows in the uniform sample behind progressive (preview) aggregates
+PREVIEW_ROWS = int(os.environ.get("PREVIEW_SAMPLE_ROWS", 20000))
+STRATA = ['Category', 'Rating_Category']
+
+# Charts drawn from the sample instead of every row
+SAMPLED_FIGURES = ('scatter-plot', 'health-rating-scatter', 'time-vs-rating', 'steps-vs-rating')
+
+
+def allocate(sizes, budget):
+    # Even floor for every stratum, then largest-remainder proportional shares
+    sizes = np.asarray(sizes, dtype=np.int64)
+    quotas = np.minimum(sizes, budget // (4 * len(sizes)))
+    spare = sizes - quotas
+    remaining = budget - quotas.sum()
+    if spare.sum() <= remaining:
+        return sizes
+    shares = remaining * spare / spare.sum()
+    extra = np.floor(shares).astype(np.int64)
+    order = np.argsort(-(shares - extra), kind='stable')
+    extra[order[:remaining - extra.sum()]] += 1
+    return quotas + extra
+
+
+def stratified_sample(df, budget=POINT_BUDGET, seed=SAMPLE_SEED, strata=STRATA):
+    # Index labels of the sample, or None when every row fits the budget
+    if budget <= 0 or len(df) <= budget:
+        return None
+    groups = sorted(df.groupby([df[column].astype(str) for column in strata], sort=False).indices.items())
+    quotas = allocate([len(positions) for _, positions in groups], budget)
+    rng = np.random.default_rng(seed)
+    picked = [rng.choice(positions, quota, replace=False) for (_, positions), quota in zip(groups, quotas)]
+    return df.index[np.sort(np.concatenate(picked))]
+
+
+def uniform_sample(df, size=PREVIEW_ROWS, seed=SAMPLE_SEED):
+    # Simple random sample, unbiased for means and quantiles, in row order
+    if len(df) <= size:
+        return df
+    return df.iloc[np.sort(np.random.default_rng(seed).choice(len(df), size, replace=False))]
+
+
+def sampled(df, sample):
+    return df if sample is None else df[df.index.isin(sample)]
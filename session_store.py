@@ -0,0 +1,77 @@
+"""Per-user row subsets kept on the server under a session key.
+
+The browser only holds a random session key (``dcc.Store``); callbacks
+keep selections and derived subsets here as row positions into a dataset's
+base frame.  Row sets are stored in whichever binary form is smaller: a
+packed bitmask over the frame, or zlib-compressed ``uint32`` gaps between
+sorted positions.  Entries live in the shared cache backend, so every worker
+sees them, and expire ``SESSION_TTL`` seconds after their last write.
+If the backend is unreachable, writes are dropped and reads find nothing,
+so callbacks carry on as if the user had no stored rows.
+"""
+import logging
+import os
+import uuid
+import zlib
+
+import numpy as np
+
+from shared_cache import shared_cache
+
+SESSION_TTL = int(os.environ.get("SESSION_TTL", 3600))
+
+logger = logging.getLogger(__name__)
+
+
+def new_session_key():
+    return uuid.uuid4().hex
+
+
+def encode_rows(rows, universe):
+    rows = np.unique(np.asarray(rows, dtype=np.int64))
+    header = np.array([universe], dtype='<u4').tobytes()
+    gaps = zlib.compress(np.diff(rows, prepend=0).astype('<u4').tobytes(), 6)
+    # The packed mask's size is known up front; only build it when it wins
+    if -(-universe // 8) <= len(gaps):
+        mask = np.zeros(universe, dtype=bool)
+        mask[rows] = True
+        return b'M' + header + np.packbits(mask).tobytes()
+    return b'D' + header + gaps
+
+
+def decode_rows(data):
+    kind, universe, body = data[:1], int(np.frombuffer(data[1:5], dtype='<u4')[0]), data[5:]
+    if kind == b'M':
+        return np.flatnonzero(np.unpackbits(np.frombuffer(body, dtype=np.uint8), count=universe))
+    return np.cumsum(np.frombuffer(zlib.decompress(body), dtype='<u4').astype(np.int64))
+
+
+class SessionStore:
+    def __init__(self, backend=shared_cache, ttl=SESSION_TTL):
+        self.backend = backend
+        self.ttl = ttl
+
+    def _key(self, session, scope, name):
+        return f"session:{session}:{scope}:{name}"
+
+    def put_rows(self, session, scope, name, rows, universe):
+        # scope ties the entry to a data version, e.g. the dataset fingerprint
+        key = self._key(session, scope, name)
+        try:
+            self.backend.set(key, encode_rows(rows, universe), self.ttl)
+        except self.backend.errors as exc:
+            logger.warning("Session store unavailable (%s); not saving %s", exc, key)
+
+    def get_rows(self, session, scope, name):
+        if not session:
+            return None
+        key = self._key(session, scope, name)
+        try:
+            data = self.backend.get(key)
+        except self.backend.errors as exc:
+            logger.warning("Session store unavailable (%s); no rows for %s", exc, key)
+            return None
+        return None if data is None else decode_rows(data)
+
+
+sessions = SessionStore()
@@ -0,0 +1,292 @@
+"""Cache shared by every worker, for rendered figures and aggregate bodies.
+
+``CACHE_URL`` picks the backend:
+
+* ``sqlite:///path/to/cache.sqlite`` (default: a file in the temp directory)
+  shares results between the workers of one machine with no extra service.
+* ``redis://host:port/db`` talks RESP to Redis, or to ``resp_server.py``
+  when no Redis is around.
+* ``none://`` turns sharing off; results and sessions stay in each worker's memory.
+
+``get_or_compute`` is single-flight: on a miss, one caller takes a short
+lock on the key and computes while the others wait for its result, so a
+cold key is computed once across the fleet.  Backend errors fall back to
+computing locally (or, after a computation, to not sharing its result);
+errors from the computation itself reach the caller.  Values are JSON,
+compressed with zlib.
+"""
+import json
+import logging
+import os
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+from urllib.parse import urlparse
+
+CACHE_URL = os.environ.get(
+    "CACHE_URL", f"sqlite:///{os.path.join(tempfile.gettempdir(), 'recipe-dashboard-cache.sqlite')}")
+CACHE_TTL = int(os.environ.get("CACHE_TTL", 86400))
+# How long a computing caller may hold a key before others take over
+LOCK_TTL = int(os.environ.get("CACHE_LOCK_TTL", 120))
+POLL_INTERVAL = 0.05
+
+logger = logging.getLogger(__name__)
+
+
+def encode(value):
+    return zlib.compress(json.dumps(value, separators=(',', ':')).encode(), 1)
+
+
+def decode(data):
+    return json.loads(zlib.decompress(data))
+
+
+class CacheBackend:
+    # Subclasses store raw bytes; this class adds the single-flight protocol
+    errors = (OSError,)
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, data, ttl):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def acquire(self, key, token, ttl):
+        raise NotImplementedError
+
+    def release(self, key, token):
+        raise NotImplementedError
+
+    def get_or_compute(self, key, compute, ttl=CACHE_TTL):
+        # Only backend calls are guarded; errors from compute() propagate
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + LOCK_TTL
+        while True:
+            try:
+                data = self.get(key)
+                acquired = data is None and self.acquire(key, token, LOCK_TTL)
+            except self.errors as exc:
+                logger.warning("Shared cache unavailable (%s); computing %s locally", exc, key)
+                return compute()
+            if data is not None:
+                return decode(data)
+            if acquired:
+                try:
+                    value = compute()
+                    # A failed write only costs sharing; the value is still good
+                    self._attempt(self.set, key, encode(value), ttl)
+                finally:
+                    self._attempt(self.release, key, token)
+                return value
+            if time.monotonic() > deadline:
+                return compute()
+            time.sleep(POLL_INTERVAL)
+
+    def _attempt(self, call, key, *args):
+        try:
+            call(key, *args)
+        except self.errors as exc:
+            logger.warning("Shared cache unavailable (%s); %s not shared", exc, key)
+
+
+class MemoryCache(CacheBackend):
+    # This process only; what ``none://`` keeps raw keys such as sessions in
+    def __init__(self):
+        self._items = {}
+        self._lock = threading.Lock()
+
+    def _live(self, key):
+        item = self._items.get(key)
+        if item is not None and item[1] <= time.monotonic():
+            del self._items[key]
+            return None
+        return item
+
+    def get(self, key):
+        with self._lock:
+            item = self._live(key)
+            return None if item is None else item[0]
+
+    def set(self, key, data, ttl):
+        with self._lock:
+            now = time.monotonic()
+            self._items[key] = (data, now + ttl)
+            for stale in [k for k, (_, expires) in self._items.items() if expires <= now]:
+                del self._items[stale]
+
+    def delete(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def acquire(self, key, token, ttl):
+        with self._lock:
+            if self._live(f'lock:{key}') is not None:
+                return False
+            self._items[f'lock:{key}'] = (token, time.monotonic() + ttl)
+            return True
+
+    def release(self, key, token):
+        with self._lock:
+            if self._items.get(f'lock:{key}', (None,))[0] == token:
+                del self._items[f'lock:{key}']
+
+
+class NullCache(MemoryCache):
+    # Results are not shared; each worker already memoizes its own
+    def get_or_compute(self, key, compute, ttl=CACHE_TTL):
+        return compute()
+
+
+class SQLiteCache(CacheBackend):
+    errors = (OSError, sqlite3.Error)
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB, expires REAL)")
+            db.execute("CREATE TABLE IF NOT EXISTS locks (key TEXT PRIMARY KEY, token TEXT, expires REAL)")
+
+    def _connect(self):
+        # sqlite3 connections stay on the thread that opened them
+        db = getattr(self._local, 'db', None)
+        if db is None or getattr(self._local, 'pid', None) != os.getpid():
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            self._local.db, self._local.pid = db, os.getpid()
+        return db
+
+    def get(self, key):
+        row = self._connect().execute(
+            "SELECT value FROM cache WHERE key = ? AND expires > ?", (key, time.time())).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, data, ttl):
+        db = self._connect()
+        now = time.time()
+        db.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?)", (key, data, now + ttl))
+        db.execute("DELETE FROM cache WHERE expires <= ?", (now,))
+
+    def delete(self, key):
+        self._connect().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def acquire(self, key, token, ttl):
+        db = self._connect()
+        now = time.time()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.execute("DELETE FROM locks WHERE key = ? AND expires <= ?", (key, now))
+            taken = db.execute("INSERT OR IGNORE INTO locks VALUES (?, ?, ?)", (key, token, now + ttl)).rowcount
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return taken == 1
+
+    def release(self, key, token):
+        self._connect().execute("DELETE FROM locks WHERE key = ? AND token = ?", (key, token))
+
+
+class RespError(Exception):
+    pass
+
+
+class RespClient:
+    # Minimal RESP2 client: one connection per thread, reconnect on failure
+    def __init__(self, host='127.0.0.1', port=6379, db=0, password=None, timeout=5):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            conn = self._local.conn = (sock, sock.makefile('rb'))
+            self._local.pid = os.getpid()
+            if self.password:
+                self.execute('AUTH', self.password)
+            if self.db:
+                self.execute('SELECT', self.db)
+        return conn
+
+    def execute(self, *args):
+        try:
+            sock, reader = self._connection()
+            parts = [f'*{len(args)}\r\n'.encode()]
+            for arg in args:
+                arg = arg if isinstance(arg, bytes) else str(arg).encode()
+                parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+            sock.sendall(b''.join(parts))
+            return self._read(reader)
+        except OSError:
+            self._local.conn = None
+            raise
+
+    def _read(self, reader):
+        line = reader.readline()
+        if not line:
+            raise ConnectionError("connection closed by server")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b'+':
+            return rest.decode()
+        if kind == b'-':
+            raise RespError(rest.decode())
+        if kind == b':':
+            return int(rest)
+        if kind == b'$':
+            length = int(rest)
+            return None if length < 0 else reader.read(length + 2)[:-2]
+        if kind == b'*':
+            length = int(rest)
+            return None if length < 0 else [self._read(reader) for _ in range(length)]
+        raise RespError(f"unexpected reply {line!r}")
+
+
+class RedisCache(CacheBackend):
+    errors = (OSError, RespError)
+
+    def __init__(self, client):
+        self.client = client
+
+    def get(self, key):
+        return self.client.execute('GET', key)
+
+    def set(self, key, data, ttl):
+        self.client.execute('SET', key, data, 'EX', ttl)
+
+    def delete(self, key):
+        self.client.execute('DEL', key)
+
+    def acquire(self, key, token, ttl):
+        return self.client.execute('SET', f'lock:{key}', token, 'NX', 'EX', ttl) is not None
+
+    def release(self, key, token):
+        # Check-then-delete; the lock TTL covers the gap if it expired meanwhile
+        if self.client.execute('GET', f'lock:{key}') == token.encode():
+            self.client.execute('DEL', f'lock:{key}')
+
+
+def cache_from_url(url=CACHE_URL):
+    parsed = urlparse(url)
+    if parsed.scheme == 'sqlite':
+        return SQLiteCache(parsed.path)
+    if parsed.scheme == 'redis':
+        db = int(parsed.path.lstrip('/') or 0)
+        return RedisCache(RespClient(parsed.hostname or '127.0.0.1', parsed.port or 6379, db, parsed.password))
+    if parsed.scheme in ('', 'none'):
+        return NullCache()
+    raise ValueError(f"unsupported CACHE_URL scheme: {parsed.scheme}")
+
+
+shared_cache = cache_from_url()
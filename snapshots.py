@@ -0,0 +1,245 @@
+"""Build-time figure snapshots.
+
+Every figure that depends only on the dataset is rendered once by
+``python snapshots.py`` and written as plotly JSON next to a manifest
+stamped with the dataset fingerprint, one directory per named dataset.  Workers load the artifacts on boot
+when the fingerprint matches and render (then memoize) anything missing.
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+
+import plotly
+from plotly.io.json import to_json_plotly
+
+from aggregates import nutrient_correlations
+from binning import BIN_SCHEMES
+from cube import RollupCube
+from figure_encoding import ENCODED_FIGURES, SIGNIFICANT_DIGITS, encode_figure
+from locks import ForkSafeLock
+from quantile_sketch import STATISTICS, CellSketches
+from query_backends import query_backend
+from recipe_data import DATA_PATH, DATASETS, load_recipes
+from recipe_visualizations import DEFAULT_GROUPING, FIGURE_LOCK, STATIC_FIGURES, heatmap_figure, nutrients
+from sampling import POINT_BUDGET, SAMPLE_SEED, SAMPLED_FIGURES, sampled, stratified_sample, uniform_sample
+from shared_cache import decode, shared_cache
+
+SNAPSHOT_DIR = os.environ.get("FIGURE_SNAPSHOT_DIR", "figure_snapshots")
+# Frames this large answer a cold heat map from a sample first (0 disables)
+PROGRESSIVE_ROWS = int(os.environ.get("PROGRESSIVE_MIN_ROWS", 250000))
+MANIFEST = "manifest.json"
+
+# Bump when a figure builder changes so stale artifacts are ignored
+SNAPSHOT_VERSION = 11
+
+HEATMAP_VARIANTS = ['all'] + nutrients
+SNAPSHOT_NAMES = list(STATIC_FIGURES) + [f'heatmap-{v}' for v in HEATMAP_VARIANTS]
+
+
+def dataset_fingerprint(path=DATA_PATH):
+    digest = hashlib.sha256()
+    digest.update(f"v{SNAPSHOT_VERSION}|plotly {plotly.__version__}|sample {POINT_BUDGET}/{SAMPLE_SEED}|".encode())
+    digest.update(f"digits {SIGNIFICANT_DIGITS}|".encode())
+    digest.update(f"bins {os.environ.get('BIN_SCHEME', '')} {json.dumps(BIN_SCHEMES, sort_keys=True)}|".encode())
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def serialize_output(name, output):
+    # Round-trip through JSON so computed and loaded snapshots look the same
+    output = json.loads(to_json_plotly(output))
+    if name in ENCODED_FIGURES:
+        output = encode_figure(output)
+    return output
+
+
+def heatmap_name(nutrient, statistic='mean', grouping=DEFAULT_GROUPING):
+    # Default mean heat maps are snapshotted; other variants render on first use
+    if tuple(grouping) != DEFAULT_GROUPING:
+        return f'heatmap-{nutrient}-{statistic}-by-{grouping[0]}-{grouping[1]}'
+    return f'heatmap-{nutrient}' if statistic == 'mean' else f'heatmap-{nutrient}-{statistic}'
+
+
+def parse_heatmap_name(name):
+    # heatmap-<nutrient>[-<statistic>][-by-<rows>-<grouping>]
+    parts = name[len('heatmap-'):].split('-')
+    grouping = DEFAULT_GROUPING
+    if 'by' in parts:
+        at = parts.index('by')
+        parts, grouping = parts[:at], tuple(parts[at + 1:at + 3])
+    statistic = parts[1] if len(parts) > 1 and parts[1] in STATISTICS else 'mean'
+    return parts[0], statistic, grouping
+
+
+def render_snapshot(df, name, sketches=None, sample=None, cube=None, total=None, query=None, correlations=None):
+    # Heat map data (pivots, rollups, sketches, correlations) and the chart
+    # sample are computed outside FIGURE_LOCK, which heatmap_figure takes
+    # only to build its figure
+    if name.startswith('heatmap-'):
+        nutrient, statistic, grouping = parse_heatmap_name(name)
+        output = heatmap_figure(df, nutrient, statistic, sketches, grouping, cube, total, query, correlations)
+        with FIGURE_LOCK:
+            return serialize_output(name, output)
+    if name in SAMPLED_FIGURES:
+        df = sampled(df, sample)
+    with FIGURE_LOCK:
+        return serialize_output(name, STATIC_FIGURES[name](df))
+
+
+def _write_json(path, obj):
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(obj, f, separators=(',', ':'))
+    os.replace(tmp, path)
+
+
+def write_snapshots(df, fingerprint, directory=SNAPSHOT_DIR):
+    os.makedirs(directory, exist_ok=True)
+    sketches = CellSketches.from_frame(df)
+    sample = stratified_sample(df)
+    for name in SNAPSHOT_NAMES:
+        _write_json(os.path.join(directory, f"{name}.json"), render_snapshot(df, name, sketches, sample))
+    # The manifest goes last so a partial build never looks valid
+    _write_json(os.path.join(directory, MANIFEST),
+                {'fingerprint': fingerprint, 'names': SNAPSHOT_NAMES})
+
+
+def read_snapshots(fingerprint, directory=SNAPSHOT_DIR):
+    try:
+        with open(os.path.join(directory, MANIFEST)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get('fingerprint') != fingerprint:
+        return {}
+
+    loaded = {}
+    for name in manifest.get('names', []):
+        try:
+            with open(os.path.join(directory, f"{name}.json")) as f:
+                loaded[name] = json.load(f)
+        except (OSError, ValueError):
+            continue
+    return loaded
+
+
+class SnapshotStore:
+    def __init__(self, df, fingerprint, directory=SNAPSHOT_DIR, sample=None, query=None):
+        # directory=None renders everything on demand; query: a ready query backend
+        self.df = df
+        self.fingerprint = fingerprint
+        self.snapshots = read_snapshots(fingerprint, directory) if directory is not None else {}
+        self.loaded = set(self.snapshots)
+        self._sketches = None
+        self._cube = None
+        self._query = query
+        self._correlations = None
+        self._previews = {}
+        self._refining = set()
+        self._lock = ForkSafeLock()
+        self._build_locks = {attr: ForkSafeLock() for attr in ('_sketches', '_cube', '_query', '_correlations')}
+        # Shared by every sampled chart, including re-scored variants
+        self.sample = sample if sample is not None else stratified_sample(df)
+
+    def _built(self, attr, build):
+        # Built once even when several request threads ask at the same time
+        if getattr(self, attr) is None:
+            with self._build_locks[attr]:
+                if getattr(self, attr) is None:
+                    setattr(self, attr, build())
+        return getattr(self, attr)
+
+    @property
+    def sketches(self):
+        # Built on the first heat map that is not served from disk
+        return self._built('_sketches', lambda: CellSketches.from_frame(self.df))
+
+    @property
+    def cube(self):
+        # Built on the first heat map with a non-default grouping
+        return self._built('_cube', lambda: RollupCube.from_frame(self.df))
+
+    @property
+    def query(self):
+        return self._built('_query', lambda: query_backend(self.df, self.fingerprint))
+
+    @property
+    def correlations(self):
+        # Independent of grouping and bins: one scan per store, through the
+        # query backend if one is already built (the SQLite one sees every row)
+        return self._built('_correlations', lambda: (
+            self._query.correlations(nutrients) if self._query is not None else nutrient_correlations(self.df)))
+
+    def render(self, name):
+        if not name.startswith('heatmap-'):
+            return render_snapshot(self.df, name, sample=self.sample)
+        if parse_heatmap_name(name)[2] != DEFAULT_GROUPING:
+            return render_snapshot(self.df, name, cube=self.cube, correlations=self.correlations)
+        return render_snapshot(self.df, name, self.sketches, query=self.query, correlations=self.correlations)
+
+    def progressive(self):
+        return 0 < PROGRESSIVE_ROWS <= len(self.df)
+
+    def peek(self, name):
+        # The figure if this or another worker already has it, without rendering
+        if name not in self.snapshots:
+            try:
+                data = shared_cache.get(f"{self.fingerprint}:{name}")
+            except shared_cache.errors:
+                data = None
+            if data is None:
+                return None
+            self.snapshots[name] = decode(data)
+        return self.snapshots[name]
+
+    def preview(self, name):
+        # Heat map from a fixed uniform sample, with confidence intervals
+        if name not in self._previews:
+            self._previews[name] = render_snapshot(uniform_sample(self.df), name, total=len(self.df))
+        return self._previews[name]
+
+    def refine(self, name):
+        # Render the exact figure on a background thread, once per name
+        with self._lock:
+            if name in self._refining:
+                return
+            self._refining.add(name)
+
+        def run():
+            try:
+                self.get(name)
+            finally:
+                with self._lock:
+                    self._refining.discard(name)
+
+        threading.Thread(target=run, name=f'refine-{name}', daemon=True).start()
+
+    def get(self, name):
+        if name not in self.snapshots:
+            # Another worker may already have rendered it
+            self.snapshots[name] = shared_cache.get_or_compute(
+                f"{self.fingerprint}:{name}", lambda: self.render(name))
+        return self.snapshots[name]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render deterministic dashboard figures to JSON.")
+    parser.add_argument('--dataset', action='append', choices=list(DATASETS),
+                        help="dataset to render (repeatable, default: all configured datasets)")
+    parser.add_argument('--out', default=SNAPSHOT_DIR, help="directory to write the snapshots to")
+    args = parser.parse_args()
+
+    for name in args.dataset or DATASETS:
+        path = DATASETS[name]
+        fingerprint = dataset_fingerprint(path)
+        directory = os.path.join(args.out, name)
+        write_snapshots(load_recipes(path), fingerprint, directory)
+        print(f"Wrote {len(SNAPSHOT_NAMES)} snapshots to {directory} (fingerprint {fingerprint[:12]})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+"""Uniform grid index over a 2-D point cloud, for viewport queries.
+
+Points are bucketed into a ``bins x bins`` grid and stored sorted by cell, so
+each grid row of a viewport is one contiguous slice.  Every point also gets a
+seeded random priority; a query over budget keeps the lowest priorities, so
+zooming in only ever adds points to what was already on screen.
+"""
+import numpy as np
+
+GRID_BINS = 256
+
+
+class GridIndex:
+    def __init__(self, x, y, bins=GRID_BINS, seed=0):
+        self.x = np.asarray(x, dtype=np.float64)
+        self.y = np.asarray(y, dtype=np.float64)
+        self.bins = bins
+        self.x_edges = np.linspace(self.x.min(), self.x.max(), bins + 1)
+        self.y_edges = np.linspace(self.y.min(), self.y.max(), bins + 1)
+        cells = self._bin(self.y, self.y_edges) * bins + self._bin(self.x, self.x_edges)
+        self.order = np.argsort(cells, kind='stable')
+        self.starts = np.searchsorted(cells[self.order], np.arange(bins * bins + 1))
+        self.priority = np.random.default_rng(seed).permutation(len(self.x))
+
+    def _bin(self, values, edges):
+        return np.clip(np.searchsorted(edges, values, side='right') - 1, 0, self.bins - 1)
+
+    def query(self, x_range=None, y_range=None, budget=None):
+        # Row positions inside the window, at most ``budget`` of them
+        x0, x1 = sorted(x_range) if x_range is not None else (-np.inf, np.inf)
+        y0, y1 = sorted(y_range) if y_range is not None else (-np.inf, np.inf)
+        ix0, ix1 = self._bin(np.array([x0, x1]), self.x_edges)
+        iy0, iy1 = self._bin(np.array([y0, y1]), self.y_edges)
+        rows = np.arange(iy0, iy1 + 1) * self.bins
+        slices = [self.order[self.starts[r + ix0]:self.starts[r + ix1 + 1]] for r in rows]
+        candidates = np.concatenate(slices) if slices else np.empty(0, dtype=np.int64)
+
+        x, y = self.x[candidates], self.y[candidates]
+        inside = candidates[(x >= x0) & (x <= x1) & (y >= y0) & (y <= y1)]
+        if budget is not None and len(inside) > budget:
+            inside = inside[np.argpartition(self.priority[inside], budget)[:budget]]
+        return np.sort(inside)
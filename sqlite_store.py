@@ -0,0 +1,363 @@
+"""Optional on-disk storage: the cleaned recipe table in an indexed SQLite file.
+
+With ``RECIPE_STORAGE=sqlite`` a dataset is streamed from its CSV into
+``SQLITE_STORE_DIR/<data version>.sqlite`` once, a chunk at a time: cleaned,
+binned with the CSV's default scheme and scored with the default settings,
+with an index on each of ``INDEXED_COLUMNS``.  Quantile bin edges come from
+KLL sketches filled on a first pass, so building never holds the table.
+Every cleaned recipe is stored; the health-score range is applied when
+querying (``in_range``), under whichever settings are active, as in memory.
+
+The dataset then keeps only a uniform sample of ``SQLITE_RESIDENT_ROWS``
+recipes in memory for the charts.  Name lookups, heat map drill-downs, the
+aggregates API and exports run as SQL against the file, and an LRU hot set
+of ``SQLITE_HOT_SET_SIZE`` entries keeps recently read recipes and pages.
+"""
+from collections import OrderedDict
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+
+import numpy as np
+import pandas as pd
+
+from binning import BIN_SCHEMES, apply_bins, default_scheme, resolve_scheme
+from locks import ForkSafeLock
+from quantile_sketch import KLLSketch
+from query_backends import grids, histogram_edges
+from recipe_data import CATEGORIES, DEFAULT_SETTINGS, HEALTH_SCORE_RANGE, HEALTH_WEIGHTS, MAX_RECIPES, HealthScorer
+from sampling import SAMPLE_SEED
+
+STORAGE = os.environ.get("RECIPE_STORAGE", "memory")
+SQLITE_STORE_DIR = os.environ.get(
+    "SQLITE_STORE_DIR", os.path.join(tempfile.gettempdir(), 'recipe-dashboard-sqlite'))
+RESIDENT_ROWS = int(os.environ.get("SQLITE_RESIDENT_ROWS", 100000))
+HOT_SET_SIZE = int(os.environ.get("SQLITE_HOT_SET_SIZE", 1024))
+BUILD_CHUNK_ROWS = 100000
+# Bumped when the table layout or contents change, so old files are rebuilt
+STORE_VERSION = 2
+INDEXED_COLUMNS = ['name', 'Diet_Type', 'Time_Category', 'Category', 'calories', 'Health_Score']
+# Grouping columns whose labels the aggregates need in display order
+LABEL_COLUMNS = ['Time_Category', 'Diet_Type', 'Category', 'Rating_Category']
+# Stay under SQLite's limit on ? parameters per statement
+MAX_PARAMS = 900
+
+
+def read_chunks(path, chunk_rows=BUILD_CHUNK_ROWS):
+    # The CSV a chunk at a time, cleaned like recipe_data.read_recipes
+    for chunk in pd.read_csv(path, chunksize=chunk_rows):
+        chunk.columns = chunk.columns.str.strip()
+        yield chunk[chunk['calories'] < 2000]
+
+
+def in_range(key=DEFAULT_SETTINGS):
+    # SQL condition for recipes HealthScorer keeps under the settings key;
+    # default settings use the stored, indexed score
+    low, high = HEALTH_SCORE_RANGE
+    if key == DEFAULT_SETTINGS:
+        return '"Health_Score" > ? AND "Health_Score" < ?', [low, high]
+    weights, _ = key
+    # Division by zero and missing nutrients give NULL, which no bound holds for
+    score = ' + '.join(f'? * ("{nutrient}" * 1.0 / "calories")' for nutrient in HEALTH_WEIGHTS)
+    return f'({score}) > ? AND ({score}) < ?', [*weights, low, *weights, high]
+
+
+def stream_scheme(path, chunk_rows=BUILD_CHUNK_ROWS):
+    # The CSV's default scheme and its edges, quantiles estimated in one pass
+    header = pd.read_csv(path, nrows=0)
+    header.columns = header.columns.str.strip()
+    scheme = default_scheme(header)
+    sketches = {spec['source']: KLLSketch() for spec in BIN_SCHEMES[scheme].values()
+                if isinstance(spec['edges'], dict)}
+    if sketches:
+        for chunk in read_chunks(path, chunk_rows):
+            for source, sketch in sketches.items():
+                sketch.update(chunk[source].to_numpy(dtype=np.float64))
+    return scheme, resolve_scheme(None, scheme, lambda source, qs: sketches[source].quantiles(qs))
+
+
+def build(csv_path, db_path, chunk_rows=BUILD_CHUNK_ROWS):
+    # Written under a temporary name and moved into place when complete
+    scheme, resolved = stream_scheme(csv_path, chunk_rows)
+    tmp = f"{db_path}.{os.getpid()}.tmp"
+    db = sqlite3.connect(tmp)
+    try:
+        db.execute("PRAGMA journal_mode=OFF")
+        db.execute("PRAGMA synchronous=OFF")
+        rows, categories = 0, {}
+        for chunk in read_chunks(csv_path, chunk_rows):
+            # Every row, with its default score and category for the indexes
+            scorer = HealthScorer(apply_bins(chunk, resolved))
+            scores, _, codes = scorer.scoring()
+            scored = scorer.base.assign(Health_Score=scores, Category=CATEGORIES[codes])
+            for column in scored.columns:
+                if isinstance(scored[column].dtype, pd.CategoricalDtype):
+                    categories[column] = list(scored[column].cat.categories)
+            plain = scored.astype({column: object for column in categories})
+            plain.to_sql('recipes', db, if_exists='append', index=False)
+            rows += len(scored)
+        for column in INDEXED_COLUMNS:
+            db.execute(f'CREATE INDEX "recipes_{column}" ON recipes ("{column}")')
+        db.execute("CREATE TABLE meta (value TEXT)")
+        db.execute("INSERT INTO meta VALUES (?)",
+                   (json.dumps({'rows': rows, 'scheme': scheme, 'categories': categories}),))
+        db.commit()
+    finally:
+        db.close()
+    os.replace(tmp, db_path)
+    return db_path
+
+
+class RecipeDB:
+    def __init__(self, path, hot_set_size=HOT_SET_SIZE):
+        self.path = path
+        self._local = threading.local()
+        meta = json.loads(self._connect().execute("SELECT value FROM meta").fetchone()[0])
+        self.rows = meta['rows']
+        self.scheme = meta['scheme']
+        self.categories = meta['categories']
+        self.hot_set_size = hot_set_size
+        self._hot = OrderedDict()
+        self._hot_lock = ForkSafeLock()
+
+    @classmethod
+    def open(cls, csv_path, key, directory=SQLITE_STORE_DIR):
+        # One file per data version; built on first use, then reused
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{key.replace(':', '-')}-v{STORE_VERSION}.sqlite")
+        if not os.path.exists(path):
+            build(csv_path, path)
+        return cls(path)
+
+    def _connect(self):
+        # sqlite3 connections stay on the thread that opened them
+        db = getattr(self._local, 'db', None)
+        if db is None or getattr(self._local, 'pid', None) != os.getpid():
+            db = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            self._local.db, self._local.pid = db, os.getpid()
+        return db
+
+    def execute(self, sql, params=()):
+        return self._connect().execute(sql, list(params))
+
+    def _hot_get(self, key, compute):
+        with self._hot_lock:
+            if key in self._hot:
+                self._hot.move_to_end(key)
+                return self._hot[key]
+        value = compute()
+        with self._hot_lock:
+            self._hot[key] = value
+            while len(self._hot) > self.hot_set_size:
+                self._hot.popitem(last=False)
+        return value
+
+    def frame(self, where='1', params=(), tail=''):
+        # Matching recipes indexed by table position, categories restored
+        df = pd.read_sql_query(f'SELECT rowid - 1 AS "row", * FROM recipes WHERE {where} {tail}',
+                               self._connect(), params=list(params), index_col='row')
+        df.index.name = None
+        for column, labels in self.categories.items():
+            df[column] = pd.Categorical(df[column], categories=labels, ordered=True)
+        return df
+
+    def take(self, positions):
+        # Recipes at these table positions, in the given order
+        positions = np.asarray(positions, dtype=np.int64)
+        if not len(positions):
+            return self.frame('0')
+        parts = [self.frame(f'rowid IN ({", ".join("?" * len(chunk))})', (chunk + 1).tolist())
+                 for chunk in np.array_split(positions, -(-len(positions) // MAX_PARAMS))]
+        return pd.concat(parts).loc[positions]
+
+    def head(self, size):
+        # The first in-range recipes under the default settings
+        where, params = in_range()
+        return self.frame(where, params + [size], 'ORDER BY rowid LIMIT ?')
+
+    def record(self, position):
+        # One recipe by table position, as a one-row frame (None if out of range)
+        if not 0 <= position < self.rows:
+            return None
+        return self._hot_get(('row', position), lambda: self.take([position]))
+
+    def resident(self, size=RESIDENT_ROWS, seed=SAMPLE_SEED):
+        # Uniform sample of the table, in table order, for in-memory use;
+        # scored and range-filtered there like a CSV-loaded base
+        if self.rows <= size:
+            return self.frame(tail='ORDER BY rowid')
+        return self.take(np.sort(np.random.default_rng(seed).choice(self.rows, size, replace=False)))
+
+    def sidebar_names(self, limit=MAX_RECIPES):
+        # First distinct in-range names in table order, like
+        # recipe_data.sidebar_recipe_names on the default-settings frame
+        names = {}
+        where, params = in_range()
+        for (name,) in self.execute(f'SELECT name FROM recipes WHERE {where} ORDER BY rowid', params):
+            names.setdefault(name, None)
+            if len(names) == limit:
+                break
+        return pd.Series(list(names), name='name')
+
+    def lookup(self, names, key=DEFAULT_SETTINGS):
+        # First recipe per name that is in range under the settings key, in
+        # the given order; hot names skip the query
+        names = list(dict.fromkeys(names))
+        rows = {}
+        with self._hot_lock:
+            for name in names:
+                if ('name', name, key) in self._hot:
+                    self._hot.move_to_end(('name', name, key))
+                    rows[name] = self._hot['name', name, key]
+        cold = [name for name in names if name not in rows]
+        where, params = in_range(key)
+        for start in range(0, len(cold), MAX_PARAMS - len(params)):
+            batch = cold[start:start + MAX_PARAMS - len(params)]
+            found = self.frame(f'rowid IN (SELECT min(rowid) FROM recipes WHERE name IN '
+                               f'({", ".join("?" * len(batch))}) AND {where} GROUP BY name)', batch + params)
+            found = {name: found.iloc[[i]] for i, name in enumerate(found['name'])}
+            for name in batch:
+                # Unknown names are remembered too
+                rows[name] = self._hot_get(('name', name, key), lambda: found.get(name))
+        frames = [rows[name] for name in names if rows[name] is not None]
+        return pd.concat(frames) if frames else self.frame('0')
+
+    def page(self, conditions, offset, size, sort_by=None, descending=False):
+        # conditions: [(sql, params)], all must hold (add in_range() for the
+        # default-settings view).  The number of matching recipes and one page
+        # of them, in table order unless sorted; missing values sort lowest,
+        # like cube.CellRows
+        where = ' AND '.join(f'({sql})' for sql, _ in conditions) or '1'
+        params = [p for _, values in conditions for p in values]
+        direction = 'DESC' if descending else 'ASC'
+        # Ties keep table order in both directions
+        order = f'"{sort_by}" {direction}, rowid' if sort_by else f'rowid {direction}'
+        total = self._hot_get(('count', where, tuple(params)), lambda: self.execute(
+            f'SELECT count(*) FROM recipes WHERE {where}', params).fetchone()[0])
+        recipes = self._hot_get(('page', where, tuple(params), offset, size, order), lambda: self.frame(
+            where, params + [size, offset], f'ORDER BY {order} LIMIT ? OFFSET ?'))
+        return total, recipes
+
+
+def cell_conditions(labels, resolved=None):
+    # SQL conditions for [(column, label)]: equality on stored columns, a
+    # source range for columns binned by another scheme (resolved edges)
+    conditions = []
+    for column, label in labels:
+        if resolved and column in resolved:
+            source, edges, bins = resolved[column]
+            i = list(bins).index(str(label)) if str(label) in bins else None
+            if i is None:
+                conditions.append(('0', []))
+                continue
+            bounds = [(f'"{source}" >= ?', edges[i - 1]) if i > 0 else None,
+                      (f'"{source}" < ?', edges[i]) if i < len(edges) else None]
+            bounds = [b for b in bounds if b] or [(f'"{source}" IS NOT NULL', None)]
+            conditions.append((' AND '.join(sql for sql, _ in bounds),
+                               [value for _, value in bounds if value is not None]))
+        else:
+            conditions.append((f'"{column}" = ?', [str(label)]))
+    return conditions
+
+
+class SQLiteQuery:
+    # The query_backends interface as indexed SQL over a RecipeDB
+    name = 'sqlite'
+
+    def __init__(self, db):
+        self.db = db
+        # The default settings' view of the table, as the memory backends see it
+        self.where, self.params = in_range()
+        # No rows: just every grouping column's labels, in display order
+        labels = {}
+        for column in LABEL_COLUMNS:
+            if column in db.categories:
+                values = db.categories[column]
+            else:
+                values = sorted(v for (v,) in db.execute(
+                    f'SELECT DISTINCT "{column}" FROM recipes WHERE "{column}" IS NOT NULL AND {self.where}',
+                    self.params))
+            labels[column] = pd.Categorical([], categories=values, ordered=True)
+        self.df = pd.DataFrame(labels)
+
+    def pivot(self, nutrient, index='Time_Category', columns='Diet_Type'):
+        long = pd.read_sql_query(
+            f'SELECT "{index}", "{columns}", avg("{nutrient}") AS mean, count("{nutrient}") AS count, '
+            f'sum("{nutrient}" * "{nutrient}") AS squares FROM recipes '
+            f'WHERE "{index}" IS NOT NULL AND "{columns}" IS NOT NULL AND {self.where} '
+            f'GROUP BY 1, 2 HAVING count("{nutrient}") > 0', self.db._connect(), params=self.params)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            variance = (long['squares'] - long['count'] * long['mean'] ** 2) / (long['count'] - 1)
+        long['std'] = np.sqrt(variance.clip(lower=0)).where(long['count'] > 1)
+        return grids(long, self.df, index, columns)
+
+    def correlations(self, columns):
+        # Pairwise-complete Pearson correlations, like DataFrame.corr, from
+        # per-pair sums gathered in one scan
+        pairs = [(a, b) for i, a in enumerate(columns) for b in columns[i + 1:]]
+        counts = self.db.execute('SELECT count(*), ' + ', '.join(f'count("{c}")' for c in columns)
+                                 + f' FROM recipes WHERE {self.where}', self.params).fetchone() if columns else (0,)
+        complete = all(n == counts[0] for n in counts[1:])
+        sums = []
+        for a, b in pairs:
+            a, b = f'"{a}"', f'"{b}"'
+            if complete:
+                sums += ['count(*)', f'sum({a})', f'sum({b})', f'sum({a} * {a})', f'sum({b} * {b})',
+                         f'sum({a} * {b})']
+            else:
+                # "+ 0 * b" nulls a term wherever b is missing
+                sums += [f'count({a} * {b})', f'sum({a} + 0 * {b})', f'sum({b} + 0 * {a})',
+                         f'sum({a} * {a} + 0 * {b})', f'sum({b} * {b} + 0 * {a})', f'sum({a} * {b})']
+        # SQLite evaluates each distinct aggregate once, so repeats are free
+        values = self.db.execute('SELECT ' + ', '.join(sums) + f' FROM recipes WHERE {self.where}',
+                                 self.params).fetchone() if sums else ()
+        matrix = pd.DataFrame(np.eye(len(columns)), index=columns, columns=columns)
+        for i, (a, b) in enumerate(pairs):
+            n, sa, sb, saa, sbb, sab = (float(v or 0) for v in values[6 * i:6 * i + 6])
+            with np.errstate(divide='ignore', invalid='ignore'):
+                r = (n * sab - sa * sb) / np.sqrt((n * saa - sa ** 2) * (n * sbb - sb ** 2))
+            matrix.loc[a, b] = matrix.loc[b, a] = r if n > 1 else np.nan
+        return matrix
+
+    def category_counts(self, column='Category'):
+        counts = self.db.execute(f'SELECT "{column}", count(*) FROM recipes WHERE "{column}" IS NOT NULL '
+                                 f'AND {self.where} GROUP BY 1 ORDER BY 2 DESC', self.params).fetchall()
+        return pd.Series([n for _, n in counts], index=[label for label, _ in counts], name='count')
+
+    def filter_rows(self, filters=None, calories_min=None, calories_max=None):
+        clauses, params = [self.where], list(self.params)
+        for column, values in (filters or {}).items():
+            if values:
+                clauses.append(f'"{column}" IN ({", ".join("?" * len(values))})')
+                params += [str(v) for v in values]
+        if calories_min is not None:
+            clauses.append('calories >= ?')
+            params.append(calories_min)
+        if calories_max is not None:
+            clauses.append('calories <= ?')
+            params.append(calories_max)
+        rows = self.db.execute(f'SELECT rowid - 1 FROM recipes WHERE {" AND ".join(clauses)} ORDER BY rowid',
+                               params)
+        return np.fromiter((row for (row,) in rows), dtype=np.int64)
+
+    def histogram(self, column, bins=50):
+        low, high = self.db.execute(f'SELECT min("{column}"), max("{column}") FROM recipes WHERE {self.where}',
+                                    self.params).fetchone()
+        edges = histogram_edges(low, high, bins)
+        width = edges[1] - edges[0]
+        counts = self.db.execute(
+            f'SELECT min(CAST(("{column}" - ?) / ? AS INTEGER), ?), count(*) FROM recipes '
+            f'WHERE "{column}" IS NOT NULL AND {self.where} GROUP BY 1',
+            [edges[0], width, bins - 1, *self.params]).fetchall()
+        result = np.zeros(bins, dtype=np.int64)
+        for b, n in counts:
+            result[b] = n
+        return result, edges
+
+    def take(self, rows):
+        return self.db.take(rows)
+
+    def head(self, size):
+        return self.db.head(size)
@@ -0,0 +1,106 @@
+"""Liveness / readiness probes and the background warm-up behind them.
+
+The server binds as soon as ``app.py`` is imported; loading the default
+dataset and rendering its first figures happens on a warm-up thread.
+``/healthz`` answers as soon as the process serves requests, ``/readyz``
+only once the warm-up has finished.  Gunicorn workers forked from a
+``--preload`` master restart the warm-up on their first request, since
+threads do not survive a fork.  A failed background warm-up is retried
+with exponential backoff (up to ``WARMUP_RETRY_MAX_SECONDS`` between tries),
+so a transient error such as a dataset being rewritten does not leave the
+worker unready for good; ``/readyz`` reports ``failed`` until a try succeeds.
+"""
+import logging
+import os
+import threading
+import time
+
+from flask import Blueprint, jsonify
+
+BACKGROUND_WARMUP = os.environ.get("BACKGROUND_WARMUP", "1") != "0"
+WARMUP_RETRY_MAX_SECONDS = float(os.environ.get("WARMUP_RETRY_MAX_SECONDS", 60))
+
+logger = logging.getLogger(__name__)
+
+
+class Warmup:
+    def __init__(self, tasks, started):
+        # started: perf_counter() taken before the app's heavy imports
+        self.tasks = tasks
+        self.started = started
+        self.ready = threading.Event()
+        self.error = None
+        self.timings = {}
+        self.attempts = 0
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def run(self, retry=False):
+        # retry: keep trying with backoff instead of raising (background only;
+        # a failing foreground warm-up fails the import, and the worker with it)
+        delay = 1.0
+        while True:
+            try:
+                self._run_tasks()
+                return
+            except Exception as exc:
+                self.error = repr(exc)
+                if not retry:
+                    raise
+                logger.exception("Warm-up attempt %d failed; retrying in %.0fs", self.attempts, delay)
+                time.sleep(delay)
+                delay = min(delay * 2, WARMUP_RETRY_MAX_SECONDS)
+
+    def _run_tasks(self):
+        self.attempts += 1
+        started = time.perf_counter()
+        for name, task in self.tasks:
+            task_started = time.perf_counter()
+            task()
+            self.timings[name] = round(time.perf_counter() - task_started, 3)
+        self.timings['warmup_s'] = round(time.perf_counter() - started, 3)
+        self.timings['ready_s'] = round(time.perf_counter() - self.started, 3)
+        self.error = None
+        self.ready.set()
+        logger.info("Ready in %.2fs (%s)", self.timings['ready_s'],
+                    ', '.join(f"{k} {v}s" for k, v in self.timings.items() if k != 'ready_s'))
+
+    def imported(self):
+        self.timings['import_s'] = round(time.perf_counter() - self.started, 3)
+
+    def start(self, background=BACKGROUND_WARMUP):
+        # Once per process; a forked worker gets its own warm-up
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self.ready.clear()
+            self.error = None
+            self.attempts = 0
+        if background:
+            threading.Thread(target=self.run, kwargs={'retry': True}, name='warmup', daemon=True).start()
+        else:
+            self.run()
+
+    def status(self):
+        state = 'ready' if self.ready.is_set() else 'failed' if self.error else 'loading'
+        return dict(self.timings, status=state, error=self.error, attempts=self.attempts)
+
+
+def create_health(warmup):
+    health = Blueprint('health', __name__)
+
+    @health.before_app_request
+    def ensure_warmup():
+        warmup.start()
+
+    @health.route('/healthz')
+    def healthz():
+        return jsonify(status='ok')
+
+    @health.route('/readyz')
+    def readyz():
+        status = warmup.status()
+        return jsonify(status), 200 if status['status'] == 'ready' else 503
+
+    return health